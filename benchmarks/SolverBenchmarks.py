@@ -0,0 +1,315 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, List, Mapping, Tuple
+
+# Let this run from a checkout without installing rgtk.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from rgtk.BitSet import BitSet
+from rgtk.ColorEntry import ColorEntry
+from rgtk.ColorRemap import ColorRemap
+from rgtk.ColorRemapsIntoStagingPalettesEvaluator import ColorRemapsIntoStagingPalettesEvaluator
+from rgtk.ColorsIntoColorsEvaluator import ColorsIntoColorsEvaluator
+from rgtk.constraint_solver import ConstraintSolver
+from rgtk.IndexedColorArray import IndexedColorArray
+from rgtk.Interval import Interval
+from rgtk.IntervalsToBitSetsEvaluator import IntervalsToBitSetsEvaluator
+from rgtk.Pattern import Pattern
+from rgtk.PatternsIntoPatternHashMapsEvaluator import PatternsIntoPatternHashMapsEvaluator
+from rgtk.RasterPixelsToSpritesEvaluator import RasterPixelsToSpritesEvaluator
+from rgtk.StagingPalette import StagingPalette
+
+##############################################################################
+# SYNTHETIC WORKLOADS
+# Each workload takes a random.Random (so that runs are repeatable) and its
+# size parameters, and returns (sources, destinations, evaluator class).
+# They're built fresh for every run, as solving may change them.
+
+# N 8x8 tiles.  duplicate_ratio of them repeat an earlier tile, and
+# flip_ratio of those repeats are flipped copies.
+def create_tiles_workload(rng: random.Random, num_tiles: int, duplicate_ratio: float, flip_ratio: float) -> Tuple[List[object], List[object], type]:
+    tile_size = 8
+    num_colors = 4
+
+    tile_arrays = []
+    for tile_idx in range(num_tiles):
+        if (tile_idx > 0) and (rng.random() < duplicate_ratio):
+            original = tile_arrays[rng.randrange(len(tile_arrays))]
+            if rng.random() < flip_ratio:
+                # Mirror it left to right.
+                array = []
+                for y in range(tile_size):
+                    row = original[y * tile_size:(y + 1) * tile_size]
+                    array.extend(reversed(row))
+            else:
+                array = list(original)
+        else:
+            array = [rng.randrange(num_colors) for _ in range(tile_size * tile_size)]
+        tile_arrays.append(array)
+
+    intentions = {Pattern.INTENTION_FLIPS_ALLOWED: Pattern.Flip.HORIZ}
+    patterns = []
+    for array in tile_arrays:
+        index_array = IndexedColorArray(width=tile_size, height=tile_size, indexed_array=array)
+        patterns.append(Pattern(index_array=index_array, initial_intentions_map=intentions))
+
+    return (patterns, [{}], PatternsIntoPatternHashMapsEvaluator)
+
+# M color remaps into K 16 color palettes.  Each remap draws a few colors
+# from one of K themes of 16 colors or fewer, so that there is always a
+# solution.
+def create_remaps_workload(rng: random.Random, num_remaps: int, num_palettes: int, colors_per_remap: int, colors_per_theme: int) -> Tuple[List[object], List[object], type]:
+    all_colors = [(r * 85, g * 85, b * 85) for r in range(4) for g in range(4) for b in range(4)]
+    themes = [rng.sample(all_colors, min(colors_per_theme, 16)) for _ in range(num_palettes)]
+
+    color_remaps = []
+    for _ in range(num_remaps):
+        theme = rng.choice(themes)
+        colors = rng.sample(theme, min(colors_per_remap, len(theme)))
+        color_remaps.append(ColorRemap(initial_intentions_map={}, unique_pixel_values_list=colors, color_remap={}))
+
+    staging_palettes = [StagingPalette(16) for _ in range(num_palettes)]
+
+    return (color_remaps, staging_palettes, ColorRemapsIntoStagingPalettesEvaluator)
+
+# N source colors into a palette of D entries, some of which already hold a
+# color.  A few sources ask for a specific slot.
+def create_colors_workload(rng: random.Random, num_sources: int, num_destinations: int) -> Tuple[List[object], List[object], type]:
+    color_pool = [(r * 85, g * 85, b * 85) for r in range(4) for g in range(4) for b in range(4)]
+    rng.shuffle(color_pool)
+
+    sources = []
+    for source_idx in range(num_sources):
+        entry = ColorEntry()
+        entry.intentions.attempt_set_intention(ColorEntry.INTENTION_COLOR, color_pool[source_idx % len(color_pool)])
+        if rng.random() < 0.1:
+            entry.intentions.attempt_set_intention(ColorEntry.INTENTION_SLOT, rng.randrange(num_destinations))
+        sources.append(entry)
+
+    destinations = []
+    for dest_idx in range(num_destinations):
+        entry = ColorEntry()
+        if rng.random() < 0.25:
+            entry.intentions.attempt_set_intention(ColorEntry.INTENTION_COLOR, rng.choice(color_pool))
+        destinations.append(entry)
+
+    return (sources, destinations, ColorsIntoColorsEvaluator)
+
+# Intervals (a mix of fixed and floating, of varying lengths) into VRAM of
+# vram_size tiles.
+def create_intervals_workload(rng: random.Random, num_intervals: int, vram_size: int) -> Tuple[List[object], List[object], type]:
+    # Keep the total under what fits, so that there's a solution to find.
+    max_length = max(1, (vram_size // 2) // max(1, num_intervals))
+
+    intervals = []
+    for _ in range(num_intervals):
+        length = rng.randint(1, max_length)
+        if rng.random() < 0.1:
+            begin = rng.randrange(vram_size - length + 1)
+            intervals.append(Interval.create_fixed_length_at_start_point(begin=begin, length=length))
+        else:
+            begin = rng.randrange(vram_size // 2)
+            end = rng.randrange(begin + length - 1, vram_size)
+            intervals.append(Interval(begin=begin, end=end, length=length))
+
+    return (intervals, [BitSet(vram_size)], IntervalsToBitSetsEvaluator)
+
+# A blobby width x height silhouette, to be covered with 8x8 sprites.
+def create_sprites_workload(rng: random.Random, width: int, height: int) -> Tuple[List[object], List[object], type]:
+    sprite_width = 8
+    sprite_height = 8
+
+    # An ellipse with a ragged edge.
+    center_x = (width - 1) / 2
+    center_y = (height - 1) / 2
+    pixel_list = []
+    pixel_pos_to_pixel_idx = {}
+    for y in range(height):
+        for x in range(width):
+            dx = (x - center_x) / (width / 2)
+            dy = (y - center_y) / (height / 2)
+            if (dx * dx) + (dy * dy) <= 1.0 - (rng.random() * 0.2):
+                pixel_pos_to_pixel_idx[(x, y)] = len(pixel_list)
+                pixel_list.append((x, y))
+
+    # Every sprite position covering at least one pixel, as in the
+    # SpriteTileOptimization example.
+    sprite_positions = []
+    sprite_coverages = []
+    for y_start in range(height):
+        for x_start in range(width):
+            coverage = BitSet(len(pixel_list))
+            for y in range(y_start, y_start + sprite_height):
+                for x in range(x_start, x_start + sprite_width):
+                    pixel_idx = pixel_pos_to_pixel_idx.get((x, y))
+                    if pixel_idx is not None:
+                        coverage.set_bit(pixel_idx)
+            if coverage.get_num_bits_set() > 0:
+                sprite_positions.append((x_start, y_start))
+                sprite_coverages.append(coverage)
+
+    # Each pixel may only start sprites on its own line.
+    pixel_to_sprite_bitsets = [BitSet(len(sprite_positions)) for _ in pixel_list]
+    for sprite_idx, sprite_pos in enumerate(sprite_positions):
+        coverage = sprite_coverages[sprite_idx]
+        pixel_idx = coverage.get_next_set_bit_index(0)
+        while pixel_idx is not None:
+            if pixel_list[pixel_idx][1] == sprite_pos[1]:
+                pixel_to_sprite_bitsets[pixel_idx].set_bit(sprite_idx)
+            pixel_idx = coverage.get_next_set_bit_index(pixel_idx + 1)
+
+    sources = []
+    for pixel_to_sprite_bitset in pixel_to_sprite_bitsets:
+        sources.append(RasterPixelsToSpritesEvaluator.Source(pixel_to_potential_sprites_bitset=pixel_to_sprite_bitset, sprite_pixel_coverages=sprite_coverages))
+
+    return (sources, [BitSet(len(pixel_list))], RasterPixelsToSpritesEvaluator)
+
+# Name -> (workload function, parameter sets).  Sizes grow so that scaling
+# shows up.
+WORKLOADS = {
+      "tiles": (create_tiles_workload, [
+          {"num_tiles": 64, "duplicate_ratio": 0.25, "flip_ratio": 0.5}
+        , {"num_tiles": 256, "duplicate_ratio": 0.25, "flip_ratio": 0.5}
+        , {"num_tiles": 1024, "duplicate_ratio": 0.25, "flip_ratio": 0.5}
+    ])
+    , "remaps": (create_remaps_workload, [
+          {"num_remaps": 16, "num_palettes": 2, "colors_per_remap": 4, "colors_per_theme": 12}
+        , {"num_remaps": 64, "num_palettes": 4, "colors_per_remap": 4, "colors_per_theme": 12}
+        , {"num_remaps": 256, "num_palettes": 4, "colors_per_remap": 4, "colors_per_theme": 12}
+    ])
+    , "colors": (create_colors_workload, [
+          {"num_sources": 8, "num_destinations": 16}
+        , {"num_sources": 16, "num_destinations": 32}
+        , {"num_sources": 32, "num_destinations": 64}
+    ])
+    , "intervals": (create_intervals_workload, [
+          {"num_intervals": 8, "vram_size": 448}
+        , {"num_intervals": 32, "vram_size": 448}
+        , {"num_intervals": 128, "vram_size": 2048}
+    ])
+    , "sprites": (create_sprites_workload, [
+          {"width": 16, "height": 16}
+        , {"width": 32, "height": 24}
+        , {"width": 48, "height": 32}
+    ])
+}
+
+##############################################################################
+# MEASUREMENT
+
+def run_solver(sources: List[object], destinations: List[object], evaluator_class: type, max_solutions: int) -> ConstraintSolver:
+    solver = ConstraintSolver(sources=sources, destinations=destinations, evaluator_class=evaluator_class, debugging=None)
+    while (len(solver.solutions) < max_solutions) and (solver.is_exhausted() == False):
+        solver.update()
+    return solver
+
+# The evaluators keep class-level caches that outlive a solver.  Clear them
+# before every run, so that each run is timed cold rather than reusing the
+# work of the one before.
+def clear_evaluator_caches():
+    ColorRemapsIntoStagingPalettesEvaluator.clear_nested_solve_cache()
+    ColorsIntoColorsEvaluator.clear_compatibility_matrix()
+    IntervalsToBitSetsEvaluator.clear_free_run_list_cache()
+
+def run_benchmark(workload_name: str, create_workload: Callable, params: Mapping[str, object], seed: int, repeat: int, max_solutions: int, measure_memory: bool) -> Mapping[str, object]:
+    # Time without tracemalloc, as it slows everything down.
+    run_seconds = []
+    solver = None
+    for _ in range(repeat):
+        sources, destinations, evaluator_class = create_workload(random.Random(seed), **params)
+        clear_evaluator_caches()
+
+        begin_time = time.perf_counter()
+        solver = run_solver(sources, destinations, evaluator_class, max_solutions)
+        run_seconds.append(time.perf_counter() - begin_time)
+
+    result = {
+          "workload": workload_name
+        , "evaluator": evaluator_class.__name__
+        , "params": params
+        , "seed": seed
+        , "num_sources": len(sources)
+        , "num_destinations": len(destinations)
+        , "seconds": min(run_seconds)
+        , "all_seconds": run_seconds
+        , "num_solutions": len(solver.solutions)
+        , "exhausted": solver.is_exhausted()
+    }
+
+    stats = solver.get_stats()
+    result["stats"] = {
+          "num_nodes_created": stats.num_nodes_created
+        , "num_nodes_expanded": stats.num_nodes_expanded
+        , "num_nodes_failed": stats.num_nodes_failed
+        , "max_queue_length": stats.max_queue_length
+        , "max_depth": stats.max_depth
+        , "num_moves_executed": stats.num_moves_executed
+        , "num_updates": stats.num_updates
+    }
+
+    if measure_memory:
+        sources, destinations, evaluator_class = create_workload(random.Random(seed), **params)
+        clear_evaluator_caches()
+
+        tracemalloc.start()
+        run_solver(sources, destinations, evaluator_class, max_solutions)
+        result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return result
+
+def get_git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks ConstraintSolver with each evaluator on synthetic workloads, and writes the results as JSON.")
+    parser.add_argument("--workload", action="append", choices=sorted(WORKLOADS.keys()), help="Workload to run (may be repeated).  Defaults to all.")
+    parser.add_argument("--size", action="append", type=int, help="Index of the size to run for each workload (may be repeated).  Defaults to all.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per benchmark; the fastest is reported.")
+    parser.add_argument("--max-solutions", type=int, default=1, help="Stop each solve after this many solutions.")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the (slow) peak memory measurement.")
+    parser.add_argument("--output", help="File to write the JSON results to.  Defaults to stdout.")
+    args = parser.parse_args()
+
+    workload_names = args.workload if args.workload is not None else list(WORKLOADS.keys())
+
+    results = []
+    for workload_name in workload_names:
+        create_workload, param_sets = WORKLOADS[workload_name]
+        size_indices = args.size if args.size is not None else range(len(param_sets))
+        for size_idx in size_indices:
+            if size_idx >= len(param_sets):
+                continue
+
+            result = run_benchmark(workload_name, create_workload, param_sets[size_idx], args.seed, args.repeat, args.max_solutions, args.no_memory == False)
+            results.append(result)
+            print(f"{workload_name}[{size_idx}]: {result['seconds']:.3f}s, {result['stats']['num_nodes_expanded']} nodes", file=sys.stderr)
+
+    report = {
+          "git_revision": get_git_revision()
+        , "python_version": platform.python_version()
+        , "platform": platform.platform()
+        , "results": results
+    }
+
+    report_json = json.dumps(report, indent=2)
+    if args.output is None:
+        print(report_json)
+    else:
+        with open(args.output, "w") as output_file:
+            output_file.write(report_json)
+            output_file.write("\n")
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,7 @@ from PIL import Image
 
 from rgtk.ColorEntry import ColorEntry
 from rgtk.ColorRemap import ColorRemap
+from rgtk.ColorRemapSubsumption import ColorRemapSubsumption
 from rgtk.ColorRemapsIntoStagingPalettesEvaluator import ColorRemapsIntoStagingPalettesEvaluator
 from rgtk.constraint_solver import ConstraintSolver
 from rgtk.FinalPalette import FinalPalette
@@ -49,12 +50,33 @@ for start_y in range(0, parent_image.height, pattern_height):
 
 ##############################################################################
 # SOLUTION FOR COLOR REMAPS -> STAGING PALETTES
-remap_to_staging_solver = ConstraintSolver(color_remaps, staging_palettes, ColorRemapsIntoStagingPalettesEvaluator, None)
+
+# Most tiles' colors are a subset of another tile's colors, so only solve
+# for the ones that aren't.
+remap_subsumption = ColorRemapSubsumption(color_remaps)
+maximal_color_remaps = remap_subsumption.get_maximal_remaps()
+
+remap_to_staging_solver = ConstraintSolver(maximal_color_remaps, staging_palettes, ColorRemapsIntoStagingPalettesEvaluator, None)
 while remap_to_staging_solver.is_exhausted() == False:
     remap_to_staging_solver.update()
 
 # TODO find the best one.
-remap_to_staging_solution = remap_to_staging_solver.solutions[0]
+maximal_remap_to_staging_solution = remap_to_staging_solver.solutions[0]
+
+# Bring the subsumed tiles along with the ones that cover them.
+remap_to_staging_solution = remap_subsumption.expand_solution(maximal_remap_to_staging_solution, staging_palettes)
+solution_to_apply = maximal_remap_to_staging_solution
+
+if remap_to_staging_solution is None:
+    # A subsumed tile didn't fit alongside the one covering it, so solve for
+    # every tile instead.
+    print("Subsumed tiles didn't fit; solving for every tile.")
+    remap_to_staging_solver = ConstraintSolver(color_remaps, staging_palettes, ColorRemapsIntoStagingPalettesEvaluator, None)
+    while remap_to_staging_solver.is_exhausted() == False:
+        remap_to_staging_solver.update()
+
+    remap_to_staging_solution = remap_to_staging_solver.solutions[0]
+    solution_to_apply = remap_to_staging_solution
 
 for move in remap_to_staging_solution:
     # Let the corresponding color remap process these moves.
@@ -62,7 +84,7 @@ for move in remap_to_staging_solution:
     source_remap.remap_to_staging_palette(move, staging_palettes)
 
 # Now apply the solution to the staging palettes.
-remap_to_staging_solver.apply_solution(remap_to_staging_solution)
+remap_to_staging_solver.apply_solution(solution_to_apply)
 
 ##############################################################################
 # FINAL PALETTES
@@ -0,0 +1,69 @@
+import os
+
+from PIL import Image
+
+from rgtk.ColorEntry import ColorEntry
+from rgtk.Pattern import Pattern
+from rgtk.PixelArray import PixelArray
+from rgtk.TilePipeline import TilePipeline
+
+# The same conversion as NameTableGeneration.py, done with a TilePipeline.
+
+##############################################################################
+# PIXEL ARRAY
+
+# Track the path relative to this script.
+our_dir = os.path.dirname(__file__)
+
+font_image = Image.open(os.path.join(our_dir, "assets/font.png")).convert("RGB")
+font_pixel_array = PixelArray(font_image, 0, 0, font_image.width, font_image.height)
+font_pixel_array.quantize((8,8,8), (2,2,2))
+
+flags_image = Image.open(os.path.join(our_dir, "assets/flags.png")).convert("RGB")
+flags_pixel_array = PixelArray(flags_image, 0, 0, flags_image.width, flags_image.height)
+flags_pixel_array.quantize((8,8,8), (2,2,2))
+
+##############################################################################
+# ASSETS
+pipeline = TilePipeline(staging_palette_sizes=[16, 16], VRAM_size=448)
+
+# Font comes in as green.  Remap to white.
+white_entry = ColorEntry()
+white_entry.intentions.attempt_set_intention(ColorEntry.INTENTION_COLOR, (255,255,255))
+
+# The font must begin at a specific location.
+font_asset = TilePipeline.Asset("font", font_pixel_array, color_remap={(0,255,0): white_entry}, flips_allowed=Pattern.Flip.HORIZ, VRAM_begin=20, VRAM_fixed=True)
+font_idx = pipeline.add_asset(font_asset)
+
+# Can go anywhere.
+flags_asset = TilePipeline.Asset("flags", flags_pixel_array, flips_allowed=Pattern.Flip.HORIZ)
+flags_idx = pipeline.add_asset(flags_asset)
+
+##############################################################################
+# RUN
+def print_run(title: str):
+    print(title)
+    for stage_name in TilePipeline.STAGES:
+        if stage_name in pipeline.skipped_stages:
+            print(f"  {stage_name}: skipped")
+        else:
+            print(f"  {stage_name}: {pipeline.stage_to_elapsed_seconds[stage_name] * 1000:.2f} ms")
+
+pipeline.run()
+print_run("First run:")
+
+for asset_idx, asset in enumerate(pipeline.assets):
+    result = pipeline.get_result(asset_idx)
+    print(f"{asset.name}: palette {result.staging_palette_index}, {len(result.nametable)} patterns, {len(result.unique_patterns)} unique at VRAM location {result.VRAM_loc}.")
+
+# Nothing changed, so nothing needs doing.
+pipeline.run()
+print_run("Unchanged:")
+
+# Moving the flags only redoes the VRAM placement and the nametables.
+flags_asset.VRAM_begin = 256
+pipeline.run()
+print_run("Flags moved:")
+print(f"flags: now at VRAM location {pipeline.get_result(flags_idx).VRAM_loc}.")
+
+print("Done!")
@@ -0,0 +1,342 @@
+import json
+import multiprocessing
+import os
+from typing import List, Mapping, Optional, Tuple
+from PIL import Image
+from rgtk import Quantize
+from rgtk.ColorEntry import ColorEntry
+from rgtk.NameTableEntry import NameTableEntry
+from rgtk.Pattern import Pattern
+from rgtk.PixelArray import PixelArray
+from rgtk.SolutionCache import SolutionCache
+from rgtk.StagingPalette import StagingPalette
+from rgtk.TilePipeline import TilePipeline
+
+# Converts a whole set of images, described by a JSON manifest, into Sega
+# Master System format pattern, nametable and palette files.  This is what
+# the "rgtk" command runs.
+#
+# Assets in the same group share staging palettes and VRAM, so they're run
+# through one TilePipeline together, in manifest order.  Groups have nothing
+# in common (they're loaded at different times, e.g., different scenes), so
+# they are converted in parallel, one per worker process.  An asset without
+# a group is a group of its own.  Outputs are gathered and written in
+# manifest order, so the files don't depend on which worker finished first.
+#
+# Manifest (paths are relative to the manifest):
+#   {
+#       "output_directory": "build/gfx",                   (optional, see run())
+#       "quantize_bits": [2, 2, 2],                        (optional, bits per channel)
+#       "groups": {                                        (optional)
+#           "title": {"staging_palettes": [16, 16], "VRAM_size": 448}
+#       },
+#       "assets": [
+#           {
+#               "name": "font",
+#               "image": "assets/font.png",
+#               "group": "title",                          (optional)
+#               "rect": [x, y, width, height],             (optional, whole image by default)
+#               "color_remap": {"#00FF00": "#FFFFFF"},     (optional)
+#               "flips": "horiz",                          (optional:  none, horiz, vert or both)
+#               "VRAM_begin": 20, "VRAM_fixed": true       (optional, see TilePipeline.Asset, as are
+#                                                           VRAM_end, VRAM_alignment and VRAM_bank_size)
+#           }
+#       ]
+#   }
+#
+# Outputs, in the output directory:
+#   <asset>.patterns.bin:   the asset's unique patterns, 32 bytes each (4
+#                           bitplanes per row), to be loaded at its VRAM location.
+#   <asset>.nametable.bin:  2 bytes (little endian) per pattern of the image.
+#   <group>.palettes.bin:   16 bytes (--BBGGRR) per staging palette.
+#   conversion.json:        where everything went, for the build to pick up.
+class BatchConverter:
+    class ManifestError(Exception):
+        def __init__(self, message: str):
+            super().__init__(message)
+            self.message = message
+
+    # Thrown when a group can't be converted, or doesn't fit the hardware.
+    # Pass every argument on to Exception, so that this survives the trip
+    # back from a worker process (unpickling calls __init__ with args).
+    class ConversionError(Exception):
+        def __init__(self, group_name: str, message: str):
+            super().__init__(group_name, message)
+            self.group_name = group_name
+            self.message = message
+
+        def __str__(self) -> str:
+            return f"{self.group_name}: {self.message}"
+
+    class Group:
+        def __init__(self, name: str, staging_palette_sizes: List[int], VRAM_size: int):
+            self.name = name
+            self.staging_palette_sizes = staging_palette_sizes
+            self.VRAM_size = VRAM_size
+
+            # Asset entries from the manifest, in manifest order.
+            self.asset_entries = []
+
+    # What a worker sends back for a group.  Only plain data, so that it's
+    # cheap to send between processes.
+    class GroupOutput:
+        def __init__(self, group_name: str):
+            self.group_name = group_name
+
+            # File name -> contents.
+            self.files = {}
+
+            # For conversion.json.
+            self.summary = {}
+
+            # Stage -> seconds, from the group's TilePipeline.
+            self.stage_to_elapsed_seconds = {}
+
+    # Static vars
+    DEFAULT_QUANTIZE_BITS = [2, 2, 2]
+    DEFAULT_STAGING_PALETTE_SIZES = [16, 16]
+    DEFAULT_VRAM_SIZE = 448
+
+    SUMMARY_FILE_NAME = "conversion.json"
+
+    NAME_TO_FLIPS = {
+          "none": Pattern.Flip.NONE
+        , "horiz": Pattern.Flip.HORIZ
+        , "vert": Pattern.Flip.VERT
+        , "both": Pattern.Flip.HORIZ_VERT
+    }
+
+    ASSET_VRAM_KEYS = ["VRAM_begin", "VRAM_end", "VRAM_fixed", "VRAM_alignment", "VRAM_bank_size"]
+
+    # SMS hardware limits.
+    PATTERN_SIZE = 8
+    NUM_PALETTE_SLOTS = 16
+    MAX_NUM_PALETTES = 2
+    MAX_VRAM_LOC = 511
+    NAMETABLE_FLIP_HORIZ_BIT = 9
+    NAMETABLE_FLIP_VERT_BIT = 10
+    NAMETABLE_PALETTE_BIT = 11
+
+    def __init__(self, manifest: Mapping[str, object], base_directory: str):
+        self.base_directory = base_directory
+
+        output_directory = manifest.get("output_directory")
+        self.output_directory = os.path.join(base_directory, output_directory) if output_directory is not None else None
+
+        self.quantize_bits = list(manifest.get("quantize_bits", BatchConverter.DEFAULT_QUANTIZE_BITS))
+
+        # Groups in the order they're first used.
+        self.groups = []
+        self._parse_assets(manifest)
+
+    @classmethod
+    def create_from_file(cls, manifest_path: str) -> 'BatchConverter':
+        with open(manifest_path, "r") as manifest_file:
+            try:
+                manifest = json.load(manifest_file)
+            except json.JSONDecodeError as error:
+                raise BatchConverter.ManifestError(f"{manifest_path}: {error}")
+        return cls(manifest, os.path.dirname(os.path.abspath(manifest_path)))
+
+    # Converts every group (with up to num_processes at once) and writes the
+    # outputs to the output directory (the manifest's if None).  Passing a
+    # cache_directory keeps color remap solutions between builds (see
+    # SolutionCache).  Returns the outputs, in manifest order.
+    def run(self, output_directory: Optional[str] = None, num_processes: Optional[int] = None, cache_directory: Optional[str] = None) -> List['BatchConverter.GroupOutput']:
+        if output_directory is None:
+            output_directory = self.output_directory
+        if output_directory is None:
+            raise BatchConverter.ManifestError("No output directory given.")
+
+        if num_processes is None:
+            num_processes = os.cpu_count() or 1
+        num_processes = max(1, min(num_processes, len(self.groups)))
+
+        jobs = [(group, self.base_directory, self.quantize_bits, cache_directory) for group in self.groups]
+        if num_processes == 1:
+            group_outputs = [BatchConverter._convert_group(job) for job in jobs]
+        else:
+            with multiprocessing.Pool(num_processes) as pool:
+                # imap keeps the manifest order, whatever order they finish in.
+                group_outputs = list(pool.imap(BatchConverter._convert_group, jobs))
+
+        self._write_outputs(output_directory, group_outputs)
+        return group_outputs
+
+    def _parse_assets(self, manifest: Mapping[str, object]):
+        group_entries = manifest.get("groups", {})
+        name_to_group = {}
+        asset_names = set()
+
+        for asset_entry in manifest.get("assets", []):
+            for required_key in ["name", "image"]:
+                if required_key not in asset_entry:
+                    raise BatchConverter.ManifestError(f"Asset is missing \"{required_key}\": {asset_entry}")
+
+            asset_name = asset_entry["name"]
+            if asset_name in asset_names:
+                raise BatchConverter.ManifestError(f"Asset \"{asset_name}\" appears more than once.")
+            asset_names.add(asset_name)
+
+            if asset_entry.get("flips", "none") not in BatchConverter.NAME_TO_FLIPS:
+                raise BatchConverter.ManifestError(f"Asset \"{asset_name}\" has unknown flips \"{asset_entry['flips']}\".")
+
+            # No group means a group of its own.
+            group_name = asset_entry.get("group", asset_name)
+            group = name_to_group.get(group_name)
+            if group is None:
+                group_entry = group_entries.get(group_name, {})
+                staging_palette_sizes = list(group_entry.get("staging_palettes", BatchConverter.DEFAULT_STAGING_PALETTE_SIZES))
+                if (len(staging_palette_sizes) > BatchConverter.MAX_NUM_PALETTES) or any(num_slots > BatchConverter.NUM_PALETTE_SLOTS for num_slots in staging_palette_sizes):
+                    raise BatchConverter.ManifestError(f"Group \"{group_name}\" can have at most {BatchConverter.MAX_NUM_PALETTES} palettes of {BatchConverter.NUM_PALETTE_SLOTS} colors.")
+
+                group = BatchConverter.Group(group_name, staging_palette_sizes, group_entry.get("VRAM_size", BatchConverter.DEFAULT_VRAM_SIZE))
+                name_to_group[group_name] = group
+                self.groups.append(group)
+
+            group.asset_entries.append(asset_entry)
+
+        for group_name in group_entries.keys():
+            if group_name not in name_to_group:
+                raise BatchConverter.ManifestError(f"Group \"{group_name}\" has no assets.")
+
+    @staticmethod
+    def _convert_group(job: Tuple['BatchConverter.Group', str, List[int], Optional[str]]) -> 'BatchConverter.GroupOutput':
+        group, base_directory, quantize_bits, cache_directory = job
+
+        solution_cache = SolutionCache(cache_directory) if cache_directory is not None else None
+        pipeline = TilePipeline(staging_palette_sizes=group.staging_palette_sizes, VRAM_size=group.VRAM_size, solution_cache=solution_cache)
+
+        for asset_entry in group.asset_entries:
+            pipeline.add_asset(BatchConverter._create_asset(asset_entry, base_directory, quantize_bits))
+
+        try:
+            pipeline.run()
+        except TilePipeline.NoSolutionError as error:
+            raise BatchConverter.ConversionError(group.name, f"No solution for the {error.stage_name} stage.")
+        except TilePipeline.InvalidAssetSizeError as error:
+            raise BatchConverter.ConversionError(group.name, f"\"{error.asset_name}\" is {error.width}x{error.height}, which isn't a multiple of {error.pattern_width}x{error.pattern_height}.")
+
+        group_output = BatchConverter.GroupOutput(group.name)
+        group_output.stage_to_elapsed_seconds = dict(pipeline.stage_to_elapsed_seconds)
+
+        # Staging palette index -> final slot for each staging palette index.
+        staging_to_final_maps = [staging_palette.create_final_palette_mapping() for staging_palette in pipeline.staging_palettes]
+
+        palettes_file_name = group.name + ".palettes.bin"
+        group_output.files[palettes_file_name] = BatchConverter.create_palette_bytes(pipeline.staging_palettes, staging_to_final_maps)
+
+        asset_summaries = []
+        for asset_idx, asset in enumerate(pipeline.assets):
+            result = pipeline.get_result(asset_idx)
+
+            if (result.VRAM_loc is not None) and (result.VRAM_loc + len(result.unique_patterns) - 1 > BatchConverter.MAX_VRAM_LOC):
+                raise BatchConverter.ConversionError(group.name, f"\"{asset.name}\" doesn't fit below VRAM location {BatchConverter.MAX_VRAM_LOC + 1}.")
+
+            patterns_file_name = asset.name + ".patterns.bin"
+            nametable_file_name = asset.name + ".nametable.bin"
+            group_output.files[patterns_file_name] = BatchConverter.create_pattern_bytes(result.unique_patterns, staging_to_final_maps[result.staging_palette_index])
+            group_output.files[nametable_file_name] = BatchConverter.create_nametable_bytes(result.nametable)
+
+            asset_summaries.append({
+                  "name": asset.name
+                , "palette_index": result.staging_palette_index
+                , "VRAM_loc": result.VRAM_loc
+                , "num_unique_patterns": len(result.unique_patterns)
+                , "width_in_patterns": result.width_in_patterns
+                , "height_in_patterns": result.height_in_patterns
+                , "patterns_file": patterns_file_name
+                , "nametable_file": nametable_file_name
+            })
+
+        group_output.summary = {
+              "name": group.name
+            , "palettes_file": palettes_file_name
+            , "assets": asset_summaries
+        }
+
+        return group_output
+
+    @staticmethod
+    def _create_asset(asset_entry: Mapping[str, object], base_directory: str, quantize_bits: List[int]) -> TilePipeline.Asset:
+        image = Image.open(os.path.join(base_directory, asset_entry["image"])).convert("RGB")
+        x, y, width, height = asset_entry.get("rect", [0, 0, image.width, image.height])
+        pixel_array = PixelArray(image, x, y, width, height)
+        pixel_array.quantize((8,8,8), tuple(quantize_bits))
+
+        color_remap = {}
+        for from_color, to_color in asset_entry.get("color_remap", {}).items():
+            color_entry = ColorEntry()
+            color_entry.intentions.attempt_set_intention(ColorEntry.INTENTION_COLOR, BatchConverter._parse_color(to_color))
+            color_remap[BatchConverter._parse_color(from_color)] = color_entry
+
+        VRAM_params = {key: asset_entry[key] for key in BatchConverter.ASSET_VRAM_KEYS if key in asset_entry}
+
+        return TilePipeline.Asset(asset_entry["name"], pixel_array
+            , color_remap=color_remap
+            , flips_allowed=BatchConverter.NAME_TO_FLIPS[asset_entry.get("flips", "none")]
+            , pattern_width=BatchConverter.PATTERN_SIZE, pattern_height=BatchConverter.PATTERN_SIZE
+            , **VRAM_params)
+
+    # "#RRGGBB" -> (R, G, B)
+    @staticmethod
+    def _parse_color(color: str) -> Tuple[int, int, int]:
+        if (len(color) != 7) or (color[0] != "#"):
+            raise BatchConverter.ManifestError(f"Colors must be \"#RRGGBB\", not \"{color}\".")
+        return (int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16))
+
+    # Each pattern as 8 rows of 4 bytes, one per bitplane, leftmost pixel
+    # in the high bit.
+    @staticmethod
+    def create_pattern_bytes(patterns: List[Pattern], staging_to_final_map: Mapping[int, int]) -> bytes:
+        pattern_bytes = bytearray()
+        for pattern in patterns:
+            final_indices = [staging_to_final_map[staging_idx] for staging_idx in pattern.index_array.array]
+            for row_start in range(0, len(final_indices), BatchConverter.PATTERN_SIZE):
+                row = final_indices[row_start:row_start + BatchConverter.PATTERN_SIZE]
+                for plane in range(4):
+                    plane_byte = 0
+                    for value in row:
+                        plane_byte = (plane_byte << 1) | ((value >> plane) & 1)
+                    pattern_bytes.append(plane_byte)
+        return bytes(pattern_bytes)
+
+    @staticmethod
+    def create_nametable_bytes(nametable: List[NameTableEntry]) -> bytes:
+        nametable_bytes = bytearray()
+        for entry in nametable:
+            value = entry.VRAM_loc | (entry.palette_index << BatchConverter.NAMETABLE_PALETTE_BIT)
+            if entry.flips & Pattern.Flip.HORIZ == Pattern.Flip.HORIZ:
+                value |= 1 << BatchConverter.NAMETABLE_FLIP_HORIZ_BIT
+            if entry.flips & Pattern.Flip.VERT == Pattern.Flip.VERT:
+                value |= 1 << BatchConverter.NAMETABLE_FLIP_VERT_BIT
+            nametable_bytes.extend(value.to_bytes(2, "little"))
+        return bytes(nametable_bytes)
+
+    # One byte per slot (--BBGGRR), unused slots black.
+    @staticmethod
+    def create_palette_bytes(staging_palettes: List[StagingPalette], staging_to_final_maps: List[Mapping[int, int]]) -> bytes:
+        palette_bytes = bytearray()
+        for staging_palette, staging_to_final_map in zip(staging_palettes, staging_to_final_maps):
+            slots = [0] * BatchConverter.NUM_PALETTE_SLOTS
+            for staging_idx, final_slot in staging_to_final_map.items():
+                color = staging_palette.color_entries[staging_idx].intentions.get_intention(ColorEntry.INTENTION_COLOR)
+                if color is None:
+                    continue
+                red, green, blue = [Quantize.quantize_to_target(channel, 256, 4) for channel in color]
+                slots[final_slot] = red | (green << 2) | (blue << 4)
+            palette_bytes.extend(slots)
+        return bytes(palette_bytes)
+
+    def _write_outputs(self, output_directory: str, group_outputs: List['BatchConverter.GroupOutput']):
+        os.makedirs(output_directory, exist_ok=True)
+
+        for group_output in group_outputs:
+            for file_name, contents in group_output.files.items():
+                with open(os.path.join(output_directory, file_name), "wb") as output_file:
+                    output_file.write(contents)
+
+        summary = {"groups": [group_output.summary for group_output in group_outputs]}
+        with open(os.path.join(output_directory, BatchConverter.SUMMARY_FILE_NAME), "w") as summary_file:
+            json.dump(summary, summary_file, indent=2)
+            summary_file.write("\n")
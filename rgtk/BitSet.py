@@ -16,9 +16,21 @@ class BitSet:
 
         return new_entry
 
+    # Creates a BitSet from the bits of an int, as returned by get_value().
+    @classmethod
+    def create_from_value(cls, num_bits: int, value: int) -> 'BitSet':
+        new_entry = cls(num_bits)
+        new_entry._bitset = value & ((1 << num_bits) - 1)
+
+        return new_entry
+
     def get_num_bits(self) -> int:
         return self._num_bits
 
+    # Returns the bits as an int, with bit 0 as the least significant.
+    def get_value(self) -> int:
+        return self._bitset
+
     def is_set(self, bit_idx: int) -> bool:
         mask = 1 << bit_idx
         truth = (self._bitset & mask) != 0
@@ -29,10 +41,26 @@ class BitSet:
         self._bitset = self._bitset | mask
 
     def clear_bit(self, bit_idx: int):
-        all_on = (1 << self._num_bits) - 1
-        target = 1 << bit_idx
-        mask = all_on ^ target
-        self._bitset = self._bitset & mask
+        mask = 1 << bit_idx
+        self._bitset = self._bitset & ~mask
+
+    # Range operations take begin and end INCLUSIVE (like Intervals), and
+    # are a single mask operation no matter how wide the range is.
+    def set_range(self, begin_idx: int, end_idx: int):
+        self._bitset = self._bitset | BitSet._get_range_mask(begin_idx, end_idx)
+
+    def clear_range(self, begin_idx: int, end_idx: int):
+        self._bitset = self._bitset & ~BitSet._get_range_mask(begin_idx, end_idx)
+
+    def count_range(self, begin_idx: int, end_idx: int) -> int:
+        return bin(self._bitset & BitSet._get_range_mask(begin_idx, end_idx)).count("1")
+
+    def is_range_clear(self, begin_idx: int, end_idx: int) -> bool:
+        return (self._bitset & BitSet._get_range_mask(begin_idx, end_idx)) == 0
+
+    def is_range_set(self, begin_idx: int, end_idx: int) -> bool:
+        mask = BitSet._get_range_mask(begin_idx, end_idx)
+        return (self._bitset & mask) == mask
 
     def clear_all(self):
         self._bitset = 0
@@ -41,28 +69,18 @@ class BitSet:
         self._bitset = (1 << self._num_bits) - 1
 
     def get_next_unset_bit_index(self, start_idx: int) -> Optional[int]:
-        for idx in range(start_idx, self._num_bits):
-            if self.is_set(idx) == False:
-                return idx
-        return None
+        all_on = (1 << self._num_bits) - 1
+        return BitSet._get_lowest_bit_index_from(~self._bitset & all_on, start_idx)
 
     def get_next_set_bit_index(self, start_idx: int) -> Optional[int]:
-        for idx in range(start_idx, self._num_bits):
-            if self.is_set(idx) == True:
-                return idx
-        return None
+        return BitSet._get_lowest_bit_index_from(self._bitset, start_idx)
 
     def get_previous_unset_bit_index(self, start_idx: int) -> Optional[int]:
-        for idx in range(start_idx, 0, -1):
-            if self.is_set(idx) == False:
-                return idx
-        return None
+        all_on = (1 << self._num_bits) - 1
+        return BitSet._get_highest_bit_index_through(~self._bitset & all_on, min(start_idx, self._num_bits - 1))
 
     def get_previous_set_bit_index(self, start_idx: int) -> Optional[int]:
-        for idx in range(start_idx, 0, -1):
-            if self.is_set(idx) == True:
-                return idx
-        return None
+        return BitSet._get_highest_bit_index_through(self._bitset, min(start_idx, self._num_bits - 1))
 
     def are_all_set(self) -> bool:
         all_on = (1 << self._num_bits) - 1
@@ -72,14 +90,7 @@ class BitSet:
         return self._bitset == 0
 
     def get_num_bits_set(self) -> int:
-        bits_set = 0
-        temp_val = self._bitset
-        while (temp_val != 0):
-            if temp_val & 1 == 1:
-                bits_set += 1
-            temp_val = temp_val >> 1
-
-        return bits_set
+        return bin(self._bitset).count("1")
 
     def get_union_bitset(self, other: 'BitSet') -> 'BitSet':
         if self._num_bits != other._num_bits:
@@ -125,3 +136,26 @@ class BitSet:
             raise MismatchedBitSetLengthError()
 
         self._bitset = self._bitset ^ other._bitset
+
+
+    @staticmethod
+    def _get_range_mask(begin_idx: int, end_idx: int) -> int:
+        return ((1 << (end_idx - begin_idx + 1)) - 1) << begin_idx
+
+    # Index of the lowest set bit at or above start_idx, or None.
+    @staticmethod
+    def _get_lowest_bit_index_from(value: int, start_idx: int) -> Optional[int]:
+        remaining = value >> start_idx
+        if remaining == 0:
+            return None
+        return start_idx + (remaining & -remaining).bit_length() - 1
+
+    # Index of the highest set bit at or below end_idx, or None.
+    @staticmethod
+    def _get_highest_bit_index_through(value: int, end_idx: int) -> Optional[int]:
+        if end_idx < 0:
+            return None
+        remaining = value & ((1 << (end_idx + 1)) - 1)
+        if remaining == 0:
+            return None
+        return remaining.bit_length() - 1
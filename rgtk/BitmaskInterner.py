@@ -0,0 +1,37 @@
+from typing import Iterable
+
+# Assigns each distinct (hashable) value a small integer id, so that sets of
+# values can be represented as int bitmasks.  Subset and union size checks
+# then become a couple of integer operations:
+#   a is a subset of b:     (a & ~b) == 0
+#   size of a union b:      get_num_bits(a | b)
+#
+# Ids are never released, so an interner should be shared by everything
+# whose masks will be compared against each other.
+class BitmaskInterner:
+    def __init__(self):
+        self._value_to_id = {}
+
+    def __len__(self) -> int:
+        return len(self._value_to_id)
+
+    # Returns the id for the value, assigning the next one if it's new.
+    def get_id(self, value: object) -> int:
+        value_id = self._value_to_id.get(value)
+        if value_id is None:
+            value_id = len(self._value_to_id)
+            self._value_to_id[value] = value_id
+        return value_id
+
+    def get_bit(self, value: object) -> int:
+        return 1 << self.get_id(value)
+
+    def get_mask(self, values: Iterable[object]) -> int:
+        mask = 0
+        for value in values:
+            mask |= 1 << self.get_id(value)
+        return mask
+
+    @staticmethod
+    def get_num_bits(mask: int) -> int:
+        return bin(mask).count("1")
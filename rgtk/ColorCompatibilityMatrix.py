@@ -0,0 +1,69 @@
+import math
+from typing import List, Optional
+from rgtk.ColorEntry import ColorEntry
+from rgtk.ColorsIntoColorsEvaluator import ColorsIntoColorsEvaluator
+
+# The changes needed to fit each source ColorEntry into each destination
+# ColorEntry (e.g., a remap's colors into a palette), computed all at once.
+#
+# Whether an entry fits another only depends on their intention values, so
+# the work is done once per *distinct* pair of signatures:  sources with the
+# same intentions share a row, and destinations with the same intentions
+# (such as the empty entries of a 256 color palette) share a result.  The
+# results come from the matrix shared by every ColorsIntoColorsEvaluator
+# (see ColorsIntoColorsEvaluator.s_compatibility_columns), so pairs already
+# seen by a solve, or by an earlier fit, aren't worked out again.
+class ColorCompatibilityMatrix:
+    def __init__(self, sources: List[ColorEntry], destinations: List[ColorEntry]):
+        self.sources = sources
+        self.destinations = destinations
+
+        # Sources are grouped into rows by their intentions.  Each row is a
+        # list of source indices.
+        self._rows = []
+        self._row_signatures = []
+        signature_to_row = {}
+        for source_index, source in enumerate(sources):
+            signature = source.get_signature()
+            row = signature_to_row.get(signature)
+            if row is None:
+                row = len(self._rows)
+                signature_to_row[signature] = row
+                self._rows.append([])
+                self._row_signatures.append(signature)
+            self._rows[row].append(source_index)
+
+        self._change_lists = [[None] * len(destinations) for _ in self._rows]
+        self._costs = [[math.inf] * len(destinations) for _ in self._rows]
+        for dest_index in range(len(destinations)):
+            self._compute_column(dest_index)
+
+    def get_num_rows(self) -> int:
+        return len(self._rows)
+
+    # The source indices that share a row.
+    def get_row_source_indices(self, row: int) -> List[int]:
+        return self._rows[row]
+
+    # The intention values (see ColorEntry.get_signature()) shared by the
+    # row's sources.
+    def get_row_signature(self, row: int) -> tuple:
+        return self._row_signatures[row]
+
+    # Returns the changes to fit the row's sources into the destination, or
+    # None if they can't go there.
+    def get_change_list(self, row: int, dest_index: int) -> Optional['ColorsIntoColorsEvaluator.ChangeList']:
+        return self._change_lists[row][dest_index]
+
+    # Returns the cost of the changes (see ColorsIntoColorsEvaluator.s_change_to_cost_map),
+    # or math.inf if the row's sources can't go there.
+    def get_cost(self, row: int, dest_index: int) -> float:
+        return self._costs[row][dest_index]
+
+    def _compute_column(self, dest_index: int):
+        dest_signature = self.destinations[dest_index].get_signature()
+
+        for row, row_signature in enumerate(self._row_signatures):
+            change_list, cost, _ = ColorsIntoColorsEvaluator._get_compatibility(row_signature, dest_signature)
+            self._change_lists[row][dest_index] = change_list
+            self._costs[row][dest_index] = cost
@@ -1,6 +1,9 @@
-from rgtk.Intention import IntentionDefinition, IntentionCollection
+from rgtk.BitmaskInterner import BitmaskInterner
+from rgtk.Intention import IntentionDefinition, IntentionCollection, IntentionLayout
 
 class ColorEntry:
+    __slots__ = ("intentions",)
+
     # Static vars
     INTENTION_COLOR = "Color"
     INTENTION_SLOT = "Slot"
@@ -13,6 +16,17 @@ class ColorEntry:
         , INTENTION_FORCED_PALETTE: IntentionDefinition(is_unique=False, is_required=False)
         , INTENTION_NAME: IntentionDefinition(is_unique=True, is_required=False) }
 
+    # Where each intention lives in a signature, for code that compares
+    # entries in bulk.
+    s_intention_layout = IntentionLayout.get_for_def_map(sIntention_def_map)
+    POSITION_COLOR = s_intention_layout.name_to_position[INTENTION_COLOR]
+    POSITION_SLOT = s_intention_layout.name_to_position[INTENTION_SLOT]
+    POSITION_NAME = s_intention_layout.name_to_position[INTENTION_NAME]
+
+    # Every color value gets a global id, so that sets of colors can be
+    # compared as bitmasks.
+    s_color_interner = BitmaskInterner()
+
     def __init__(self):
         self.intentions = IntentionCollection(ColorEntry.sIntention_def_map)
 
@@ -23,12 +37,25 @@ class ColorEntry:
 
         return new_entry
 
+    # Palettes are deep copied constantly during solves.  Intentions share
+    # their values until changed, so a copy is just a new collection.
+    def __deepcopy__(self, memo) -> 'ColorEntry':
+        new_entry = ColorEntry.__new__(ColorEntry)
+        new_entry.intentions = IntentionCollection.copy_construct_from(self.intentions)
+        memo[id(self)] = new_entry
+        return new_entry
+
     def is_empty(self) -> bool:
         # A ColorEntry is considered empty if it has no intentions set.
-        for prop_name in ColorEntry.sIntention_def_map.keys():
-            if self.intentions.get_intention(prop_name) is not None:
-                # We're not empty if we have an intention set
-                return False
-        
-        # We're empty!
-        return True
\ No newline at end of file
+        return self.intentions.is_empty()
+
+    # Returns a hashable snapshot of this entry's intentions.
+    def get_signature(self) -> tuple:
+        return self.intentions.get_signature()
+
+    # Returns this entry's bit in the color interner, or 0 if it has no color.
+    def get_color_bit(self) -> int:
+        color = self.intentions.get_intention(ColorEntry.INTENTION_COLOR)
+        if color is None:
+            return 0
+        return ColorEntry.s_color_interner.get_bit(color)
\ No newline at end of file
@@ -57,6 +57,10 @@ class ColorRemap(IntentionCollection):
         self.final_palette = None
         self.final_palette_indices = [None] * len(self.color_entries)
 
+    # Returns a hashable snapshot of the remap's color entries, in order.
+    def get_color_entries_signature(self) -> tuple:
+        return tuple(color_entry.get_signature() for color_entry in self.color_entries)
+
     def remap_to_staging_palette(self, remap_to_staging_palette_move: Move, staging_palettes: List[StagingPalette]):
         # The move parameter is a ColorRemapsIntoStagingPalettes move,
         # which tells us which palette we're going to.
@@ -86,3 +90,10 @@ class ColorRemap(IntentionCollection):
         unique_idx = self.convert_pixel_value_to_unique_index(pixel_value)
         staging_idx = self.final_palette_indices[unique_idx]
         return staging_idx
+
+    # Returns a bitmask of the remap's colors (see ColorEntry.s_color_interner).
+    def get_color_mask(self) -> int:
+        color_mask = 0
+        for color_entry in self.color_entries:
+            color_mask |= color_entry.get_color_bit()
+        return color_mask
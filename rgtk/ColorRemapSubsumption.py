@@ -0,0 +1,113 @@
+import copy
+from typing import List, Optional
+from rgtk.BitmaskInterner import BitmaskInterner
+from rgtk.ColorRemap import ColorRemap
+from rgtk.ColorRemapsIntoStagingPalettesEvaluator import ColorRemapsIntoStagingPalettesEvaluator
+from rgtk.ColorsIntoColorsFitter import ColorsIntoColorsFitter
+from rgtk.constraint_solver import Move
+from rgtk.StagingPalette import StagingPalette
+
+# In per-tile palette jobs, most tiles' colors are a subset of some other
+# tile's colors.  Those tiles can go wherever the bigger tile goes, so there
+# is no need to make them sources of their own.
+#
+# This pre-pass finds the "maximal" remaps (those not subsumed by another),
+# so that only they need to be solved.  A solution for the maximal remaps
+# can then be expanded into a solution for all of the remaps.
+#
+# A remap is subsumed by another if every one of its color entries (with
+# its intentions) appears in the other, and it either has no palette
+# intention or the same palette intention as the other.
+class ColorRemapSubsumption:
+    def __init__(self, color_remaps: List[ColorRemap]):
+        self.color_remaps = color_remaps
+
+        # Encode each remap's color entries as a bitmask, with one bit per
+        # unique color entry signature.  Intentions matter here, so we can't
+        # use the colors alone.
+        signature_interner = BitmaskInterner()
+        remap_masks = []
+        for color_remap in color_remaps:
+            remap_masks.append(signature_interner.get_mask(color_remap.get_color_entries_signature()))
+
+        # Visit the remaps with the most colors first, so that every remap is
+        # considered after any remap that could subsume it.  Ties keep their
+        # original order, so that the first of several identical remaps wins.
+        remap_order = sorted(range(len(color_remaps)), key=lambda remap_idx: -BitmaskInterner.get_num_bits(remap_masks[remap_idx]))
+
+        # Indices of the maximal remaps, and which remaps each subsumes.
+        self._maximal_remap_indices = []
+        self._maximal_idx_to_subsumed_remap_indices = []
+
+        # Identical remaps are common enough to be worth finding without a scan.
+        mask_and_palette_to_maximal_idx = {}
+        for remap_idx in remap_order:
+            mask = remap_masks[remap_idx]
+            palette_index = color_remaps[remap_idx].get_intention(ColorRemap.INTENTION_PALETTE)
+
+            maximal_idx = mask_and_palette_to_maximal_idx.get((mask, palette_index))
+            if maximal_idx is None:
+                for candidate_idx, candidate_remap_idx in enumerate(self._maximal_remap_indices):
+                    # We can't drag a remap into a palette it isn't allowed in.
+                    if palette_index is not None:
+                        candidate_palette_index = color_remaps[candidate_remap_idx].get_intention(ColorRemap.INTENTION_PALETTE)
+                        if palette_index != candidate_palette_index:
+                            continue
+
+                    if (mask & ~remap_masks[candidate_remap_idx]) == 0:
+                        maximal_idx = candidate_idx
+                        break
+
+            if maximal_idx is None:
+                # Nobody covers us.  We're a new maximal remap.
+                mask_and_palette_to_maximal_idx[(mask, palette_index)] = len(self._maximal_remap_indices)
+                self._maximal_remap_indices.append(remap_idx)
+                self._maximal_idx_to_subsumed_remap_indices.append([])
+            else:
+                self._maximal_idx_to_subsumed_remap_indices[maximal_idx].append(remap_idx)
+
+    # The remaps that need to be solved, in the order that solutions
+    # will refer to them.
+    def get_maximal_remaps(self) -> List[ColorRemap]:
+        return [self.color_remaps[remap_idx] for remap_idx in self._maximal_remap_indices]
+
+    # Index into the original list for each maximal remap.
+    def get_maximal_remap_indices(self) -> List[int]:
+        return list(self._maximal_remap_indices)
+
+    # Indices into the original list of the remaps that ride along with
+    # the specified maximal remap.
+    def get_subsumed_remap_indices(self, maximal_idx: int) -> List[int]:
+        return list(self._maximal_idx_to_subsumed_remap_indices[maximal_idx])
+
+    # Takes a solution whose source indices refer to the maximal remaps and
+    # returns one whose source indices refer to the original remaps, with a
+    # move for every remap.  Each maximal remap's move is followed by moves
+    # for the remaps it subsumes, which only use entries it put there.
+    # Returns None if a subsumed remap couldn't be fit (which shouldn't
+    # happen unless the palettes were changed in between).
+    def expand_solution(self, solution: List[Move], staging_palettes: List[StagingPalette]) -> Optional[List[Move]]:
+        # Play the solution out on copies, so that the subsumed remaps can
+        # be fit against what the maximal remaps did.
+        working_palettes = copy.deepcopy(staging_palettes)
+
+        expanded_solution = []
+        for move in solution:
+            maximal_remap_idx = self._maximal_remap_indices[move.source_index]
+            maximal_remap = self.color_remaps[maximal_remap_idx]
+            working_palette = working_palettes[move.dest_index]
+
+            ColorRemapsIntoStagingPalettesEvaluator.apply_changes(maximal_remap, working_palette, move.change_list)
+            expanded_solution.append(Move(maximal_remap_idx, move.dest_index, move.change_list))
+
+            for subsumed_remap_idx in self._maximal_idx_to_subsumed_remap_indices[move.source_index]:
+                subsumed_remap = self.color_remaps[subsumed_remap_idx]
+                color_solution = ColorsIntoColorsFitter.create_for_staging_palette(subsumed_remap.color_entries, working_palette).get_best_solution()
+                if color_solution is None:
+                    return None
+
+                change_list = ColorRemapsIntoStagingPalettesEvaluator.ChangeList(color_solution)
+                ColorRemapsIntoStagingPalettesEvaluator.apply_changes(subsumed_remap, working_palette, change_list)
+                expanded_solution.append(Move(subsumed_remap_idx, move.dest_index, change_list))
+
+        return expanded_solution
@@ -1,8 +1,12 @@
 import math
-from typing import List, Tuple, Optional
+from collections import Counter
+from typing import List, Mapping, Tuple, Optional
 from rgtk.constraint_solver import ConstraintSolver, Evaluator, Move
 from rgtk.ColorsIntoColorsEvaluator import ColorsIntoColorsEvaluator
+from rgtk.ColorsIntoColorsFitter import ColorsIntoColorsFitter
+from rgtk.ColorEntry import ColorEntry
 from rgtk.ColorRemap import ColorRemap
+from rgtk.LRUCache import LRUCache
 from rgtk.StagingPalette import StagingPalette
 
 class ColorRemapsIntoStagingPalettesEvaluator(Evaluator):
@@ -12,6 +16,36 @@ class ColorRemapsIntoStagingPalettesEvaluator(Evaluator):
     SCORE_ADJUST_EACH_COLOR_IN_REMAP = -1
     SCORE_ADJUST_EACH_COLOR_MATCHING = -100
 
+    # Fitting a remap into a palette means running a nested solver to
+    # exhaustion.  Many remaps share identical colors, so we remember the
+    # results keyed on (remap colors, palette contents).
+    NESTED_SOLVE_CACHE_MAX_ENTRIES = 4096
+    s_nested_solve_cache = LRUCache(NESTED_SOLVE_CACHE_MAX_ENTRIES)
+
+    # Nested solves cut short by ConstraintSolver.step_for(), by the same
+    # key, so that they can be resumed when they're asked for again.
+    SUSPENDED_NESTED_SOLVERS_MAX_ENTRIES = 64
+    s_suspended_nested_solvers = LRUCache(SUSPENDED_NESTED_SOLVERS_MAX_ENTRIES)
+
+    # How many steps a nested solve takes between checks of the time slice.
+    NESTED_SOLVE_STEPS_PER_TIME_SLICE_CHECK = 64
+
+    # Instead of exhaustively enumerating every way to fit a remap into a
+    # palette, we can solve it as an assignment problem and keep only the
+    # lowest cost ways.  Much faster, and it finds a fit whenever the nested
+    # solver would (see ColorsIntoColorsFitter), but only the best few.
+    USE_MATCHING_FITTER = False
+    MATCHING_FITTER_MAX_SOLUTIONS = 1
+
+    # Each way of fitting a remap into a palette becomes a branch in the
+    # search, which can be thousands for a half-empty palette.  These bound
+    # that fan-out:
+    #   Dedupe collapses ways that leave the palette with the same contents
+    #   (regardless of which entries they landed in), keeping the best scored.
+    #   The max keeps only the best scored ways per palette (None for all).
+    DEDUPE_CHANGE_LISTS_WITH_SAME_RESULT = False
+    MAX_CHANGE_LISTS_PER_DESTINATION = None
+
     class PotentialMove:
         def __init__(self, move: Move, base_score: int):
             self.move = move
@@ -86,10 +120,13 @@ class ColorRemapsIntoStagingPalettesEvaluator(Evaluator):
             return
 
         # Otherwise, we either haven't seen the move before or we're about to update our existing one.
-        # In either event, start by assuming we won't get this to fit.
+        # Fitting may be cut short by a time slice (see ConstraintSolver.step_for()),
+        # so work it out before touching anything, leaving us ready to be asked again.
+        change_lists = self._get_changes_to_fit(destination_index, destination)
+
+        # Start by assuming we won't get this to fit.
         self._destination_to_potential_move_list[destination_index] = None
 
-        change_lists = self._get_changes_to_fit(destination_index, destination)
         if (change_lists is not None) and (len(change_lists) > 0):
             # We can make moves!
             potential_move_list = []
@@ -123,6 +160,38 @@ class ColorRemapsIntoStagingPalettesEvaluator(Evaluator):
         # Palettes are always instantiated.
         return False
 
+    @classmethod
+    def encode_change_list(cls, change_list: 'ColorRemapsIntoStagingPalettesEvaluator.ChangeList', source_index: int, dest_index: int, encoding: object) -> tuple:
+        # Each of our colors' moves, by color index within the remap and entry
+        # index within the palette.
+        encoded_color_moves = []
+        for color_move in change_list.color_into_color_moves:
+            color_payload = ColorsIntoColorsEvaluator.encode_change_list(color_move.change_list, color_move.source_index, color_move.dest_index, encoding)
+            encoded_color_moves.append((color_move.source_index, color_move.dest_index, color_payload))
+        return tuple(encoded_color_moves)
+
+    @classmethod
+    def decode_change_list(cls, payload: tuple, source_index: int, dest_index: int, encoding: object) -> 'ColorRemapsIntoStagingPalettesEvaluator.ChangeList':
+        color_moves = []
+        for color_index, palette_color_index, color_payload in payload:
+            color_change_list = ColorsIntoColorsEvaluator.decode_change_list(color_payload, color_index, palette_color_index, encoding)
+            color_moves.append(Move(color_index, palette_color_index, color_change_list))
+        return ColorRemapsIntoStagingPalettesEvaluator.ChangeList(color_moves)
+
+    def get_matching_move(self, previous_move: Move) -> Optional[Move]:
+        potential_move_list = self._destination_to_potential_move_list.get(previous_move.dest_index)
+        if potential_move_list is None:
+            return None
+
+        # A move matches if each of our colors lands in the same palette entry.
+        previous_color_mapping = ColorRemapsIntoStagingPalettesEvaluator._get_color_mapping(previous_move.change_list)
+        for potential_move in potential_move_list:
+            color_mapping = ColorRemapsIntoStagingPalettesEvaluator._get_color_mapping(potential_move.move.change_list)
+            if color_mapping == previous_color_mapping:
+                return potential_move.move
+
+        return None
+
     def _get_changes_to_fit(self, destination_index: int, destination: StagingPalette) -> Optional[List['ColorRemapsIntoStagingPalettesEvaluator.ChangeList']]:
         # Check this remap to see if it has a palette assigned.  If it does, does it match the destination?
         assigned_palette = self.source.get_intention(ColorRemap.INTENTION_PALETTE)
@@ -130,16 +199,12 @@ class ColorRemapsIntoStagingPalettesEvaluator(Evaluator):
             # We have a remap that wants to be assigned to a specific palette, and it's not this one.
             return None
 
-        # Take the colors in the source and execute a solver to map them to the palette's colors.
-        palette_colors = destination.color_entries
-
-        solver = ConstraintSolver(self.source.color_entries, palette_colors, ColorsIntoColorsEvaluator, None)
-        while solver.is_exhausted() == False:
-            solver.update()
+        # Before trying to fit, make sure there are even enough entries for our colors.
+        if destination.could_fit_color_mask(self.source.get_color_mask()) == False:
+            return None
 
-        # Did we have any solutions?
-        solutions = solver.solutions
-        if len(solutions) == 0:
+        solutions = self._get_color_solutions_to_fit(self.source, destination)
+        if solutions is None:
             # No solutions means we can't fit.
             return None
         
@@ -150,8 +215,115 @@ class ColorRemapsIntoStagingPalettesEvaluator(Evaluator):
             change_list = ColorRemapsIntoStagingPalettesEvaluator.ChangeList(solution)
             change_lists.append(change_list)
 
+        if self.DEDUPE_CHANGE_LISTS_WITH_SAME_RESULT or (self.MAX_CHANGE_LISTS_PER_DESTINATION is not None):
+            change_lists = self._get_bounded_change_lists(destination, change_lists)
+
         return change_lists
 
+    def _get_bounded_change_lists(self, destination: StagingPalette, change_lists: List['ColorRemapsIntoStagingPalettesEvaluator.ChangeList']) -> List['ColorRemapsIntoStagingPalettesEvaluator.ChangeList']:
+        # Best scores first.  The sort is stable, so ties keep the order the
+        # solver found them in.
+        scored_change_lists = []
+        for change_list in change_lists:
+            score = ColorRemapsIntoStagingPalettesEvaluator._get_score_for_changes(change_list)
+            scored_change_lists.append((score, change_list))
+        scored_change_lists.sort(key=lambda score_change_list: score_change_list[0])
+
+        bounded_change_lists = []
+        results_seen = set()
+        for score_change_list in scored_change_lists:
+            change_list = score_change_list[1]
+
+            if self.DEDUPE_CHANGE_LISTS_WITH_SAME_RESULT:
+                result = ColorRemapsIntoStagingPalettesEvaluator._get_resulting_palette_contents(destination, change_list)
+                if result in results_seen:
+                    continue
+                results_seen.add(result)
+
+            bounded_change_lists.append(change_list)
+
+            if (self.MAX_CHANGE_LISTS_PER_DESTINATION is not None) and (len(bounded_change_lists) >= self.MAX_CHANGE_LISTS_PER_DESTINATION):
+                break
+
+        return bounded_change_lists
+
+    @staticmethod
+    def _get_resulting_palette_contents(destination: StagingPalette, change_list: 'ColorRemapsIntoStagingPalettesEvaluator.ChangeList') -> frozenset:
+        # Figure out what the palette would hold after the changes, without
+        # actually applying them.  Entry order doesn't matter to anything we'd
+        # fit later, so the result is the *multiset* of entry signatures.
+        name_to_position = ColorEntry.s_intention_layout.name_to_position
+        entry_signatures = [color_entry.get_signature() for color_entry in destination.color_entries]
+
+        for color_into_color_move in change_list.color_into_color_moves:
+            dest_index = color_into_color_move.dest_index
+            new_signature = list(entry_signatures[dest_index])
+            for intention_name_value_tuple in color_into_color_move.change_list.intention_name_value_tuple_list:
+                new_signature[name_to_position[intention_name_value_tuple[0]]] = intention_name_value_tuple[1]
+            entry_signatures[dest_index] = tuple(new_signature)
+
+        return frozenset(Counter(entry_signatures).items())
+
+    @classmethod
+    def _get_color_solutions_to_fit(cls, source: ColorRemap, destination: StagingPalette) -> Optional[List[List[Move]]]:
+        # Have we already solved for these exact colors into this exact palette?
+        # The fitting method is part of the key, as it changes the results.
+        cache = cls.s_nested_solve_cache
+        fitting_method = (cls.USE_MATCHING_FITTER, cls.MATCHING_FITTER_MAX_SOLUTIONS)
+        cache_key = (source.get_color_entries_signature(), destination.get_signature(), fitting_method)
+        solutions = cache.get(cache_key)
+        if solutions is None:
+            palette_colors = destination.color_entries
+
+            # Large palettes always use the fitter, since the number of ways to
+            # arrange colors in their empty entries is astronomical.
+            if cls.USE_MATCHING_FITTER or destination.is_large_palette():
+                fitter = ColorsIntoColorsFitter.create_for_staging_palette(source.color_entries, destination)
+                solutions = fitter.get_best_solutions(cls.MATCHING_FITTER_MAX_SOLUTIONS)
+            else:
+                # Take the colors in the source and execute a solver to map them to the palette's colors.
+                # If we were cut short before, resume where we left off.
+                solver = cls.s_suspended_nested_solvers.pop(cache_key)
+                if solver is None:
+                    solver = ConstraintSolver(source.color_entries, palette_colors, ColorsIntoColorsEvaluator, None)
+                while solver.run(cls.NESTED_SOLVE_STEPS_PER_TIME_SLICE_CHECK) != ConstraintSolver.RUN_RESULT_EXHAUSTED:
+                    if ConstraintSolver.is_time_slice_expired():
+                        cls.s_suspended_nested_solvers.put(cache_key, solver)
+                        raise ConstraintSolver.TimeSliceExpired()
+                solutions = solver.solutions
+
+            # The moves in each solution only refer to indices, so they are
+            # safe to share between remaps with the same colors.
+            cache.put(cache_key, solutions)
+
+        if len(solutions) == 0:
+            # No solutions means we can't fit.
+            return None
+
+        return solutions
+
+    @classmethod
+    def clear_nested_solve_cache(cls):
+        cls.s_nested_solve_cache.clear()
+        cls.s_suspended_nested_solvers.clear()
+
+    # Our solutions also depend on how the nested solves score colors.  The
+    # cache sizes and how often nested solves check the time don't change
+    # what's found.
+    @classmethod
+    def get_result_constants(cls) -> List[Tuple[str, object]]:
+        constants = Evaluator._get_class_constants(cls, ("NESTED_SOLVE_CACHE_MAX_ENTRIES", "SUSPENDED_NESTED_SOLVERS_MAX_ENTRIES", "NESTED_SOLVE_STEPS_PER_TIME_SLICE_CHECK"))
+        constants.extend(ColorsIntoColorsEvaluator.get_result_constants())
+        return constants
+
+    @staticmethod
+    def _get_color_mapping(change_list: 'ColorRemapsIntoStagingPalettesEvaluator.ChangeList') -> Mapping[int, int]:
+        # Returns a map of remap color indices -> palette color indices.
+        color_mapping = {}
+        for color_into_color_move in change_list.color_into_color_moves:
+            color_mapping[color_into_color_move.source_index] = color_into_color_move.dest_index
+        return color_mapping
+
     @staticmethod
     def _get_score_for_changes(change_list: 'ColorRemapsIntoStagingPalettesEvaluator.ChangeList') -> int:
         score = 0
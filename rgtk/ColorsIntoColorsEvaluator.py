@@ -2,6 +2,7 @@ import math
 from typing import List, Tuple, Optional
 from rgtk.ColorEntry import ColorEntry
 from rgtk.constraint_solver import Evaluator, Move
+from rgtk.LRUCache import LRUCache
 
 class ColorsIntoColorsEvaluator(Evaluator):
     # Static vars
@@ -18,6 +19,21 @@ class ColorsIntoColorsEvaluator(Evaluator):
     SCORE_ADJUST_ONLY_ONE_MOVE = -10000
     SCORE_ADJUST_FREE_MOVE = -math.inf
 
+    # Whether a source fits a destination only depends on their intention
+    # values, and a solve sees the same pairs over and over (every node
+    # starts from a copy of the same destinations).  So every evaluator
+    # shares one matrix of results, with a column per destination signature
+    # holding a (change list, cost, score) cell per source signature.  A
+    # dirty destination costs each source a lookup, and only pairs that are
+    # new get worked out.  ColorCompatibilityMatrix reads from it, too.
+    COMPATIBILITY_MATRIX_MAX_COLUMNS = 4096
+    s_compatibility_columns = LRUCache(COMPATIBILITY_MATRIX_MAX_COLUMNS)
+
+    # The solver asks every evaluator about a dirty destination in turn, so
+    # the (destination signature, column) last looked up is kept to hand.
+    # Held as one tuple, so that it's always replaced as a whole.
+    s_last_compatibility_column = (None, None)
+
     class PotentialMove:
         def __init__(self, move: Move, base_score: int):
             self.move = move
@@ -34,6 +50,10 @@ class ColorsIntoColorsEvaluator(Evaluator):
     def __init__(self, source_index: int, source: ColorEntry):
         super().__init__(source_index, source)
 
+        # Our row of the compatibility matrix.  Sources aren't altered while
+        # solving, so this doesn't change.
+        self._source_signature = source.intentions.get_signature()
+
         # Create a map of destination indices to potential moves.
         # For this situation (color to color), there aren't multiple possible
         # moves for each mapping:  we either fit or we don't.
@@ -89,15 +109,12 @@ class ColorsIntoColorsEvaluator(Evaluator):
         # In either event, start by assuming we won't get this to fit.
         self._destination_to_potential_move[destination_index] = None
 
-        change_list = self._get_changes_to_fit(destination)
+        change_list, _, score = ColorsIntoColorsEvaluator._get_compatibility(self._source_signature, destination.intentions.get_signature())
 
         if change_list is not None:
             # We can make a move!
             move = Move(self.source_index, destination_index, change_list)
 
-            # Get score based on changes
-            score = ColorsIntoColorsEvaluator._get_score_for_changes(change_list)
-
             potential_move = ColorsIntoColorsEvaluator.PotentialMove(move, score)
             self._destination_to_potential_move[destination_index] = potential_move
 
@@ -116,12 +133,75 @@ class ColorsIntoColorsEvaluator(Evaluator):
         # Returns True if the ColorEntry has nothing set.
         return destination.is_empty()
 
-    def _get_changes_to_fit(self, destination: ColorEntry) -> Optional['ColorsIntoColorsEvaluator.ChangeList']:
+    @classmethod
+    def encode_change_list(cls, change_list: 'ColorsIntoColorsEvaluator.ChangeList', source_index: int, dest_index: int, encoding: object) -> tuple:
+        # Intention names become their positions.
+        name_to_position = ColorEntry.s_intention_layout.name_to_position
+        return tuple((name_to_position[name], value) for name, value in change_list.intention_name_value_tuple_list)
+
+    @classmethod
+    def decode_change_list(cls, payload: tuple, source_index: int, dest_index: int, encoding: object) -> 'ColorsIntoColorsEvaluator.ChangeList':
+        names = ColorEntry.s_intention_layout.names
+        return ColorsIntoColorsEvaluator.ChangeList([(names[position], value) for position, value in payload])
+
+    def get_matching_move(self, previous_move: Move) -> Optional[Move]:
+        # There's only ever one way to move a color into another, so any move
+        # we have for that destination is equivalent.
+        potential_move = self._destination_to_potential_move.get(previous_move.dest_index)
+        if potential_move is None:
+            return None
+
+        return potential_move.move
+
+    # The cache size doesn't change what's found.
+    @classmethod
+    def get_result_constants(cls) -> List[Tuple[str, object]]:
+        return Evaluator._get_class_constants(cls, ("COMPATIBILITY_MATRIX_MAX_COLUMNS",))
+
+    @classmethod
+    def clear_compatibility_matrix(cls):
+        cls.s_compatibility_columns.clear()
+        cls.s_last_compatibility_column = (None, None)
+
+    # Returns the cell of the compatibility matrix for fitting a source with
+    # the first signature into a destination with the second, working it out
+    # if it's new:  the changes (None if it can't go there), their cost
+    # (math.inf if it can't) and the move's score.
+    @staticmethod
+    def _get_compatibility(src_values: tuple, dest_values: tuple) -> Tuple[Optional['ColorsIntoColorsEvaluator.ChangeList'], float, float]:
+        last_dest_values, column = ColorsIntoColorsEvaluator.s_last_compatibility_column
+        if dest_values is not last_dest_values:
+            columns = ColorsIntoColorsEvaluator.s_compatibility_columns
+            column = columns.get(dest_values)
+            if column is None:
+                column = {}
+                columns.put(dest_values, column)
+            ColorsIntoColorsEvaluator.s_last_compatibility_column = (dest_values, column)
+
+        cell = column.get(src_values)
+        if cell is None:
+            change_list = ColorsIntoColorsEvaluator._get_changes_for_signatures(src_values, dest_values)
+            if change_list is None:
+                cell = (None, math.inf, math.inf)
+            else:
+                cell = (change_list, ColorsIntoColorsEvaluator._get_cost_for_changes(change_list), ColorsIntoColorsEvaluator._get_score_for_changes(change_list))
+            column[src_values] = cell
+
+        return cell
+
+    # The changes only depend on the two entries' intention values, so they're
+    # worked out from signatures (see ColorEntry.get_signature()).
+    @staticmethod
+    def _get_changes_for_signatures(src_values: tuple, dest_values: tuple) -> Optional['ColorsIntoColorsEvaluator.ChangeList']:
+        if src_values == dest_values:
+            # Identical entries always match, with nothing to change.
+            return ColorsIntoColorsEvaluator.ChangeList([])
+
         changes = []
 
         # Test color
-        src_color = self.source.intentions.get_intention(ColorEntry.INTENTION_COLOR)
-        dest_color = destination.intentions.get_intention(ColorEntry.INTENTION_COLOR)
+        src_color = src_values[ColorEntry.POSITION_COLOR]
+        dest_color = dest_values[ColorEntry.POSITION_COLOR]
 
         # Cases:
         # 1. Both None:  OK to match, no changes
@@ -140,8 +220,8 @@ class ColorsIntoColorsEvaluator(Evaluator):
                     return None
 
         # Test slot
-        src_slot = self.source.intentions.get_intention(ColorEntry.INTENTION_SLOT)
-        dest_slot = destination.intentions.get_intention(ColorEntry.INTENTION_SLOT)
+        src_slot = src_values[ColorEntry.POSITION_SLOT]
+        dest_slot = dest_values[ColorEntry.POSITION_SLOT]
 
         # Cases:
         # 1. Both None:  OK to match, no changes
@@ -160,8 +240,8 @@ class ColorsIntoColorsEvaluator(Evaluator):
                     return None
 
         # Test name
-        src_name = self.source.intentions.get_intention(ColorEntry.INTENTION_NAME)
-        dest_name = destination.intentions.get_intention(ColorEntry.INTENTION_NAME)
+        src_name = src_values[ColorEntry.POSITION_NAME]
+        dest_name = dest_values[ColorEntry.POSITION_NAME]
 
         # Cases:
         # 1. Both None:  OK to match, no changes
@@ -190,6 +270,15 @@ class ColorsIntoColorsEvaluator(Evaluator):
 
         return ColorsIntoColorsEvaluator.ChangeList(changes)
 
+    # The sum of the changes' costs (see s_change_to_cost_map), so 0 when
+    # nothing needs changing.
+    @staticmethod
+    def _get_cost_for_changes(change_list: 'ColorsIntoColorsEvaluator.ChangeList') -> int:
+        cost = 0
+        for change in change_list.intention_name_value_tuple_list:
+            cost += ColorsIntoColorsEvaluator.s_change_to_cost_map[change[0]]
+        return cost
+
     @staticmethod
     def _get_score_for_changes(change_list: 'ColorsIntoColorsEvaluator.ChangeList') -> int:
         score = 0
@@ -0,0 +1,538 @@
+import heapq
+import math
+from typing import List, Optional, Tuple
+from rgtk.ColorCompatibilityMatrix import ColorCompatibilityMatrix
+from rgtk.ColorEntry import ColorEntry
+from rgtk.ColorsIntoColorsEvaluator import ColorsIntoColorsEvaluator
+from rgtk.constraint_solver import Move
+from rgtk.StagingPalette import StagingPalette
+
+# Fits a list of source ColorEntries into a list of destination ColorEntries
+# (e.g., a remap's colors into a StagingPalette) by treating it as an
+# assignment problem, rather than by enumerating every possibility with a
+# ConstraintSolver.  The cost of each source -> destination pairing is the
+# cost of the changes the ColorsIntoColorsEvaluator would make.
+#
+# Sources with identical intentions are grouped and sent to the same
+# destination, since a color only needs to appear in a palette once.  So
+# are sources that another source subsumes (e.g., red, when there's also
+# red in slot 3), as they can share its destination for free.
+#
+# Sources with a color can't share a destination any other way:  they'd
+# need the same color, compatible slots and the same name, and then one
+# subsumes the other.  So for them, the assignment finds the best fit there
+# is, and when it finds none, there is none.
+#
+# Sources without a color (e.g., slot 3, of any color) can share with
+# anything that doesn't contradict them, which an assignment can't express.
+# There are rarely more than a few, so each place they could go is tried
+# (see _place_groups()), and the rest of the sources are assigned around
+# them.  Between the two, the fitter never misses a fit.
+#
+# Destinations can optionally be pooled:  those with identical intentions
+# (most notably, the empty entries of a large palette) are interchangeable,
+# so they're treated as one destination with a capacity.  Otherwise, each
+# way of spreading sources across them would count as a distinct solution.
+# Pooled destinations are handed out lowest index first, leaving the final
+# order of colors to StagingPalette.create_final_palette_mapping().
+#
+# Solutions are returned in the same format as ConstraintSolver.solutions:
+# a list of Moves with ColorsIntoColorsEvaluator.ChangeLists.
+class ColorsIntoColorsFitter:
+    # Static vars
+    # Stands in for intention values that no group left to place has (see
+    # _get_placing_key()).
+    UNWANTED_VALUE = "<unwanted>"
+
+    def __init__(self, sources: List[ColorEntry], destinations: List[ColorEntry], pool_interchangeable_destinations: bool = False):
+        self.sources = sources
+        self.destinations = destinations
+
+        # The matrix groups sources by their intentions (each row is a set of
+        # identical sources) and works out the changes and cost of each row
+        # -> destination.  Rows are then grouped (see _create_groups()), and
+        # each group goes where its leading row goes.
+        self._matrix = ColorCompatibilityMatrix(sources, destinations)
+        self._group_rows, self._source_groups = self._create_groups()
+
+        # Groups led by a row with a color are assigned.  Those without are
+        # placed beforehand.
+        self._assigned_groups = []
+        self._placed_groups = []
+        for group_index, group_row in enumerate(self._group_rows):
+            if self._matrix.get_row_signature(group_row)[ColorEntry.POSITION_COLOR] is None:
+                self._placed_groups.append(group_index)
+            else:
+                self._assigned_groups.append(group_index)
+
+        # Destinations are assigned by class.  Each class is a list of
+        # destination indices that are interchangeable with one another.
+        self._dest_classes = []
+        if pool_interchangeable_destinations:
+            signature_to_class_index = {}
+            for dest_index, destination in enumerate(destinations):
+                signature = destination.get_signature()
+                class_index = signature_to_class_index.get(signature)
+                if class_index is None:
+                    class_index = len(self._dest_classes)
+                    signature_to_class_index[signature] = class_index
+                    self._dest_classes.append([])
+                self._dest_classes[class_index].append(dest_index)
+        else:
+            for dest_index in range(len(destinations)):
+                self._dest_classes.append([dest_index])
+
+        # We'll solve lazily, since callers may only want feasibility.
+        self._layouts = None
+        self._best_assignments = None
+
+    # The destinations left to assign to, once the groups without a color
+    # have been placed:  the classes (with each destination that was placed
+    # into split out of its class), the signatures those destinations have
+    # now, and the moves and cost of the placements.
+    class Layout:
+        def __init__(self, dest_classes: List[List[int]], dest_signatures: dict, moves: List[Move], cost: int, num_assigned_groups: int):
+            self.dest_classes = dest_classes
+            self.dest_signatures = dest_signatures
+            self.moves = moves
+            self.cost = cost
+
+            # Each class gets as many columns in the assignment as it could
+            # possibly use.
+            self.column_to_class_index = []
+            for class_index, dest_class in enumerate(dest_classes):
+                num_columns = min(len(dest_class), num_assigned_groups)
+                self.column_to_class_index.extend([class_index] * num_columns)
+
+    # Large palettes pool their interchangeable entries, as there are far
+    # too many ways to arrange colors among them otherwise.
+    @classmethod
+    def create_for_staging_palette(cls, sources: List[ColorEntry], staging_palette: StagingPalette) -> 'ColorsIntoColorsFitter':
+        return cls(sources, staging_palette.color_entries, staging_palette.is_large_palette())
+
+    def is_feasible(self) -> bool:
+        return len(self._get_best_assignments()) > 0
+
+    # Returns the minimum cost solution, or None if the sources can't fit.
+    def get_best_solution(self) -> Optional[List[Move]]:
+        best = None
+        for layout_index, assignment in self._get_best_assignments():
+            if (best is None) or (assignment[0] < best[1][0]):
+                best = (layout_index, assignment)
+
+        if best is None:
+            return None
+
+        return self._create_solution_for_assignment(self._get_layouts()[best[0]], best[1][1])
+
+    # Returns up to max_solutions solutions, from lowest cost to highest.
+    # This uses Murty's method of partitioning the solution space around
+    # each solution found, so each additional solution costs a handful of
+    # assignment solves rather than an enumeration.
+    def get_best_solutions(self, max_solutions: int) -> List[List[Move]]:
+        solutions = []
+
+        # Each heap entry is (cost, tie breaker, layout index, assignment,
+        # forced pairs, forbidden pairs).  Every layout starts out with its
+        # best assignment, so the heap's top is always the next best overall.
+        heap = []
+        tie_breaker = 0
+        for layout_index, best_assignment in self._get_best_assignments():
+            heap.append((best_assignment[0], tie_breaker, layout_index, best_assignment[1], [], []))
+            tie_breaker += 1
+        heapq.heapify(heap)
+
+        while len(heap) > 0:
+            cost, _, layout_index, assignment, forced_pairs, forbidden_pairs = heapq.heappop(heap)
+            layout = self._get_layouts()[layout_index]
+            solutions.append(self._create_solution_for_assignment(layout, assignment))
+            if len(solutions) >= max_solutions:
+                break
+
+            # Partition the remaining space:  each child forbids one of this
+            # assignment's pairs, while forcing the pairs that came before it.
+            forced_positions = set(pair[0] for pair in forced_pairs)
+            child_forced_pairs = list(forced_pairs)
+            for position, class_index in enumerate(assignment):
+                if position in forced_positions:
+                    continue
+
+                child_forbidden_pairs = forbidden_pairs + [(position, class_index)]
+                child_assignment = self._solve_assignment(layout, child_forced_pairs, child_forbidden_pairs)
+                if child_assignment is not None:
+                    heapq.heappush(heap, (child_assignment[0], tie_breaker, layout_index, child_assignment[1], list(child_forced_pairs), child_forbidden_pairs))
+                    tie_breaker += 1
+
+                child_forced_pairs.append((position, class_index))
+
+        return solutions
+
+    def _get_layouts(self) -> List['ColorsIntoColorsFitter.Layout']:
+        if self._layouts is None:
+            self._layouts = []
+            self._place_groups(0, self._dest_classes, {}, [], 0)
+
+        return self._layouts
+
+    # Returns (layout index, (cost, class per assigned group)) for each
+    # layout that the assigned groups fit.
+    def _get_best_assignments(self) -> List[Tuple[int, Tuple[int, List[int]]]]:
+        if self._best_assignments is None:
+            self._best_assignments = []
+            for layout_index, layout in enumerate(self._get_layouts()):
+                assignment = self._solve_assignment(layout, [], [])
+                if assignment is not None:
+                    self._best_assignments.append((layout_index, assignment))
+
+        return self._best_assignments
+
+    # Tries each place the group without a color at the position could go,
+    # then places the next, adding a Layout once they've all been placed.
+    # Places whose changes make no difference to any of the other groups are
+    # all alike to them, so only the cheapest of those is tried.  Likewise,
+    # places that look the same to the groups left to place, and where the
+    # assigned groups can't tell whether anything was placed, are tried once.
+    def _place_groups(self, position: int, dest_classes: List[List[int]], dest_signatures: dict, moves: List[Move], cost: int):
+        if position == len(self._placed_groups):
+            self._layouts.append(ColorsIntoColorsFitter.Layout(dest_classes, dest_signatures, moves, cost, len(self._assigned_groups)))
+            return
+
+        group_index = self._placed_groups[position]
+        other_signatures = [self._get_group_signature(other_group_index) for other_group_index in self._placed_groups[position + 1:] + self._assigned_groups]
+
+        placing_signatures = [self._get_group_signature(placing_group_index) for placing_group_index in self._placed_groups[position:]]
+        wanted_slots = set(signature[ColorEntry.POSITION_SLOT] for signature in placing_signatures)
+        wanted_names = set(signature[ColorEntry.POSITION_NAME] for signature in placing_signatures)
+        can_set_slot = any(signature[ColorEntry.POSITION_SLOT] is not None for signature in placing_signatures)
+        can_set_name = any(signature[ColorEntry.POSITION_NAME] is not None for signature in placing_signatures)
+
+        places = []
+        best_unnoticed_place = None
+        placing_keys = set()
+        for class_index, dest_class in enumerate(dest_classes):
+            dest_signature = self._get_dest_signature(dest_class[0], dest_signatures)
+            change_list, change_cost = self._get_changes(group_index, dest_class[0], dest_signatures)
+            if change_list is None:
+                continue
+
+            place = (class_index, dest_signature, change_list, change_cost)
+            if ColorsIntoColorsFitter._is_change_unnoticed(dest_signature, change_list, other_signatures):
+                if (best_unnoticed_place is None) or (change_cost < best_unnoticed_place[3]):
+                    best_unnoticed_place = place
+            elif self._is_hidden_from_assigned_groups(dest_signature, can_set_slot, can_set_name):
+                placing_key = ColorsIntoColorsFitter._get_placing_key(dest_signature, wanted_slots, wanted_names)
+                if placing_key not in placing_keys:
+                    placing_keys.add(placing_key)
+                    places.append(place)
+            else:
+                places.append(place)
+
+        if best_unnoticed_place is not None:
+            places.append(best_unnoticed_place)
+            places.sort(key=lambda place: place[0])
+
+        for class_index, dest_signature, change_list, change_cost in places:
+            # The destination leaves its class, as it may no longer be
+            # interchangeable with the rest.
+            dest_class = dest_classes[class_index]
+            dest_index = dest_class[0]
+            child_classes = dest_classes[:class_index] + [[dest_index]]
+            if len(dest_class) > 1:
+                child_classes.append(dest_class[1:])
+            child_classes.extend(dest_classes[class_index + 1:])
+
+            child_signatures = dict(dest_signatures)
+            child_signatures[dest_index] = ColorsIntoColorsFitter._get_signature_after_changes(dest_signature, change_list)
+
+            child_moves = moves + self._create_moves_for_group(group_index, dest_index, change_list)
+            self._place_groups(position + 1, child_classes, child_signatures, child_moves, cost + change_cost)
+
+    def _create_solution_for_assignment(self, layout: 'ColorsIntoColorsFitter.Layout', assignment: List[int]) -> List[Move]:
+        # Hand out each class's destinations in order.
+        class_index_to_num_used = [0] * len(layout.dest_classes)
+
+        moves = list(layout.moves)
+        for position, class_index in enumerate(assignment):
+            dest_index = layout.dest_classes[class_index][class_index_to_num_used[class_index]]
+            class_index_to_num_used[class_index] += 1
+
+            group_index = self._assigned_groups[position]
+            change_list, _ = self._get_changes(group_index, dest_index, layout.dest_signatures)
+            moves.extend(self._create_moves_for_group(group_index, dest_index, change_list))
+
+        # Keep moves in source order so that solutions are deterministic.
+        moves.sort(key=lambda move: move.source_index)
+        return moves
+
+    def _create_moves_for_group(self, group_index: int, dest_index: int, change_list: 'ColorsIntoColorsEvaluator.ChangeList') -> List[Move]:
+        # The first source in a group makes the changes.  The rest then
+        # fit the destination without changes of their own.
+        moves = []
+        for member_idx, source_index in enumerate(self._source_groups[group_index]):
+            if member_idx == 0:
+                moves.append(Move(source_index, dest_index, change_list))
+            else:
+                moves.append(Move(source_index, dest_index, ColorsIntoColorsEvaluator.ChangeList([])))
+        return moves
+
+    def _get_group_signature(self, group_index: int) -> tuple:
+        return self._matrix.get_row_signature(self._group_rows[group_index])
+
+    # Destinations that have been placed into have new signatures.
+    def _get_dest_signature(self, dest_index: int, dest_signatures: dict) -> tuple:
+        dest_signature = dest_signatures.get(dest_index)
+        if dest_signature is None:
+            return self.destinations[dest_index].get_signature()
+        return dest_signature
+
+    # Returns (change list, cost) to fit the group into the destination, with
+    # a change list of None if it can't go there.
+    def _get_changes(self, group_index: int, dest_index: int, dest_signatures: dict) -> Tuple[Optional['ColorsIntoColorsEvaluator.ChangeList'], float]:
+        row = self._group_rows[group_index]
+        dest_signature = dest_signatures.get(dest_index)
+        if dest_signature is None:
+            return (self._matrix.get_change_list(row, dest_index), self._matrix.get_cost(row, dest_index))
+
+        change_list, cost, _ = ColorsIntoColorsEvaluator._get_compatibility(self._matrix.get_row_signature(row), dest_signature)
+        return (change_list, cost)
+
+    # Returns the leading row of each group, and the source indices in each
+    # group (the leading row's first).  A row joins a group if the group's
+    # leading row subsumes it:  once the leading row's changes are made, the
+    # destination fits this row without any changes.  That never costs more
+    # than sending it elsewhere, and leaves more destinations free.
+    def _create_groups(self) -> Tuple[List[int], List[List[int]]]:
+        num_rows = self._matrix.get_num_rows()
+
+        # Most specific rows first, so that each group is led by the row
+        # whose changes cover the others.
+        row_order = sorted(range(num_rows), key=lambda row: -ColorsIntoColorsFitter._get_num_intentions_set(self._matrix.get_row_signature(row)))
+
+        group_rows = []
+        group_to_rows = []
+        for row in row_order:
+            signature = self._matrix.get_row_signature(row)
+            for group_index, group_row in enumerate(group_rows):
+                if ColorsIntoColorsFitter._is_subsumed_by(signature, self._matrix.get_row_signature(group_row)):
+                    group_to_rows[group_index].append(row)
+                    break
+            else:
+                group_rows.append(row)
+                group_to_rows.append([row])
+
+        # Keep groups in the order their leading rows were first seen, so
+        # that ties are broken the same way as without grouping.
+        group_order = sorted(range(len(group_rows)), key=lambda group_index: group_rows[group_index])
+
+        source_groups = []
+        for group_index in group_order:
+            source_indices = []
+            for row in group_to_rows[group_index]:
+                source_indices.extend(self._matrix.get_row_source_indices(row))
+            source_groups.append(source_indices)
+
+        return ([group_rows[group_index] for group_index in group_order], source_groups)
+
+    # The intentions that decide where an entry fits (see
+    # ColorsIntoColorsEvaluator._get_changes_for_signatures()).
+    @staticmethod
+    def _get_num_intentions_set(signature: tuple) -> int:
+        num_set = 0
+        for position in [ColorEntry.POSITION_COLOR, ColorEntry.POSITION_SLOT, ColorEntry.POSITION_NAME]:
+            if signature[position] is not None:
+                num_set += 1
+        return num_set
+
+    # True if an entry with the signature fits, unchanged, anywhere an entry
+    # with by_signature has been fit.
+    @staticmethod
+    def _is_subsumed_by(signature: tuple, by_signature: tuple) -> bool:
+        for position in [ColorEntry.POSITION_COLOR, ColorEntry.POSITION_SLOT]:
+            if (signature[position] is not None) and (signature[position] != by_signature[position]):
+                return False
+
+        # Names must match exactly, as an entry with a name only takes
+        # sources with the same name.
+        return signature[ColorEntry.POSITION_NAME] == by_signature[ColorEntry.POSITION_NAME]
+
+    # True if making the changes to the destination can't make a difference
+    # to any of the other signatures:  each one either can't go there anyway
+    # (and never will, since changes only ever narrow what fits), or has
+    # none of the intentions being set.
+    @staticmethod
+    def _is_change_unnoticed(dest_signature: tuple, change_list: 'ColorsIntoColorsEvaluator.ChangeList', other_signatures: List[tuple]) -> bool:
+        changed_positions = [ColorEntry.s_intention_layout.name_to_position[change[0]] for change in change_list.intention_name_value_tuple_list]
+        if len(changed_positions) == 0:
+            return True
+
+        # A named entry only goes into a destination with no color or slot,
+        # which won't be the case after any change.
+        is_dest_blank = (dest_signature[ColorEntry.POSITION_COLOR] is None) and (dest_signature[ColorEntry.POSITION_SLOT] is None)
+
+        for other_signature in other_signatures:
+            if ColorsIntoColorsEvaluator._get_compatibility(other_signature, dest_signature)[0] is None:
+                continue
+
+            # Giving the destination a name shuts out everything without it.
+            if ColorEntry.POSITION_NAME in changed_positions:
+                return False
+            for changed_position in changed_positions:
+                if other_signature[changed_position] is not None:
+                    return False
+            if is_dest_blank and (other_signature[ColorEntry.POSITION_NAME] is not None):
+                return False
+
+        return True
+
+    # True if nothing the groups without a color do to the destination can
+    # make a difference to the assigned groups:  each one either can't go
+    # there anyway, or has no slot (the only intention that the others could
+    # set, besides the name of a blank destination).
+    def _is_hidden_from_assigned_groups(self, dest_signature: tuple, can_set_slot: bool, can_set_name: bool) -> bool:
+        is_dest_blank = (dest_signature[ColorEntry.POSITION_COLOR] is None) and (dest_signature[ColorEntry.POSITION_SLOT] is None) and (dest_signature[ColorEntry.POSITION_NAME] is None)
+
+        for group_index in self._assigned_groups:
+            signature = self._get_group_signature(group_index)
+            if ColorsIntoColorsEvaluator._get_compatibility(signature, dest_signature)[0] is None:
+                continue
+
+            if can_set_slot and (signature[ColorEntry.POSITION_SLOT] is not None):
+                return False
+            if can_set_name and is_dest_blank:
+                return False
+
+        return True
+
+    # Groups without a color only care whether a destination has one, not
+    # what it is, and only about the slots and names they have themselves.
+    # So destinations with the same key are alike to them.
+    @staticmethod
+    def _get_placing_key(dest_signature: tuple, wanted_slots: set, wanted_names: set) -> tuple:
+        values = list(dest_signature)
+        if values[ColorEntry.POSITION_COLOR] is not None:
+            values[ColorEntry.POSITION_COLOR] = ColorsIntoColorsFitter.UNWANTED_VALUE
+        if (values[ColorEntry.POSITION_SLOT] is not None) and (values[ColorEntry.POSITION_SLOT] not in wanted_slots):
+            values[ColorEntry.POSITION_SLOT] = ColorsIntoColorsFitter.UNWANTED_VALUE
+        if (values[ColorEntry.POSITION_NAME] is not None) and (values[ColorEntry.POSITION_NAME] not in wanted_names):
+            values[ColorEntry.POSITION_NAME] = ColorsIntoColorsFitter.UNWANTED_VALUE
+        return tuple(values)
+
+    @staticmethod
+    def _get_signature_after_changes(signature: tuple, change_list: 'ColorsIntoColorsEvaluator.ChangeList') -> tuple:
+        values = list(signature)
+        for intention_name, value in change_list.intention_name_value_tuple_list:
+            values[ColorEntry.s_intention_layout.name_to_position[intention_name]] = value
+        return tuple(values)
+
+    # Solves the assignment of the assigned groups -> the layout's
+    # destination classes with some pairs forced and others forbidden.  Pairs
+    # are (position in the assigned groups, class index).  Returns (cost,
+    # including the layout's, class per assigned group) or None.
+    def _solve_assignment(self, layout: 'ColorsIntoColorsFitter.Layout', forced_pairs: List[Tuple[int, int]], forbidden_pairs: List[Tuple[int, int]]) -> Optional[Tuple[int, List[int]]]:
+        num_groups = len(self._assigned_groups)
+        num_columns = len(layout.column_to_class_index)
+        if num_groups == 0:
+            return (layout.cost, [])
+        if num_groups > num_columns:
+            return None
+
+        # Every destination in a class costs the same, so use the first.
+        costs = []
+        for group_index in self._assigned_groups:
+            class_costs = [self._get_changes(group_index, dest_class[0], layout.dest_signatures)[1] for dest_class in layout.dest_classes]
+            costs.append([class_costs[class_index] for class_index in layout.column_to_class_index])
+
+        for position, class_index in forbidden_pairs:
+            for column, column_class_index in enumerate(layout.column_to_class_index):
+                if column_class_index == class_index:
+                    costs[position][column] = math.inf
+        for position, class_index in forced_pairs:
+            for column, column_class_index in enumerate(layout.column_to_class_index):
+                if column_class_index != class_index:
+                    costs[position][column] = math.inf
+
+        assignment = ColorsIntoColorsFitter._solve_min_cost_assignment(costs, num_groups, num_columns)
+        if assignment is None:
+            return None
+
+        total_cost = layout.cost
+        for position, column in enumerate(assignment):
+            total_cost += costs[position][column]
+
+        return (total_cost, [layout.column_to_class_index[column] for column in assignment])
+
+    # The Hungarian method for a rectangular cost matrix (rows <= columns),
+    # using row/column potentials.  Runs in O(rows^2 * columns).
+    # Returns the column assigned to each row, or None if no assignment
+    # avoids an infinite cost.
+    @staticmethod
+    def _solve_min_cost_assignment(costs: List[List[float]], num_rows: int, num_cols: int) -> Optional[List[int]]:
+        # Infinite costs would break the potentials, so use a large finite
+        # value instead and reject any assignment that relies on it.
+        max_cost = 0
+        for cost_row in costs:
+            for cost in cost_row:
+                if cost != math.inf:
+                    max_cost = max(max_cost, cost)
+        blocked_cost = (max_cost + 1) * (num_rows + 1)
+
+        # Potentials are 1-based, with index 0 as a sentinel.
+        row_potentials = [0] * (num_rows + 1)
+        col_potentials = [0] * (num_cols + 1)
+        col_to_row = [0] * (num_cols + 1)
+        col_way = [0] * (num_cols + 1)
+
+        for row in range(1, num_rows + 1):
+            col_to_row[0] = row
+            curr_col = 0
+            min_slack = [math.inf] * (num_cols + 1)
+            col_used = [False] * (num_cols + 1)
+
+            while True:
+                col_used[curr_col] = True
+                curr_row = col_to_row[curr_col]
+                delta = math.inf
+                next_col = 0
+
+                cost_row = costs[curr_row - 1]
+                for col in range(1, num_cols + 1):
+                    if col_used[col] == False:
+                        cost = cost_row[col - 1]
+                        if cost == math.inf:
+                            cost = blocked_cost
+
+                        slack = cost - row_potentials[curr_row] - col_potentials[col]
+                        if slack < min_slack[col]:
+                            min_slack[col] = slack
+                            col_way[col] = curr_col
+                        if min_slack[col] < delta:
+                            delta = min_slack[col]
+                            next_col = col
+
+                for col in range(num_cols + 1):
+                    if col_used[col]:
+                        row_potentials[col_to_row[col]] += delta
+                        col_potentials[col] -= delta
+                    else:
+                        min_slack[col] -= delta
+
+                curr_col = next_col
+                if col_to_row[curr_col] == 0:
+                    break
+
+            # Walk back along the augmenting path.
+            while curr_col != 0:
+                prev_col = col_way[curr_col]
+                col_to_row[curr_col] = col_to_row[prev_col]
+                curr_col = prev_col
+
+        assignment = [None] * num_rows
+        for col in range(1, num_cols + 1):
+            if col_to_row[col] != 0:
+                assignment[col_to_row[col] - 1] = col - 1
+
+        for row, col in enumerate(assignment):
+            if costs[row][col] == math.inf:
+                return None
+
+        return assignment
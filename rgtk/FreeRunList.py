@@ -0,0 +1,92 @@
+import bisect
+from typing import List, Optional, Tuple
+from rgtk.BitSet import BitSet
+
+# The runs of clear ("free") bits in a BitSet, kept sorted so that questions
+# like "which free runs overlap this range?" and "how big is the free run
+# around this bit?" are answered with a binary search rather than a scan.
+#
+# Think of it as a VRAM allocator's free list:  allocating a range splits
+# or trims the run it lands in.  Free run lists are never changed once
+# created (allocating returns a new one), so they can be shared by every
+# BitSet with the same contents.
+#
+# Runs are (begin, end), INCLUSIVE, like Intervals.
+class FreeRunList:
+    def __init__(self, num_bits: int, run_begins: List[int], run_ends: List[int]):
+        self._num_bits = num_bits
+        self._run_begins = run_begins
+        self._run_ends = run_ends
+
+    @classmethod
+    def create_from_bitset(cls, bitset: BitSet) -> 'FreeRunList':
+        num_bits = bitset.get_num_bits()
+        all_on = (1 << num_bits) - 1
+
+        run_begins = []
+        run_ends = []
+
+        # Walk the clear bits a run at a time, rather than bit by bit.
+        clear_bits = ~bitset.get_value() & all_on
+        while clear_bits != 0:
+            run_begin = (clear_bits & -clear_bits).bit_length() - 1
+
+            # Count the ones starting at the run's beginning.
+            shifted = clear_bits >> run_begin
+            run_length = (shifted ^ (shifted + 1)).bit_length() - 1
+
+            run_begins.append(run_begin)
+            run_ends.append(run_begin + run_length - 1)
+
+            clear_bits &= ~(((1 << run_length) - 1) << run_begin)
+
+        return cls(num_bits, run_begins, run_ends)
+
+    def get_num_bits(self) -> int:
+        return self._num_bits
+
+    def get_num_runs(self) -> int:
+        return len(self._run_begins)
+
+    # Returns the (begin, end) of every free run that overlaps begin..end.
+    def get_runs_overlapping(self, begin: int, end: int) -> List[Tuple[int, int]]:
+        runs = []
+
+        # The first run that ends at or after our beginning.
+        run_idx = bisect.bisect_left(self._run_ends, begin)
+        while (run_idx < len(self._run_begins)) and (self._run_begins[run_idx] <= end):
+            runs.append((self._run_begins[run_idx], self._run_ends[run_idx]))
+            run_idx += 1
+
+        return runs
+
+    # Returns the (begin, end) of the free run containing the bit, or None
+    # if the bit is set.
+    def get_run_containing(self, bit_idx: int) -> Optional[Tuple[int, int]]:
+        run_idx = bisect.bisect_left(self._run_ends, bit_idx)
+        if (run_idx < len(self._run_begins)) and (self._run_begins[run_idx] <= bit_idx):
+            return (self._run_begins[run_idx], self._run_ends[run_idx])
+        return None
+
+    # Returns a new list with begin..end (INCLUSIVE) allocated, i.e., no
+    # longer free.  Any of the range that is already allocated is ignored.
+    def create_with_allocated(self, begin: int, end: int) -> 'FreeRunList':
+        first_run_idx = bisect.bisect_left(self._run_ends, begin)
+        last_run_idx = first_run_idx
+        while (last_run_idx < len(self._run_begins)) and (self._run_begins[last_run_idx] <= end):
+            last_run_idx += 1
+
+        # Whatever sticks out on either side of the allocation survives.
+        replacement_begins = []
+        replacement_ends = []
+        if first_run_idx < last_run_idx:
+            if self._run_begins[first_run_idx] < begin:
+                replacement_begins.append(self._run_begins[first_run_idx])
+                replacement_ends.append(begin - 1)
+            if self._run_ends[last_run_idx - 1] > end:
+                replacement_begins.append(end + 1)
+                replacement_ends.append(self._run_ends[last_run_idx - 1])
+
+        run_begins = self._run_begins[:first_run_idx] + replacement_begins + self._run_begins[last_run_idx:]
+        run_ends = self._run_ends[:first_run_idx] + replacement_ends + self._run_ends[last_run_idx:]
+        return FreeRunList(self._num_bits, run_begins, run_ends)
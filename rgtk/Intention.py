@@ -14,42 +14,88 @@ class IntentionAlreadyAssignedError(Exception):
         self.desired_value = desired_value
 
 
+# The fixed, positional layout of the intentions in a definition map.  Every
+# collection built from the same map shares one layout, so each collection
+# only needs to hold a tuple of values.
+class IntentionLayout:
+    __slots__ = ("def_map", "names", "name_to_position", "required_positions", "empty_values")
+
+    # Static vars
+    # Definition maps are class-level constants, so we key on their identity.
+    s_def_map_id_to_layout = {}
+
+    @classmethod
+    def get_for_def_map(cls, def_map: Mapping[str, IntentionDefinition]) -> 'IntentionLayout':
+        layout = cls.s_def_map_id_to_layout.get(id(def_map))
+        if (layout is None) or (layout.def_map is not def_map):
+            layout = cls(def_map)
+            cls.s_def_map_id_to_layout[id(def_map)] = layout
+        return layout
+
+    def __init__(self, def_map: Mapping[str, IntentionDefinition]):
+        # Hold onto the map so that its id can't be reused while we're cached.
+        self.def_map = def_map
+        self.names = tuple(def_map.keys())
+        self.name_to_position = {name: position for position, name in enumerate(self.names)}
+        self.required_positions = tuple(position for position, name in enumerate(self.names) if def_map[name].is_required)
+        self.empty_values = (None,) * len(self.names)
+
+    # Layouts never change, so copies can share them.
+    def __copy__(self) -> 'IntentionLayout':
+        return self
+
+    def __deepcopy__(self, memo) -> 'IntentionLayout':
+        return self
+
+
+# Intention values are kept in a tuple, in the order of the definition map.
+# Setting an intention replaces the tuple rather than changing it, so copies
+# can share their values until one of them changes.
 class IntentionCollection:
+    __slots__ = ("_layout", "_values")
+
     def __init__(self, intentions_def_map: Mapping[str, object]):
-        self._intentions = {}
-        self._intentions_def_map = intentions_def_map
-        # Create keys for each intention in this entry.
-        for prop in self._intentions_def_map.keys():
-            self._intentions[prop] = None
+        self._layout = IntentionLayout.get_for_def_map(intentions_def_map)
+        self._values = self._layout.empty_values
 
     @classmethod
     def copy_construct_from(cls, rhs: 'IntentionCollection') -> 'IntentionCollection':
-        new_intentions = cls(rhs._intentions_def_map)
-        for prop_name in rhs._intentions_def_map:
-            val = rhs.get_intention(prop_name)
-            if val is not None:
-                new_intentions.attempt_set_intention(prop_name, val)
+        new_intentions = cls(rhs._layout.def_map)
+        new_intentions._values = rhs._values
         return new_intentions
 
+    def get_layout(self) -> IntentionLayout:
+        return self._layout
+
+    # Returns a hashable snapshot of all intention values, in the order
+    # they appear in the definition map.
+    def get_signature(self) -> tuple:
+        return self._values
+
     def get_intention(self, intention_name: str) -> object:
-        return self._intentions[intention_name]
+        return self._values[self._layout.name_to_position[intention_name]]
 
     def attempt_set_intention(self, intention_name: str, desired_value: object):
-        current_value = self._intentions[intention_name]
+        position = self._layout.name_to_position[intention_name]
+        current_value = self._values[position]
         if desired_value is None or desired_value == current_value:
             return False
         if current_value is not None:
             raise IntentionAlreadyAssignedError(intention_name, self, current_value, desired_value)
         else:
-            self._intentions[intention_name] = desired_value
+            values = list(self._values)
+            values[position] = desired_value
+            self._values = tuple(values)
             return True
 
+    def is_empty(self) -> bool:
+        # Empty if no intentions are set at all.
+        return self._values == self._layout.empty_values
+
     def is_complete(self) -> bool:
         # Are *all* required intentions fulfilled?
-        for name, prop_def in self._intentions_def_map:
-            if prop_def.is_required:
-                if self._intentions[name] is None:
-                    # We can short circuit on the first empty required intention.
-                    return False
+        for position in self._layout.required_positions:
+            if self._values[position] is None:
+                # We can short circuit on the first empty required intention.
+                return False
         return True
-        
@@ -1,3 +1,5 @@
+from typing import Optional
+
 # Thrown when the begin is less than the end.
 class IntervalIncorrectOrderError(Exception):
     def __init__(self, begin, end):
@@ -13,6 +15,16 @@ class IntervalInvalidLengthError(Exception):
         self.end = end
         self.length = length
 
+# Thrown when the alignment is < 1, or when the length
+# can't fit within a bank (or no aligned position does).
+class IntervalInvalidPlacementConstraintError(Exception):
+    def __init__(self, begin, end, length, alignment, bank_size):
+        self.begin = begin
+        self.end = end
+        self.length = length
+        self.alignment = alignment
+        self.bank_size = bank_size
+
 # The interval class represents a range of values, with
 # a length value defining how much space is required
 # within that range.  For example, you may only need
@@ -20,11 +32,19 @@ class IntervalInvalidLengthError(Exception):
 # the range of 0 to 10.  If you need a fixed position,
 # length should be precisely the range of begin -> end.
 # Note that begin and end are INCLUSIVE.
+#
+# Placements can be further constrained for hardware that needs them:
+#   alignment:  the first value must be a multiple of this (e.g., sprite
+#               patterns that must start on a 2 or 4 tile boundary).
+#   bank_size:  the values are divided into banks of this size, and a
+#               placement may not straddle two banks.  None for no banks.
 class Interval:
-    def __init__(self, begin: int, end: int, length: int):
+    def __init__(self, begin: int, end: int, length: int, alignment: int = 1, bank_size: Optional[int] = None):
         self.begin = begin
         self.end = end
         self.length = length
+        self.alignment = alignment
+        self.bank_size = bank_size
 
         if end < begin:
             raise IntervalIncorrectOrderError(begin, end)
@@ -33,6 +53,54 @@ class Interval:
         if (total_range < length) or (length <= 0):
             raise IntervalInvalidLengthError(begin, end, length)
 
+        if (alignment < 1) or ((bank_size is not None) and (bank_size < length)):
+            raise IntervalInvalidPlacementConstraintError(begin, end, length, alignment, bank_size)
+
+        if self.get_first_valid_start(begin, end) is None:
+            raise IntervalInvalidPlacementConstraintError(begin, end, length, alignment, bank_size)
+
+    def has_placement_constraints(self) -> bool:
+        return (self.alignment != 1) or (self.bank_size is not None)
+
+    # Returns the lowest start within first..last (INCLUSIVE) where the
+    # whole length fits, honoring alignment and banks.  None if none do.
+    def get_first_valid_start(self, first: int, last: int) -> Optional[int]:
+        start = first
+        while True:
+            # Round up to our alignment.
+            start = ((start + self.alignment - 1) // self.alignment) * self.alignment
+            if start + self.length - 1 > last:
+                return None
+
+            if self.bank_size is None:
+                return start
+
+            # Would we straddle a bank?  If so, try the start of the next one.
+            bank_end = ((start // self.bank_size) + 1) * self.bank_size - 1
+            if start + self.length - 1 <= bank_end:
+                return start
+            start = bank_end + 1
+
+    # Returns the highest start within first..last (INCLUSIVE) where the
+    # whole length fits, honoring alignment and banks.  None if none do.
+    def get_last_valid_start(self, first: int, last: int) -> Optional[int]:
+        end = last
+        while True:
+            # Round down to our alignment.
+            start = ((end - self.length + 1) // self.alignment) * self.alignment
+            if start < first:
+                return None
+
+            if self.bank_size is None:
+                return start
+
+            # Would we straddle a bank?  If so, try the end of the previous one.
+            bank_begin = (start // self.bank_size) * self.bank_size
+            bank_end = bank_begin + self.bank_size - 1
+            if start + self.length - 1 <= bank_end:
+                return start
+            end = bank_end
+
     @classmethod
     def create_fixed_length_at_start_point(cls, begin: int, length: int) -> 'Interval':
         end = begin + length - 1
@@ -3,6 +3,8 @@ from typing import List, Tuple, Optional
 from rgtk.constraint_solver import ConstraintSolver, Evaluator, Move
 from rgtk.Interval import Interval
 from rgtk.BitSet import BitSet
+from rgtk.FreeRunList import FreeRunList
+from rgtk.LRUCache import LRUCache
 
 class IntervalsToBitSetsEvaluator(Evaluator):
     # Static Vars
@@ -26,6 +28,13 @@ class IntervalsToBitSetsEvaluator(Evaluator):
     # a bunch of tiny fragments.
     SCORE_PER_FRAGMENT_SIZE = -1
 
+    # Finding where an interval can go means knowing the destination's free
+    # runs.  Rather than scanning the bits each time, we keep a FreeRunList
+    # per distinct BitSet contents (destinations get copied a lot while
+    # solving, but their contents repeat), and update it as bits are set.
+    FREE_RUN_LIST_CACHE_MAX_ENTRIES = 4096
+    s_free_run_list_cache = LRUCache(FREE_RUN_LIST_CACHE_MAX_ENTRIES)
+
     class PotentialMove:
         def __init__(self, move: Move, base_score: int, smallest_fragment: int, largest_fragment: int):
             self.move = move
@@ -45,6 +54,15 @@ class IntervalsToBitSetsEvaluator(Evaluator):
     def factory_constructor(cls, source_index: int, source: Interval) -> 'IntervalsToBitSetsEvaluator':
         return IntervalsToBitSetsEvaluator(source_index, source)
 
+    @classmethod
+    def clear_free_run_list_cache(cls):
+        cls.s_free_run_list_cache.clear()
+
+    # The cache size doesn't change what's found.
+    @classmethod
+    def get_result_constants(cls) -> List[Tuple[str, object]]:
+        return Evaluator._get_class_constants(cls, ("FREE_RUN_LIST_CACHE_MAX_ENTRIES",))
+
     def __init__(self, source_index: int, source: Interval):
         super().__init__(source_index, source)
 
@@ -115,14 +133,53 @@ class IntervalsToBitSetsEvaluator(Evaluator):
 
     @staticmethod
     def apply_changes(source: Interval, destination: BitSet, change_list: 'IntervalsToBitSetsEvaluator.ChangeList'):
+        cache = IntervalsToBitSetsEvaluator.s_free_run_list_cache
+        free_run_list = cache.get((destination.get_num_bits(), destination.get_value()))
+
         # Apply our changes, which is a run of bits to set.
-        for bit_idx in range(change_list.chosen_interval.begin, change_list.chosen_interval.end + 1):
-            destination.set_bit(bit_idx)
+        chosen_interval = change_list.chosen_interval
+        destination.set_range(chosen_interval.begin, chosen_interval.end)
+
+        # If we knew the free runs before, it's cheap to know them after.
+        if free_run_list is not None:
+            cache.put((destination.get_num_bits(), destination.get_value()), free_run_list.create_with_allocated(chosen_interval.begin, chosen_interval.end))
+
+    @staticmethod
+    def _encode_interval(interval: Interval) -> tuple:
+        return (interval.begin, interval.end, interval.length, interval.alignment, interval.bank_size)
+
+    @staticmethod
+    def _decode_interval(encoded_interval: tuple) -> Interval:
+        begin, end, length, alignment, bank_size = encoded_interval
+        return Interval(begin=begin, end=end, length=length, alignment=alignment, bank_size=bank_size)
 
     @staticmethod
     def is_destination_empty(destination: BitSet) -> bool:
         return destination.are_all_clear()
 
+    @classmethod
+    def encode_change_list(cls, change_list: 'IntervalsToBitSetsEvaluator.ChangeList', source_index: int, dest_index: int, encoding: object) -> tuple:
+        return (IntervalsToBitSetsEvaluator._encode_interval(change_list.possible_interval), IntervalsToBitSetsEvaluator._encode_interval(change_list.chosen_interval))
+
+    @classmethod
+    def decode_change_list(cls, payload: tuple, source_index: int, dest_index: int, encoding: object) -> 'IntervalsToBitSetsEvaluator.ChangeList':
+        return IntervalsToBitSetsEvaluator.ChangeList(IntervalsToBitSetsEvaluator._decode_interval(payload[0]), IntervalsToBitSetsEvaluator._decode_interval(payload[1]))
+
+    def get_matching_move(self, previous_move: Move) -> Optional[Move]:
+        potential_move_list = self._destination_to_potential_move_list.get(previous_move.dest_index)
+        if potential_move_list is None:
+            return None
+
+        # We only consider the best spot within each free run, so the previous
+        # placement is only valid if we'd still choose exactly the same bits.
+        previous_chosen_interval = previous_move.change_list.chosen_interval
+        for potential_move in potential_move_list:
+            chosen_interval = potential_move.move.change_list.chosen_interval
+            if (chosen_interval.begin == previous_chosen_interval.begin) and (chosen_interval.end == previous_chosen_interval.end):
+                return potential_move.move
+
+        return None
+
     def _get_changes_to_fit(self, destination_index: int, destination: BitSet) -> Tuple[List['IntervalsToBitSetsEvaluator.ChangeList'], List[Tuple[int, int]]]:
         change_lists = []
         fragment_infos = []
@@ -137,38 +194,47 @@ class IntervalsToBitSetsEvaluator(Evaluator):
 
         source_len = self.source.length
 
-        # We'll start at the range's beginning, and stop when we either go off the BitSet or hit the end range.
-        curr_clear_bit_idx = destination.get_next_unset_bit_index(range_start_idx)
-        while (curr_clear_bit_idx is not None) and (curr_clear_bit_idx <= range_end_idx):
-            # We are on a zero within the begin..end range of our source's interval.
-
-            # Find the next one value, which will bound our search.
-            next_set_bit_idx = destination.get_next_set_bit_index(curr_clear_bit_idx)
-            if next_set_bit_idx is None:
-                # If we ran off the edge, set the bound at the last value.
-                next_set_bit_idx = destination.get_num_bits()
-            
-            if next_set_bit_idx > range_end_idx:
-                # Make it bound to our top end of the range.
-                next_set_bit_idx = range_end_idx + 1
-            
-            # How big is this new interval?
-            possible_interval = Interval.create_from_fixed_range(curr_clear_bit_idx, next_set_bit_idx - 1)
-            if possible_interval.length >= source_len:
-                # Our interval will fit within this one.  Now pick an interval *within* the possible
-                # that fits our source and introduces the least fragmentation.
-                change_list_fragment_info = self._get_best_change_list_for_possible_interval(possible_interval, destination)
+        # Visit each free run that overlaps the begin..end range of our source's interval.
+        free_run_list = IntervalsToBitSetsEvaluator._get_free_run_list(destination)
+        for free_run in free_run_list.get_runs_overlapping(range_start_idx, range_end_idx):
+            # Clip the run to our range.
+            possible_begin = max(free_run[0], range_start_idx)
+            possible_end = min(free_run[1], range_end_idx)
+            if possible_end - possible_begin + 1 < source_len:
+                # Too small for us.
+                continue
+
+            # Find the valid placements, honoring alignment and banks.  A run
+            # spanning banks is treated as one run per bank, since we can't
+            # straddle them.
+            first_start = self.source.get_first_valid_start(possible_begin, possible_end)
+            while first_start is not None:
+                segment_end = possible_end
+                usable_run = free_run
+                if self.source.bank_size is not None:
+                    bank_begin = (first_start // self.source.bank_size) * self.source.bank_size
+                    bank_end = bank_begin + self.source.bank_size - 1
+                    segment_end = min(possible_end, bank_end)
+                    usable_run = (max(free_run[0], bank_begin), min(free_run[1], bank_end))
+
+                last_start = self.source.get_last_valid_start(first_start, segment_end)
+
+                # Our interval will fit anywhere from the first start to the last.  Now pick
+                # the placement that introduces the least fragmentation.
+                possible_interval = Interval.create_from_fixed_range(first_start, last_start + source_len - 1)
+                change_list_fragment_info = self._get_best_change_list_for_possible_interval(possible_interval, usable_run)
                 change_list = change_list_fragment_info[0]
                 fragment_info = change_list_fragment_info[1]
                 change_lists.append(change_list)
                 fragment_infos.append(fragment_info)
 
-            # Find the next zero AFTER our one.
-            curr_clear_bit_idx = destination.get_next_unset_bit_index(next_set_bit_idx)
+                if self.source.bank_size is None:
+                    break
+                first_start = self.source.get_first_valid_start(segment_end + 1, possible_end)
 
         return (change_lists, fragment_infos)
 
-    def _get_best_change_list_for_possible_interval(self, possible_interval: Interval, destination: BitSet) -> Tuple['IntervalsToBitSetsEvaluator.ChangeList', Tuple[int, int]]:
+    def _get_best_change_list_for_possible_interval(self, possible_interval: Interval, free_run: Tuple[int, int]) -> Tuple['IntervalsToBitSetsEvaluator.ChangeList', Tuple[int, int]]:
         # Figure out where the best place within the possible interval
         # to assign ourselves.  We want the source block to be 
         # positioned as close as possible to another block to 
@@ -202,17 +268,13 @@ class IntervalsToBitSetsEvaluator(Evaluator):
         #   ^^^    Potential Interval (2->4)
         # Bits to Left:  1, Bits to Right:  2
 
+        # The possible interval lies within a free run, which may extend past
+        # it on either side (if our source's range clipped it).
         # Look to the left of the BEGINNING of our interval.
-        left_set_bit_idx = destination.get_previous_set_bit_index(possible_interval.begin)
-        num_bits_to_left = 0
-        if left_set_bit_idx is not None:
-            num_bits_to_left = possible_interval.begin - left_set_bit_idx - 1
+        num_bits_to_left = possible_interval.begin - free_run[0]
 
         # Look to the right of the END of our interval.
-        right_set_bit_idx = destination.get_next_set_bit_index(possible_interval.end)
-        num_bits_to_right = destination.get_num_bits() - possible_interval.end - 1
-        if right_set_bit_idx is not None:
-            num_bits_to_right = right_set_bit_idx - possible_interval.end - 1
+        num_bits_to_right = free_run[1] - possible_interval.end
 
         if num_bits_to_left <= num_bits_to_right:
             # We choose to the left.
@@ -263,7 +325,18 @@ class IntervalsToBitSetsEvaluator(Evaluator):
         #   111   <- 3rd
         if change_list is not None:
             interval_len = source.length
-            num_destinations = change_list.possible_interval.length - interval_len
+            # Only every alignment'th position is really a destination.
+            num_destinations = (change_list.possible_interval.length - interval_len) // source.alignment
             score += num_destinations * IntervalsToBitSetsEvaluator.SCORE_PER_POSSIBLE_DESTINATION
         
-        return score
\ No newline at end of file
+        return score
+
+    @staticmethod
+    def _get_free_run_list(destination: BitSet) -> FreeRunList:
+        cache = IntervalsToBitSetsEvaluator.s_free_run_list_cache
+        cache_key = (destination.get_num_bits(), destination.get_value())
+        free_run_list = cache.get(cache_key)
+        if free_run_list is None:
+            free_run_list = FreeRunList.create_from_bitset(destination)
+            cache.put(cache_key, free_run_list)
+        return free_run_list
\ No newline at end of file
@@ -0,0 +1,78 @@
+import copy
+from typing import List, Optional
+from rgtk.BitSet import BitSet
+from rgtk.constraint_solver import ConstraintSolver, Move
+from rgtk.Interval import Interval
+from rgtk.IntervalsToBitSetsEvaluator import IntervalsToBitSetsEvaluator
+
+# Places Intervals into BitSets in a single greedy pass, instead of a
+# ConstraintSolver search.  For most VRAM layouts that's all it takes.
+#
+# Intervals are placed most constrained first (fewest possible positions,
+# then longest).  Each goes where an IntervalsToBitSetsEvaluator would rank
+# best, i.e., the same scoring that the full search uses, which favors
+# snug spots that leave larger fragments for those that follow.
+#
+# The solution is a list of Moves in the same format as the
+# ConstraintSolver's, so either can be applied the same way.
+class IntervalsToBitSetsGreedyPlacer:
+    def __init__(self, intervals: List[Interval], bitsets: List[BitSet]):
+        self.intervals = intervals
+        self.bitsets = bitsets
+
+    # Returns a solution, or None if the greedy pass got stuck.  The BitSets
+    # passed in are not changed.
+    def solve(self) -> Optional[List[Move]]:
+        working_bitsets = copy.deepcopy(self.bitsets)
+
+        solution = []
+        for interval_idx in self._get_placement_order():
+            evaluator = IntervalsToBitSetsEvaluator(interval_idx, self.intervals[interval_idx])
+            for bitset_idx, working_bitset in enumerate(working_bitsets):
+                evaluator.update_moves_for_destination(bitset_idx, working_bitset)
+
+            best_moves = evaluator.get_list_of_best_moves()[1]
+            if len(best_moves) == 0:
+                # Nowhere left for this one.
+                return None
+
+            # Ties go to the first, which is the lowest position.
+            move = best_moves[0]
+            IntervalsToBitSetsEvaluator.apply_changes(self.intervals[interval_idx], working_bitsets[move.dest_index], move.change_list)
+            solution.append(move)
+
+        return solution
+
+    # Tries the greedy pass, and if that fails, searches with a
+    # ConstraintSolver until it finds a solution.  Returns None if there
+    # is none.
+    def solve_with_fallback(self, debugging: Optional[object] = None) -> Optional[List[Move]]:
+        solution = self.solve()
+        if solution is not None:
+            return solution
+
+        solver = ConstraintSolver(self.intervals, self.bitsets, IntervalsToBitSetsEvaluator, debugging)
+        while (len(solver.solutions) == 0) and (solver.is_exhausted() == False):
+            solver.update()
+
+        if len(solver.solutions) == 0:
+            return None
+
+        return solver.solutions[0]
+
+    # Applies a solution to the BitSets passed in.
+    def apply_solution(self, solution: List[Move]):
+        for move in solution:
+            IntervalsToBitSetsEvaluator.apply_changes(self.intervals[move.source_index], self.bitsets[move.dest_index], move.change_list)
+
+    def _get_placement_order(self) -> List[int]:
+        # Fewest possible positions first, so that fixed intervals claim
+        # their spots before flexible ones wander into them.  Then longest
+        # first, as they're the hardest to fit later.  Ties keep the order
+        # they were given in.
+        def get_sort_key(interval_idx: int):
+            interval = self.intervals[interval_idx]
+            num_positions = (interval.end - interval.begin + 1 - interval.length) // interval.alignment
+            return (num_positions, -interval.length)
+
+        return sorted(range(len(self.intervals)), key=get_sort_key)
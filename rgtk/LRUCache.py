@@ -0,0 +1,56 @@
+from collections import OrderedDict
+from typing import Optional
+
+# A bounded map that evicts the least recently used entry once it is full.
+class LRUCache:
+    def __init__(self, max_entries: int):
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+
+        # Track how effective the cache is.
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._entries
+
+    def get_max_entries(self) -> int:
+        return self._max_entries
+
+    def set_max_entries(self, max_entries: int):
+        self._max_entries = max_entries
+        self._evict()
+
+    # Returns the value for the key, or the default if it isn't present.
+    # A hit marks the entry as the most recently used.
+    def get(self, key: object, default: Optional[object] = None) -> Optional[object]:
+        if key not in self._entries:
+            self.num_misses += 1
+            return default
+
+        self.num_hits += 1
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    # Removes the entry for the key and returns its value, or the default if
+    # it isn't present.
+    def pop(self, key: object, default: Optional[object] = None) -> Optional[object]:
+        return self._entries.pop(key, default)
+
+    def put(self, key: object, value: object):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        self._evict()
+
+    def clear(self):
+        self._entries.clear()
+        self.num_hits = 0
+        self.num_misses = 0
+
+    def _evict(self):
+        while len(self._entries) > self._max_entries:
+            # Oldest entries are at the front.
+            self._entries.popitem(last=False)
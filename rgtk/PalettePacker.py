@@ -0,0 +1,474 @@
+import copy
+import heapq
+import random
+from collections import Counter
+from typing import List, Optional, Set, Tuple
+from rgtk.BitmaskInterner import BitmaskInterner
+from rgtk.ColorRemap import ColorRemap
+from rgtk.ColorRemapSubsumption import ColorRemapSubsumption
+from rgtk.ColorRemapsIntoStagingPalettesEvaluator import ColorRemapsIntoStagingPalettesEvaluator
+from rgtk.ColorsIntoColorsFitter import ColorsIntoColorsFitter
+from rgtk.constraint_solver import Move
+from rgtk.StagingPalette import StagingPalette
+
+# Packs many ColorRemaps (e.g., one per tile) into a fixed set of
+# StagingPalettes.  This is the classic tile palette packing problem, which
+# scales poorly as a generic ConstraintSolver search.  Instead we:
+#   1. Merge remaps whose colors are a subset of another remap's colors,
+#      since they can go wherever the larger one goes (see
+#      ColorRemapSubsumption).  These are clusters.
+#   2. Merge clusters into groups by overlap:  repeatedly join the pair that
+#      adds the fewest colors, until there are no more groups than palettes
+#      (or nothing else can be joined within a palette's capacity).
+#   3. Place the groups greedily, largest first, into the palette needing
+#      the fewest new colors.
+#   4. If the greedy pass gets stuck, repair the assignment by repeatedly
+#      moving clusters out of overflowing palettes (min-conflicts).
+#   5. Refine with a local search that moves clusters between palettes
+#      while that reduces the total number of palette entries used.
+#
+# Whether a cluster fits a palette is always decided by fitting it for real
+# (with a ColorsIntoColorsFitter), so slot, name and forced palette
+# intentions are honored.
+#
+# The solution is a list of Moves in the same format that
+# ColorRemapsIntoStagingPalettesEvaluator produces, so it can be handed to
+# ColorRemap.remap_to_staging_palette() and applied in order.
+class PalettePacker:
+    # Static vars
+    MAX_LOCAL_SEARCH_PASSES = 8
+
+    # If a group can't be placed, it's moved to the front of the line and
+    # the greedy pass is restarted, up to this many times.
+    MAX_GREEDY_RESTARTS = 32
+
+    # How many cluster moves the repair pass may make, per cluster.
+    MAX_REPAIR_STEPS_PER_CLUSTER = 32
+
+    # How often the repair pass moves a random cluster to a random palette,
+    # to get out of local minima.
+    REPAIR_RANDOM_WALK_PROBABILITY = 0.1
+
+    class Cluster:
+        def __init__(self, representative_index: int, color_set: Set[tuple], color_mask: int, palette_index: Optional[int]):
+            # The maximal remap whose colors cover everybody else in the cluster.
+            self.representative_index = representative_index
+
+            # Signatures of the colors in the cluster.
+            self.color_set = color_set
+
+            # Bitmask of the colors themselves (see ColorEntry.s_color_interner).
+            self.color_mask = color_mask
+
+            # A specific palette this cluster must go into, or None.
+            self.palette_index = palette_index
+
+    class Group:
+        def __init__(self, cluster_indices: List[int], color_set: Set[tuple], color_mask: int, palette_index: Optional[int]):
+            # Clusters that we'd like to see share a palette.
+            self.cluster_indices = cluster_indices
+            self.color_set = color_set
+            self.color_mask = color_mask
+            self.palette_index = palette_index
+
+    def __init__(self, color_remaps: List[ColorRemap], staging_palettes: List[StagingPalette]):
+        self.color_remaps = color_remaps
+        self.staging_palettes = staging_palettes
+
+        # Remaps that are subsets of others ride along with them.
+        self._subsumption = ColorRemapSubsumption(color_remaps)
+        self._clusters = self._create_clusters()
+
+        # Which palette each cluster was assigned to.
+        self._cluster_to_palette_index = [None] * len(self._clusters)
+
+    # Returns a list of Moves that maps every remap to a palette, or None if
+    # the remaps couldn't be packed.
+    def solve(self) -> Optional[List[Move]]:
+        placed = self._assign_groups_with_restarts(self._create_groups_by_overlap())
+        if placed == False:
+            placed = self._repair_with_min_conflicts()
+            if placed == False:
+                return None
+
+        self._refine_with_local_search()
+
+        return self._create_solution()
+
+    # Applies a solution to the original staging palettes.
+    def apply_solution(self, solution: List[Move]):
+        for move in solution:
+            source = self.color_remaps[move.source_index]
+            destination = self.staging_palettes[move.dest_index]
+            ColorRemapsIntoStagingPalettesEvaluator.apply_changes(source, destination, move.change_list)
+
+    def _create_clusters(self) -> List['PalettePacker.Cluster']:
+        # Each maximal remap heads a cluster, in the same order, so that
+        # cluster indices are also maximal remap indices.
+        clusters = []
+        for remap_idx in self._subsumption.get_maximal_remap_indices():
+            color_remap = self.color_remaps[remap_idx]
+            color_set = set(color_remap.get_color_entries_signature())
+            palette_index = color_remap.get_intention(ColorRemap.INTENTION_PALETTE)
+            clusters.append(PalettePacker.Cluster(remap_idx, color_set, color_remap.get_color_mask(), palette_index))
+
+        return clusters
+
+    def _create_groups_by_overlap(self) -> List['PalettePacker.Group']:
+        groups = []
+        for cluster_idx, cluster in enumerate(self._clusters):
+            groups.append(PalettePacker.Group([cluster_idx], cluster.color_set, cluster.color_mask, cluster.palette_index))
+
+        capacity = 0
+        for staging_palette in self.staging_palettes:
+            capacity = max(capacity, len(staging_palette.color_entries))
+
+        # Keep every candidate pair in a heap ordered by how many colors
+        # joining them would add (then by most overlap).  Pairs involving a
+        # group that has since been merged away are skipped when popped.
+        alive = [True] * len(groups)
+        heap = []
+        for group_a_idx in range(len(groups)):
+            for group_b_idx in range(group_a_idx + 1, len(groups)):
+                PalettePacker._push_group_pair(heap, groups, group_a_idx, group_b_idx, capacity)
+
+        num_alive = len(groups)
+        while (num_alive > len(self.staging_palettes)) and (len(heap) > 0):
+            _, _, group_a_idx, group_b_idx = heapq.heappop(heap)
+            if (alive[group_a_idx] == False) or (alive[group_b_idx] == False):
+                continue
+
+            group_a = groups[group_a_idx]
+            group_b = groups[group_b_idx]
+            palette_index = group_a.palette_index if group_a.palette_index is not None else group_b.palette_index
+            merged_group = PalettePacker.Group(group_a.cluster_indices + group_b.cluster_indices, group_a.color_set | group_b.color_set, group_a.color_mask | group_b.color_mask, palette_index)
+
+            alive[group_a_idx] = False
+            alive[group_b_idx] = False
+            merged_group_idx = len(groups)
+            groups.append(merged_group)
+            alive.append(True)
+            num_alive -= 1
+
+            for other_group_idx in range(merged_group_idx):
+                if alive[other_group_idx]:
+                    PalettePacker._push_group_pair(heap, groups, other_group_idx, merged_group_idx, capacity)
+
+        alive_groups = []
+        for group_idx, group in enumerate(groups):
+            if alive[group_idx]:
+                alive_groups.append(group)
+        return alive_groups
+
+    @staticmethod
+    def _push_group_pair(heap: list, groups: List['PalettePacker.Group'], group_a_idx: int, group_b_idx: int, capacity: int):
+        group_a = groups[group_a_idx]
+        group_b = groups[group_b_idx]
+
+        # Groups bound for different palettes can't be joined.
+        if (group_a.palette_index is not None) and (group_b.palette_index is not None) and (group_a.palette_index != group_b.palette_index):
+            return
+
+        num_overlapping = len(group_a.color_set & group_b.color_set)
+        num_union = len(group_a.color_set) + len(group_b.color_set) - num_overlapping
+        if num_union > capacity:
+            return
+
+        num_added = num_union - max(len(group_a.color_set), len(group_b.color_set))
+        heapq.heappush(heap, (num_added, -num_overlapping, group_a_idx, group_b_idx))
+
+    # Places groups greedily, restarting with any group that fails moved to
+    # the front.  Returns True if everything was placed.
+    def _assign_groups_with_restarts(self, groups: List['PalettePacker.Group']) -> bool:
+        # Forced groups first, as they have no choice.  Then largest first.
+        group_order = sorted(range(len(groups)), key=lambda group_idx: (groups[group_idx].palette_index is None, -len(groups[group_idx].color_set)))
+
+        failed_group_idx = self._assign_groups_greedily(groups, group_order)
+        num_restarts = 0
+        while failed_group_idx is not None:
+            if num_restarts >= PalettePacker.MAX_GREEDY_RESTARTS:
+                return False
+
+            # Give the troublemaker first pick next time.
+            group_order.remove(failed_group_idx)
+            group_order.insert(0, failed_group_idx)
+
+            failed_group_idx = self._assign_groups_greedily(groups, group_order)
+            num_restarts += 1
+
+        return True
+
+    # Places groups in the order given.  Returns the index of the first
+    # group that couldn't be placed, or None if they all were.
+    def _assign_groups_greedily(self, groups: List['PalettePacker.Group'], group_order: List[int]) -> Optional[int]:
+        working_palettes = copy.deepcopy(self.staging_palettes)
+
+        for group_idx in group_order:
+            group = groups[group_idx]
+
+            if group.palette_index is not None:
+                candidate_palette_indices = [group.palette_index]
+            else:
+                candidate_palette_indices = range(len(working_palettes))
+
+            # Find the palette requiring the fewest new colors.  On a tie, take
+            # the emptiest, so that unrelated groups don't get lumped together.
+            best_palette_index = None
+            best_palette = None
+            best_rank = None
+            for palette_index in candidate_palette_indices:
+                palette = working_palettes[palette_index]
+                palette_color_mask = palette.get_color_mask()
+                num_new_colors = BitmaskInterner.get_num_bits(group.color_mask & ~palette_color_mask)
+                rank = (num_new_colors, PalettePacker._get_num_entries_used(palette))
+                if (best_rank is not None) and (rank >= best_rank):
+                    continue
+
+                # Don't bother fitting if there aren't enough entries for the colors.
+                if palette.could_fit_color_mask(group.color_mask) == False:
+                    continue
+
+                candidate_palette = copy.deepcopy(palette)
+                if self._fit_clusters(group.cluster_indices, candidate_palette):
+                    best_palette_index = palette_index
+                    best_palette = candidate_palette
+                    best_rank = rank
+
+            if best_palette_index is None:
+                # Nowhere to put this group.
+                return group_idx
+
+            working_palettes[best_palette_index] = best_palette
+            for cluster_idx in group.cluster_indices:
+                self._cluster_to_palette_index[cluster_idx] = best_palette_index
+
+        return None
+
+    # Fits each cluster's representative into the palette, largest first.
+    # Returns False (leaving the palette partially filled) if one won't fit.
+    def _fit_clusters(self, cluster_indices: List[int], palette: StagingPalette) -> bool:
+        cluster_indices = sorted(cluster_indices, key=lambda cluster_idx: -len(self._clusters[cluster_idx].color_set))
+        for cluster_idx in cluster_indices:
+            representative = self.color_remaps[self._clusters[cluster_idx].representative_index]
+            solution = ColorsIntoColorsFitter.create_for_staging_palette(representative.color_entries, palette).get_best_solution()
+            if solution is None:
+                return False
+
+            change_list = ColorRemapsIntoStagingPalettesEvaluator.ChangeList(solution)
+            ColorRemapsIntoStagingPalettesEvaluator.apply_changes(representative, palette, change_list)
+
+        return True
+
+    # Starting from whatever the greedy pass left behind, moves clusters
+    # between palettes until none of them hold more colors than they can fit.
+    # Colors are tallied by signature, so this is cheap; the result is then
+    # checked by fitting for real.  Returns True on success.
+    def _repair_with_min_conflicts(self) -> bool:
+        # Deterministic, so that the same input always packs the same way.
+        rng = random.Random(0)
+
+        num_palettes = len(self.staging_palettes)
+        palette_capacities = []
+        palette_signature_counts = []
+        for staging_palette in self.staging_palettes:
+            palette_capacities.append(len(staging_palette.color_entries))
+
+            # Whatever is already in the palette stays there for good.
+            signature_counts = Counter()
+            for color_entry in staging_palette.color_entries:
+                if color_entry.is_empty() == False:
+                    signature_counts[color_entry.get_signature()] += 1
+            palette_signature_counts.append(signature_counts)
+
+        def get_overflow(palette_index: int) -> int:
+            return max(0, len(palette_signature_counts[palette_index]) - palette_capacities[palette_index])
+
+        # Moves are ranked by the change in overflow, then by the change in
+        # the total number of colors, which pulls related clusters together.
+        def get_move_cost(cluster: PalettePacker.Cluster, from_palette_index: int, to_palette_index: int) -> Tuple[int, int]:
+            from_counts = palette_signature_counts[from_palette_index]
+            to_counts = palette_signature_counts[to_palette_index]
+            num_removed = sum(1 for signature in cluster.color_set if from_counts[signature] == 1)
+            num_added = sum(1 for signature in cluster.color_set if signature not in to_counts)
+            from_overflow = max(0, len(from_counts) - num_removed - palette_capacities[from_palette_index])
+            to_overflow = max(0, len(to_counts) + num_added - palette_capacities[to_palette_index])
+            overflow_change = (from_overflow + to_overflow) - (get_overflow(from_palette_index) + get_overflow(to_palette_index))
+            return (overflow_change, num_added - num_removed)
+
+        def move_cluster(cluster_idx: int, palette_index: int):
+            cluster = self._clusters[cluster_idx]
+            from_palette_index = self._cluster_to_palette_index[cluster_idx]
+            if from_palette_index is not None:
+                from_counts = palette_signature_counts[from_palette_index]
+                from_counts.subtract(cluster.color_set)
+                for signature in cluster.color_set:
+                    if from_counts[signature] <= 0:
+                        del from_counts[signature]
+            palette_signature_counts[palette_index].update(cluster.color_set)
+            self._cluster_to_palette_index[cluster_idx] = palette_index
+
+        # Re-tally what the greedy pass placed, and put anything it didn't
+        # get to wherever it adds the fewest colors.
+        placed_assignment = self._cluster_to_palette_index
+        self._cluster_to_palette_index = [None] * len(self._clusters)
+        for cluster_idx, cluster in enumerate(self._clusters):
+            palette_index = placed_assignment[cluster_idx]
+            if cluster.palette_index is not None:
+                palette_index = cluster.palette_index
+            elif palette_index is None:
+                palette_index = min(range(num_palettes), key=lambda candidate_index: len(cluster.color_set - palette_signature_counts[candidate_index].keys()))
+            move_cluster(cluster_idx, palette_index)
+
+        movable_cluster_indices = [cluster_idx for cluster_idx, cluster in enumerate(self._clusters) if cluster.palette_index is None]
+        max_steps = PalettePacker.MAX_REPAIR_STEPS_PER_CLUSTER * len(self._clusters)
+        for _ in range(max_steps):
+            overflowing_palette_indices = [palette_index for palette_index in range(num_palettes) if get_overflow(palette_index) > 0]
+            if len(overflowing_palette_indices) == 0:
+                break
+
+            if rng.random() < PalettePacker.REPAIR_RANDOM_WALK_PROBABILITY:
+                cluster_idx = rng.choice(movable_cluster_indices)
+                move_cluster(cluster_idx, rng.randrange(num_palettes))
+                continue
+
+            # Take a cluster from an overflowing palette and move it to
+            # wherever it makes things the least bad.
+            conflicted_cluster_indices = [cluster_idx for cluster_idx in movable_cluster_indices if self._cluster_to_palette_index[cluster_idx] in overflowing_palette_indices]
+            if len(conflicted_cluster_indices) == 0:
+                # Only forced clusters are overflowing.  Nothing we can do.
+                return False
+
+            cluster_idx = rng.choice(conflicted_cluster_indices)
+            cluster = self._clusters[cluster_idx]
+            from_palette_index = self._cluster_to_palette_index[cluster_idx]
+
+            best_change = None
+            best_palette_indices = []
+            for to_palette_index in range(num_palettes):
+                if to_palette_index == from_palette_index:
+                    continue
+                change = get_move_cost(cluster, from_palette_index, to_palette_index)
+                if (best_change is None) or (change < best_change):
+                    best_change = change
+                    best_palette_indices = [to_palette_index]
+                elif change == best_change:
+                    best_palette_indices.append(to_palette_index)
+
+            if (best_change is not None) and (best_change <= (0, 0)):
+                move_cluster(cluster_idx, rng.choice(best_palette_indices))
+
+        # Make sure the palettes can really be built, since the tallies
+        # don't know about slots or other intentions.
+        for palette_index in range(num_palettes):
+            if self._rebuild_palette(palette_index, self._cluster_to_palette_index) is None:
+                return False
+
+        return True
+
+    def _refine_with_local_search(self):
+        palette_to_num_entries = []
+        for palette_index in range(len(self.staging_palettes)):
+            rebuilt_palette = self._rebuild_palette(palette_index, self._cluster_to_palette_index)
+            palette_to_num_entries.append(PalettePacker._get_num_entries_used(rebuilt_palette))
+
+        # Tally which colors each palette holds, so that we only bother
+        # rebuilding palettes for moves that could save an entry.
+        palette_signature_counts = [Counter() for _ in self.staging_palettes]
+        for cluster_idx, cluster in enumerate(self._clusters):
+            palette_signature_counts[self._cluster_to_palette_index[cluster_idx]].update(cluster.color_set)
+
+        for _ in range(PalettePacker.MAX_LOCAL_SEARCH_PASSES):
+            improved = False
+
+            for cluster_idx, cluster in enumerate(self._clusters):
+                if cluster.palette_index is not None:
+                    # Forced clusters can't move.
+                    continue
+
+                from_palette_index = self._cluster_to_palette_index[cluster_idx]
+                from_counts = palette_signature_counts[from_palette_index]
+                num_removed = sum(1 for signature in cluster.color_set if from_counts[signature] == 1)
+                for to_palette_index in range(len(self.staging_palettes)):
+                    if to_palette_index == from_palette_index:
+                        continue
+
+                    to_counts = palette_signature_counts[to_palette_index]
+                    num_added = sum(1 for signature in cluster.color_set if to_counts[signature] == 0)
+                    if num_added >= num_removed:
+                        continue
+
+                    # Try the move, and see if both palettes can still be built.
+                    candidate_assignment = list(self._cluster_to_palette_index)
+                    candidate_assignment[cluster_idx] = to_palette_index
+
+                    rebuilt_from_palette = self._rebuild_palette(from_palette_index, candidate_assignment)
+                    if rebuilt_from_palette is None:
+                        continue
+                    rebuilt_to_palette = self._rebuild_palette(to_palette_index, candidate_assignment)
+                    if rebuilt_to_palette is None:
+                        continue
+
+                    num_from_entries = PalettePacker._get_num_entries_used(rebuilt_from_palette)
+                    num_to_entries = PalettePacker._get_num_entries_used(rebuilt_to_palette)
+                    before = palette_to_num_entries[from_palette_index] + palette_to_num_entries[to_palette_index]
+                    if num_from_entries + num_to_entries < before:
+                        # Improvement!  Keep it.
+                        self._cluster_to_palette_index = candidate_assignment
+                        palette_to_num_entries[from_palette_index] = num_from_entries
+                        palette_to_num_entries[to_palette_index] = num_to_entries
+                        from_counts.subtract(cluster.color_set)
+                        to_counts.update(cluster.color_set)
+                        improved = True
+                        break
+
+            if improved == False:
+                break
+
+    # Rebuilds a palette from its original contents with the clusters
+    # assigned to it.  Returns None if they no longer fit.
+    def _rebuild_palette(self, palette_index: int, cluster_to_palette_index: List[int]) -> Optional[StagingPalette]:
+        palette = copy.deepcopy(self.staging_palettes[palette_index])
+
+        cluster_indices = self._get_clusters_in_palette(palette_index, cluster_to_palette_index)
+        if self._fit_clusters(cluster_indices, palette) == False:
+            return None
+
+        return palette
+
+    def _get_clusters_in_palette(self, palette_index: int, cluster_to_palette_index: List[int]) -> List[int]:
+        # Largest clusters go in first, as in the greedy pass.
+        cluster_indices = []
+        for cluster_idx, assigned_palette_index in enumerate(cluster_to_palette_index):
+            if assigned_palette_index == palette_index:
+                cluster_indices.append(cluster_idx)
+
+        cluster_indices.sort(key=lambda cluster_idx: -len(self._clusters[cluster_idx].color_set))
+        return cluster_indices
+
+    def _create_solution(self) -> Optional[List[Move]]:
+        # Solve for the representatives, whose source indices are cluster
+        # (i.e., maximal remap) indices, then bring the subsumed remaps along.
+        maximal_solution = []
+
+        for palette_index in range(len(self.staging_palettes)):
+            palette = copy.deepcopy(self.staging_palettes[palette_index])
+
+            for cluster_idx in self._get_clusters_in_palette(palette_index, self._cluster_to_palette_index):
+                representative = self.color_remaps[self._clusters[cluster_idx].representative_index]
+                color_solution = ColorsIntoColorsFitter.create_for_staging_palette(representative.color_entries, palette).get_best_solution()
+                if color_solution is None:
+                    return None
+
+                change_list = ColorRemapsIntoStagingPalettesEvaluator.ChangeList(color_solution)
+                ColorRemapsIntoStagingPalettesEvaluator.apply_changes(representative, palette, change_list)
+                maximal_solution.append(Move(cluster_idx, palette_index, change_list))
+
+        return self._subsumption.expand_solution(maximal_solution, self.staging_palettes)
+
+    @staticmethod
+    def _get_num_entries_used(palette: StagingPalette) -> int:
+        num_entries_used = 0
+        for color_entry in palette.color_entries:
+            if color_entry.is_empty() == False:
+                num_entries_used += 1
+        return num_entries_used
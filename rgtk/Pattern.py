@@ -15,6 +15,11 @@ class Pattern(IntentionCollection):
         VERT = 2
         HORIZ_VERT = HORIZ | VERT
 
+    # Every flip, including NONE and HORIZ_VERT.  Iterating over Pattern.Flip
+    # itself skips those on newer Pythons (3.11+), as only single-bit flags
+    # are members there.
+    ALL_FLIPS = [Flip.NONE, Flip.HORIZ, Flip.VERT, Flip.HORIZ_VERT]
+
 
     # Static Vars
     INTENTION_FLIPS_ALLOWED = "Flips Allowed"
@@ -38,7 +43,7 @@ class Pattern(IntentionCollection):
         # Create the hash for each orientation supported.  This will let
         # us detect if a given pattern matches another, and which orientation
         # it requires.
-        self._flip_to_hash = [None] * len(list(Pattern.Flip))
+        self._flip_to_hash = [None] * len(Pattern.ALL_FLIPS)
 
         # We always allow no flip.
         self._flip_to_hash[Pattern.Flip.NONE] = self._calculate_hash_for_flip(Pattern.Flip.NONE)
@@ -57,39 +62,35 @@ class Pattern(IntentionCollection):
         return self._flip_to_hash[flip]
 
     def create_index_array_for_flip(self, flip: 'Pattern.Flip') -> IndexedColorArray:
-        range_params_x = None
-        range_params_y = None
-        if flip == Pattern.Flip.NONE:
-            range_params_x = (0, self.index_array.width, 1)
-            range_params_y = (0, self.index_array.height, 1)
-        elif flip == Pattern.Flip.HORIZ:
-            range_params_x = (self.index_array.width - 1, -1, -1)
-            range_params_y = (0, self.index_array.height, 1)
-        elif flip == Pattern.Flip.VERT:
-            range_params_x = (0, self.index_array.width, 1)
-            range_params_y = (self.index_array.height - 1, -1, -1)
-        elif flip == Pattern.Flip.HORIZ_VERT:
-            range_params_x = (self.index_array.width - 1, -1, -1)
-            range_params_y = (self.index_array.height - 1, -1, -1)
-        else:
+        if flip not in Pattern.ALL_FLIPS:
             raise Pattern.InvalidFlipEnumerationError(flip)
 
-        new_indexed_array = []
+        ret_val = IndexedColorArray(self.index_array.width, self.index_array.height, self._create_list_for_flip(flip))
+        return ret_val
 
-        # Walk through the array according to the flip direction.
-        for y in range(range_params_y[0], range_params_y[1], range_params_y[2]):
-            for x in range(range_params_x[0], range_params_x[1], range_params_x[2]):
-                value = self.index_array.get_value(x, y)
+    # Returns the values of the array in the flipped order.  Whole rows are
+    # sliced (and reversed for a horizontal flip) rather than reading each
+    # value in turn.
+    def _create_list_for_flip(self, flip: 'Pattern.Flip') -> List[int]:
+        width = self.index_array.width
+        array = self.index_array.array
+        if flip == Pattern.Flip.NONE:
+            return list(array)
 
-                # Append the unique color index.
-                new_indexed_array.append(value)
+        rows = [array[row_start:row_start + width] for row_start in range(0, len(array), width)]
+        if flip & Pattern.Flip.VERT == Pattern.Flip.VERT:
+            rows.reverse()
 
-        # Create the object version.
-        ret_val = IndexedColorArray(self.index_array.width, self.index_array.height, new_indexed_array)
-        return ret_val
+        new_indexed_array = []
+        if flip & Pattern.Flip.HORIZ == Pattern.Flip.HORIZ:
+            for row in rows:
+                new_indexed_array.extend(reversed(row))
+        else:
+            for row in rows:
+                new_indexed_array.extend(row)
+        return new_indexed_array
 
     # Calculate the hash value for a given flip orientation.
     def _calculate_hash_for_flip(self, flip: 'Pattern.Flip') -> int:
-        index_array = self.create_index_array_for_flip(flip)
-        hash_val = hash(tuple(index_array.array))
+        hash_val = hash(tuple(self._create_list_for_flip(flip)))
         return hash_val
\ No newline at end of file
@@ -21,6 +21,13 @@ class PatternsIntoPatternHashMapsEvaluator(Evaluator):
     # When we only have one move, those are "free"
     SCORE_ADJUST_FREE_MOVE = -math.inf
 
+    # In an encoded change list, what the matched pattern was:
+    # ENCODED_NO_MATCH if we were added, ENCODED_MATCH_IN_DESTINATION if it
+    # was already in the destination before solving, or else the index of
+    # the source pattern matched.
+    ENCODED_NO_MATCH = -1
+    ENCODED_MATCH_IN_DESTINATION = -2
+
     class PotentialMove:
         def __init__(self, move: Move, base_score: int):
             self.move = move
@@ -142,6 +149,50 @@ class PatternsIntoPatternHashMapsEvaluator(Evaluator):
         # Maps are always instantiated.
         return False
 
+    @classmethod
+    def encode_change_list(cls, change_list: 'PatternsIntoPatternHashMapsEvaluator.ChangeList', source_index: int, dest_index: int, encoding: 'SolutionEncoding') -> tuple:
+        if change_list.matching_pattern_object_ref is None:
+            match = PatternsIntoPatternHashMapsEvaluator.ENCODED_NO_MATCH
+        else:
+            match = encoding.get_source_index(change_list.matching_pattern_object_ref())
+            if match is None:
+                match = PatternsIntoPatternHashMapsEvaluator.ENCODED_MATCH_IN_DESTINATION
+
+        return (int(change_list.flips_to_match), match)
+
+    @classmethod
+    def decode_change_list(cls, payload: tuple, source_index: int, dest_index: int, encoding: 'SolutionEncoding') -> 'PatternsIntoPatternHashMapsEvaluator.ChangeList':
+        flips_to_match = Pattern.Flip(payload[0])
+        match = payload[1]
+
+        if match == PatternsIntoPatternHashMapsEvaluator.ENCODED_NO_MATCH:
+            matching_pattern_object = None
+        elif match == PatternsIntoPatternHashMapsEvaluator.ENCODED_MATCH_IN_DESTINATION:
+            # Find it the same way we did when solving:  by our hash.
+            hash_val = encoding.sources[source_index].get_hash_for_flip(flips_to_match)
+            matching_pattern_object = encoding.destinations[dest_index][hash_val]()
+        else:
+            matching_pattern_object = encoding.sources[match]
+
+        return PatternsIntoPatternHashMapsEvaluator.ChangeList(matching_pattern_object=matching_pattern_object, flips_to_match=flips_to_match)
+
+    def get_matching_move(self, previous_move: Move) -> Optional[Move]:
+        potential_move_list = self._destination_to_potential_move_list.get(previous_move.dest_index)
+        if potential_move_list is None:
+            return None
+
+        # The Pattern we matched may be a different object than last time, so
+        # compare whether we matched at all, and with which flips.
+        previous_change_list = previous_move.change_list
+        previous_matched = previous_change_list.matching_pattern_object_ref is not None
+        for potential_move in potential_move_list:
+            change_list = potential_move.move.change_list
+            matched = change_list.matching_pattern_object_ref is not None
+            if (matched == previous_matched) and (change_list.flips_to_match == previous_change_list.flips_to_match):
+                return potential_move.move
+
+        return None
+
     def _get_changes_to_fit(self, destination_index: int, destination: Mapping[int, ReferenceType]) -> Optional[List['PatternsIntoPatternHashMapsEvaluator.ChangeList']]:
         # Make sure this pattern is allowed to go into this destination.
         assigned_pattern_set = self.source.get_intention(Pattern.INTENTION_SPECIFIC_PATTERN_SET_INDEX)
@@ -152,7 +203,7 @@ class PatternsIntoPatternHashMapsEvaluator(Evaluator):
         change_lists = []
 
         # Look at each hash for this source and see if it matches anything currently in the map.
-        for flip in list(Pattern.Flip):
+        for flip in Pattern.ALL_FLIPS:
             hash_val = self.source.get_hash_for_flip(flip)
             if hash_val is not None:
                 # This is a valid flip for this pattern.
@@ -182,7 +233,7 @@ class PatternsIntoPatternHashMapsEvaluator(Evaluator):
         # We take patterns which have fewer *UNIQUE* hashes 
         # before those with more options, so that they get prioritized.
         unique_hashes = set()
-        for flip in list(Pattern.Flip):
+        for flip in Pattern.ALL_FLIPS:
             hash_val = self.source.get_hash_for_flip(flip)
             if hash_val is not None:
                 unique_hashes.add(hash_val)
@@ -0,0 +1,87 @@
+import time
+from typing import Mapping
+
+# Collects timings for named phases of hot code paths, e.g., the phases of
+# a ConstraintSolver.  For each phase we keep a count, total, min, max and
+# a histogram of durations (bucketed by powers of two, in nanoseconds).
+#
+# Timing is done with perf_counter_ns(), and nothing is allocated per
+# sample.  Code being profiled should hold an Optional[Profiler] and skip
+# calling it entirely when it's None, so that profiling costs nothing when
+# it is off:
+#
+#   if profiler is not None:
+#       begin_ns = profiler.begin()
+#   ...
+#   if profiler is not None:
+#       profiler.end("MyPhase", begin_ns)
+class Profiler:
+    class Phase:
+        def __init__(self, name: str):
+            self.name = name
+            self.count = 0
+            self.total_ns = 0
+            self.min_ns = None
+            self.max_ns = None
+
+            # Index N counts samples whose duration needs N bits, i.e., took
+            # [2^(N-1), 2^N) nanoseconds.
+            self.histogram = []
+
+        def add_sample(self, elapsed_ns: int):
+            self.count += 1
+            self.total_ns += elapsed_ns
+            if (self.min_ns is None) or (elapsed_ns < self.min_ns):
+                self.min_ns = elapsed_ns
+            if (self.max_ns is None) or (elapsed_ns > self.max_ns):
+                self.max_ns = elapsed_ns
+
+            bucket = elapsed_ns.bit_length()
+            while len(self.histogram) <= bucket:
+                self.histogram.append(0)
+            self.histogram[bucket] += 1
+
+    def __init__(self):
+        self._name_to_phase = {}
+
+    # Returns a timestamp to hand back to end().
+    @staticmethod
+    def begin() -> int:
+        return time.perf_counter_ns()
+
+    def end(self, phase_name: str, begin_ns: int):
+        elapsed_ns = time.perf_counter_ns() - begin_ns
+
+        phase = self._name_to_phase.get(phase_name)
+        if phase is None:
+            phase = Profiler.Phase(phase_name)
+            self._name_to_phase[phase_name] = phase
+        phase.add_sample(elapsed_ns)
+
+    def get_phase(self, phase_name: str) -> 'Profiler.Phase':
+        return self._name_to_phase.get(phase_name)
+
+    def reset(self):
+        self._name_to_phase.clear()
+
+    # Returns a structured report (plain dicts, lists and numbers, so that
+    # it can be written out as JSON) of every phase seen, by name.
+    # Histogram buckets are keyed by their upper bound in nanoseconds.
+    def get_report(self) -> Mapping[str, Mapping[str, object]]:
+        report = {}
+        for phase_name, phase in self._name_to_phase.items():
+            histogram = {}
+            for bucket, count in enumerate(phase.histogram):
+                if count > 0:
+                    histogram[str(1 << bucket)] = count
+
+            report[phase_name] = {
+                  "count": phase.count
+                , "total_ns": phase.total_ns
+                , "mean_ns": phase.total_ns // phase.count
+                , "min_ns": phase.min_ns
+                , "max_ns": phase.max_ns
+                , "histogram_ns": histogram
+            }
+
+        return report
@@ -4,6 +4,11 @@ from rgtk.constraint_solver import ConstraintSolver, Evaluator, Move
 from rgtk.BitSet import BitSet
 
 class RasterPixelsToSpritesEvaluator(Evaluator):
+    # Static vars
+    # Encoded payload for InvalidSourceChangeLists, which carry nothing.  (A
+    # None change list, for an already covered pixel, is encoded as None.)
+    ENCODED_INVALID_SOURCE_CHANGE_LIST = -1
+
     class Source:
         def __init__(self, pixel_to_potential_sprites_bitset: BitSet, sprite_pixel_coverages: List[BitSet]):
             # Which sprites *could* this pixel belong to?
@@ -186,6 +191,50 @@ class RasterPixelsToSpritesEvaluator(Evaluator):
         # Our output is always discrete.  We're never empty.
         return False
 
+    @classmethod
+    def encode_change_list(cls, change_list: Optional['RasterPixelsToSpritesEvaluator.ChangeList'], source_index: int, dest_index: int, encoding: object) -> object:
+        if change_list is None:
+            return None
+        if isinstance(change_list, RasterPixelsToSpritesEvaluator.InvalidSourceChangeList):
+            return RasterPixelsToSpritesEvaluator.ENCODED_INVALID_SOURCE_CHANGE_LIST
+
+        # The bitsets go as their values.
+        return (change_list.dest_sprite_index
+            , change_list.added_pixels_bitset.get_num_bits()
+            , change_list.added_pixels_bitset.get_value()
+            , change_list.overlapped_pixels_bitset.get_value())
+
+    @classmethod
+    def decode_change_list(cls, payload: object, source_index: int, dest_index: int, encoding: object) -> Optional['RasterPixelsToSpritesEvaluator.ChangeList']:
+        if payload is None:
+            return None
+        if payload == RasterPixelsToSpritesEvaluator.ENCODED_INVALID_SOURCE_CHANGE_LIST:
+            return RasterPixelsToSpritesEvaluator.InvalidSourceChangeList()
+
+        dest_sprite_index, num_bits, added_value, overlapped_value = payload
+        added_pixels_bitset = BitSet.create_from_value(num_bits, added_value)
+        overlapped_pixels_bitset = BitSet.create_from_value(num_bits, overlapped_value)
+        return RasterPixelsToSpritesEvaluator.ValidChangeList(dest_sprite_index=dest_sprite_index, added_pixels_bitset=added_pixels_bitset, overlapped_pixels_bitset=overlapped_pixels_bitset)
+
+    def get_matching_move(self, previous_move: Move) -> Optional[Move]:
+        potential_move_list = self._destination_to_potential_move_list.get(previous_move.dest_index)
+        if potential_move_list is None:
+            return None
+
+        previous_change_list = previous_move.change_list
+        for potential_move in potential_move_list:
+            change_list = potential_move.move.change_list
+            if previous_change_list is None:
+                # Previously this pixel was already covered.  It needs to be again.
+                if change_list is None:
+                    return potential_move.move
+            elif isinstance(change_list, RasterPixelsToSpritesEvaluator.ValidChangeList):
+                # Otherwise it's only a match if we're choosing the same sprite.
+                if change_list.dest_sprite_index == previous_change_list.dest_sprite_index:
+                    return potential_move.move
+
+        return None
+
     def _get_score_for_changes(self, change_list: 'RasterPixelsToSpritesEvaluator.ChangeList', destination: BitSet) -> int:
         score = 0
 
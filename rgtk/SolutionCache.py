@@ -0,0 +1,245 @@
+import enum
+import hashlib
+import marshal
+import os
+import tempfile
+import weakref
+from typing import List, Optional
+from rgtk.constraint_solver import ConstraintSolver, Move
+from rgtk.SolutionEncoding import SolutionEncoding
+
+# Remembers solver results on disk, keyed by the *content* of what was
+# solved, so that unchanged assets don't need solving again from one build
+# to the next.
+#
+# The key covers the sources and destinations (every attribute, all the way
+# down), the evaluator class and the constants its solutions depend on
+# (scores, options, etc.; see Evaluator.get_result_constants()), and
+# anything else the caller passes in that changes the answer (such as how
+# many solutions were asked for).  Objects are compared by content, never by
+# identity or Python's hash(), so keys are the same in every process.
+#
+# Solutions are stored in their encoded form (see SolutionEncoding), so they
+# are decoded against the sources and destinations of whoever asks.
+#
+# Each entry is a file in the cache directory.  Once there are more than
+# max_entries of them, or they take up more than max_bytes, the least
+# recently used are removed.
+class SolutionCache:
+    # Static vars
+    DEFAULT_MAX_ENTRIES = 1024
+    DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+    FILE_EXTENSION = ".solutions"
+
+    # Bump when the key or file format changes, so old entries are ignored.
+    FORMAT_VERSION = 3
+
+    def __init__(self, directory: str, max_entries: int = DEFAULT_MAX_ENTRIES, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        os.makedirs(directory, exist_ok=True)
+
+        # Track how effective the cache is.
+        self.num_hits = 0
+        self.num_misses = 0
+
+    # Returns the key for solving the sources into the destinations with
+    # the evaluator.  extra is anything else that affects the result.
+    @classmethod
+    def create_key(cls, sources: List[object], destinations: List[object], evaluator_class: type, extra: object = None) -> str:
+        hasher = hashlib.sha256()
+        memo = {}
+
+        cls._update_hash(hasher, cls.FORMAT_VERSION, memo)
+        cls._update_hash(hasher, evaluator_class, memo)
+        cls._update_hash(hasher, evaluator_class.get_result_constants(), memo)
+        cls._update_hash(hasher, sources, memo)
+        cls._update_hash(hasher, destinations, memo)
+        cls._update_hash(hasher, extra, memo)
+
+        return hasher.hexdigest()
+
+    # Returns the solutions stored for the key, decoded with the encoding,
+    # or None if there are none.
+    def get(self, key: str, encoding: SolutionEncoding) -> Optional[List[List[Move]]]:
+        file_path = self._get_file_path(key)
+        try:
+            with open(file_path, "rb") as cache_file:
+                encoded_solutions = marshal.load(cache_file)
+
+            # Mark as the most recently used.
+            os.utime(file_path)
+        except (OSError, EOFError, ValueError, TypeError):
+            # Missing, or unreadable (e.g., written by a different Python).
+            self.num_misses += 1
+            return None
+
+        self.num_hits += 1
+        return encoding.decode_solutions(encoded_solutions)
+
+    # Stores the solutions for the key, encoded with the encoding.  Returns
+    # False if they can't be stored (such as when an intention holds
+    # something that can't be written out).
+    def put(self, key: str, solutions: List[List[Move]], encoding: SolutionEncoding) -> bool:
+        try:
+            data = marshal.dumps(encoding.encode_solutions(solutions))
+        except ValueError:
+            return False
+
+        # Write to a temporary file and move it into place, so that nobody
+        # ever reads a partially written entry.
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(file_descriptor, "wb") as temp_file:
+                temp_file.write(data)
+            os.replace(temp_path, self._get_file_path(key))
+        except OSError:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
+
+        self._evict()
+        return True
+
+    # Returns the cached solutions for solving the sources into the
+    # destinations, or runs a ConstraintSolver (until it has max_solutions,
+    # or is exhausted) and caches what it finds.
+    def get_or_solve(self, sources: List[object], destinations: List[object], evaluator_class: type, max_solutions: Optional[int] = 1, extra: object = None) -> List[List[Move]]:
+        key = SolutionCache.create_key(sources, destinations, evaluator_class, (max_solutions, extra))
+
+        encoding = SolutionEncoding(sources, destinations, evaluator_class)
+        solutions = self.get(key, encoding)
+        if solutions is None:
+            solver = ConstraintSolver(sources, destinations, evaluator_class, None)
+            while solver.run(1024, max_solutions) == ConstraintSolver.RUN_RESULT_MAX_STEPS_REACHED:
+                pass
+
+            solutions = solver.solutions
+            self.put(key, solutions, encoding)
+
+        return solutions
+
+    def clear(self):
+        for file_path in self._get_entry_file_paths():
+            os.remove(file_path)
+
+    def _get_file_path(self, key: str) -> str:
+        return os.path.join(self.directory, key + SolutionCache.FILE_EXTENSION)
+
+    def _get_entry_file_paths(self) -> List[str]:
+        file_paths = []
+        for file_name in os.listdir(self.directory):
+            if file_name.endswith(SolutionCache.FILE_EXTENSION):
+                file_paths.append(os.path.join(self.directory, file_name))
+        return file_paths
+
+    def _evict(self):
+        entries = []
+        total_bytes = 0
+        for file_path in self._get_entry_file_paths():
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                # Somebody else removed it.
+                continue
+            entries.append((stat.st_mtime, file_path, stat.st_size))
+            total_bytes += stat.st_size
+
+        # Oldest first.
+        entries.sort()
+
+        entry_idx = 0
+        while (entry_idx < len(entries)) and ((len(entries) - entry_idx > self.max_entries) or (total_bytes > self.max_bytes)):
+            _, file_path, size = entries[entry_idx]
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
+            total_bytes -= size
+            entry_idx += 1
+
+    @classmethod
+    def _update_hash(cls, hasher: 'hashlib._Hash', obj: object, memo: dict):
+        # Each value is tagged with its type, and variable length values with
+        # their length, so that different values can't run together into the
+        # same bytes.
+        if obj is None:
+            hasher.update(b"N")
+        elif isinstance(obj, bool):
+            hasher.update(b"T" if obj else b"F")
+        elif isinstance(obj, enum.Enum):
+            hasher.update(b"E")
+            cls._update_hash(hasher, type(obj), memo)
+            cls._update_hash(hasher, obj.value, memo)
+        elif isinstance(obj, int):
+            hasher.update(b"i%d;" % obj)
+        elif isinstance(obj, float):
+            hasher.update(b"f" + repr(obj).encode() + b";")
+        elif isinstance(obj, str):
+            encoded = obj.encode("utf-8")
+            hasher.update(b"s%d:" % len(encoded))
+            hasher.update(encoded)
+        elif isinstance(obj, bytes):
+            hasher.update(b"b%d:" % len(obj))
+            hasher.update(obj)
+        elif isinstance(obj, type):
+            cls._update_hash(hasher, "type " + obj.__module__ + "." + obj.__qualname__, memo)
+        elif isinstance(obj, weakref.ref):
+            hasher.update(b"W")
+            cls._update_hash(hasher, obj(), memo)
+        else:
+            # Containers and objects can be large and shared (e.g., every
+            # sprite source refers to the same coverage list), so each is
+            # hashed once and referred to by its digest after that.
+            memo_entry = memo.get(id(obj))
+            if memo_entry is None:
+                sub_hasher = hashlib.sha256()
+                cls._update_hash_for_composite(sub_hasher, obj, memo)
+
+                # Keep the object alive so that its id isn't reused.
+                memo_entry = (obj, sub_hasher.digest())
+                memo[id(obj)] = memo_entry
+
+            hasher.update(b"H")
+            hasher.update(memo_entry[1])
+
+    @classmethod
+    def _update_hash_for_composite(cls, hasher: 'hashlib._Hash', obj: object, memo: dict):
+        if isinstance(obj, (list, tuple)):
+            hasher.update(b"L%d:" % len(obj))
+            for item in obj:
+                cls._update_hash(hasher, item, memo)
+        elif isinstance(obj, dict):
+            # Order doesn't matter, so sort by each item's digest.
+            hasher.update(b"D%d:" % len(obj))
+            for item_digest in sorted(cls._get_digest((key, value), memo) for key, value in obj.items()):
+                hasher.update(item_digest)
+        elif isinstance(obj, (set, frozenset)):
+            hasher.update(b"S%d:" % len(obj))
+            for item_digest in sorted(cls._get_digest(item, memo) for item in obj):
+                hasher.update(item_digest)
+        else:
+            # Any other object is its class plus its attributes, by name.
+            hasher.update(b"O")
+            cls._update_hash(hasher, type(obj), memo)
+
+            attributes = {}
+            for klass in type(obj).__mro__:
+                for slot_name in getattr(klass, "__slots__", ()):
+                    if hasattr(obj, slot_name):
+                        attributes[slot_name] = getattr(obj, slot_name)
+            attributes.update(getattr(obj, "__dict__", {}))
+
+            hasher.update(b"%d:" % len(attributes))
+            for name in sorted(attributes.keys()):
+                cls._update_hash(hasher, name, memo)
+                cls._update_hash(hasher, attributes[name], memo)
+
+    @classmethod
+    def _get_digest(cls, obj: object, memo: dict) -> bytes:
+        hasher = hashlib.sha256()
+        cls._update_hash(hasher, obj, memo)
+        return hasher.digest()
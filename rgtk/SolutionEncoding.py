@@ -0,0 +1,49 @@
+from typing import List, Optional, Tuple
+from rgtk.constraint_solver import Move
+
+# Converts solutions to and from plain data (ints, strings, tuples and None)
+# that refer to sources and destinations only by index.  Unlike the Moves
+# themselves, which can hold references to live objects, encoded solutions
+# can be written to disk or sent to another process, and decoded there
+# against equivalent sources and destinations.
+#
+# An encoded move is (source index, dest index, payload), where the payload
+# is whatever the evaluator class packs its change list into (see
+# Evaluator.encode_change_list()).
+class SolutionEncoding:
+    def __init__(self, sources: List[object], destinations: List[object], evaluator_class: type):
+        self.sources = sources
+        self.destinations = destinations
+        self.evaluator_class = evaluator_class
+
+        # Built the first time somebody needs to find a source by identity.
+        self._source_id_to_index = None
+
+    # Returns the index of the source object (not an equal one), or None
+    # if it isn't one of our sources.
+    def get_source_index(self, source: object) -> Optional[int]:
+        if self._source_id_to_index is None:
+            self._source_id_to_index = {id(source_obj): source_index for source_index, source_obj in enumerate(self.sources)}
+        return self._source_id_to_index.get(id(source))
+
+    def encode_solution(self, solution: List[Move]) -> Tuple[tuple, ...]:
+        evaluator_class = self.evaluator_class
+        encoded_moves = []
+        for move in solution:
+            payload = evaluator_class.encode_change_list(move.change_list, move.source_index, move.dest_index, self)
+            encoded_moves.append((move.source_index, move.dest_index, payload))
+        return tuple(encoded_moves)
+
+    def decode_solution(self, encoded_solution: Tuple[tuple, ...]) -> List[Move]:
+        evaluator_class = self.evaluator_class
+        solution = []
+        for source_index, dest_index, payload in encoded_solution:
+            change_list = evaluator_class.decode_change_list(payload, source_index, dest_index, self)
+            solution.append(Move(source_index, dest_index, change_list))
+        return solution
+
+    def encode_solutions(self, solutions: List[List[Move]]) -> Tuple[tuple, ...]:
+        return tuple(self.encode_solution(solution) for solution in solutions)
+
+    def decode_solutions(self, encoded_solutions: Tuple[tuple, ...]) -> List[List[Move]]:
+        return [self.decode_solution(encoded_solution) for encoded_solution in encoded_solutions]
@@ -0,0 +1,190 @@
+import json
+from typing import List, Mapping, Optional, TextIO
+
+# Records what a ConstraintSolver's search did, one JSON object per line, so
+# that it can be studied after the fact (see SolverTraceAnalyzer) instead
+# of re-running a slow solve with debugging turned on.
+#
+# Every event has an "e" (its type) and most have an "n" (the search tree
+# node it happened to):
+#   expand:    {"e": "expand", "n": node, "d": depth}
+#   fork:      {"e": "fork", "n": node, "d": depth, "c": [child nodes]}
+#   best:      {"e": "best", "n": node, "s": source index, "score": score, "m": number of moves, "ns": time taken}
+#   fail:      {"e": "fail", "n": node}
+#   solution:  {"e": "solution", "n": node}
+#   restart:   {"e": "restart"} (the warm start failed, and node numbering starts over)
+#
+# Scores may be Infinity or -Infinity, which Python's json module reads back.
+#
+# Lines are buffered and written in batches.  Call close() (or flush())
+# when done.
+class SolverTraceRecorder:
+    # Static vars
+    DEFAULT_NUM_EVENTS_TO_BUFFER = 4096
+
+    EVENT_EXPAND = "expand"
+    EVENT_FORK = "fork"
+    EVENT_BEST = "best"
+    EVENT_FAIL = "fail"
+    EVENT_SOLUTION = "solution"
+    EVENT_RESTART = "restart"
+
+    def __init__(self, file_path: str, num_events_to_buffer: int = DEFAULT_NUM_EVENTS_TO_BUFFER):
+        self._file = open(file_path, "w")
+        self._num_events_to_buffer = num_events_to_buffer
+        self._lines = []
+
+    def record_expand(self, node_index: int, depth: int):
+        self._add_event({"e": SolverTraceRecorder.EVENT_EXPAND, "n": node_index, "d": depth})
+
+    def record_fork(self, node_index: int, depth: int, child_node_indices: List[int]):
+        self._add_event({"e": SolverTraceRecorder.EVENT_FORK, "n": node_index, "d": depth, "c": child_node_indices})
+
+    def record_best(self, node_index: int, source_index: int, score: float, num_moves: int, elapsed_ns: int):
+        self._add_event({"e": SolverTraceRecorder.EVENT_BEST, "n": node_index, "s": source_index, "score": score, "m": num_moves, "ns": elapsed_ns})
+
+    def record_fail(self, node_index: int):
+        self._add_event({"e": SolverTraceRecorder.EVENT_FAIL, "n": node_index})
+
+    def record_solution(self, node_index: int):
+        self._add_event({"e": SolverTraceRecorder.EVENT_SOLUTION, "n": node_index})
+
+    def record_restart(self):
+        self._add_event({"e": SolverTraceRecorder.EVENT_RESTART})
+
+    def flush(self):
+        if len(self._lines) > 0:
+            self._file.write("\n".join(self._lines))
+            self._file.write("\n")
+            self._lines.clear()
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def _add_event(self, event: Mapping[str, object]):
+        self._lines.append(json.dumps(event, separators=(",", ":")))
+        if len(self._lines) >= self._num_events_to_buffer:
+            self.flush()
+
+
+# Reads a trace written by a SolverTraceRecorder and summarizes it.
+class SolverTraceAnalyzer:
+    class EvaluatorSummary:
+        def __init__(self, source_index: int):
+            self.source_index = source_index
+
+            # How many times it was asked for its best moves, and how long
+            # that took in total.
+            self.num_evaluations = 0
+            self.total_ns = 0
+
+            # How many moves it offered in total.
+            self.num_moves_offered = 0
+
+    class WastedSubtree:
+        def __init__(self, node_index: int, depth: int, num_nodes: int):
+            # The topmost node of a subtree that never led to a solution.
+            self.node_index = node_index
+            self.depth = depth
+            self.num_nodes = num_nodes
+
+    def __init__(self, trace_file: TextIO):
+        self._source_index_to_evaluator_summary = {}
+
+        # Only the tree since the last restart is kept, as node numbers
+        # start over after one.
+        self._node_to_parent = {}
+        self._node_to_depth = {}
+        self._solution_nodes = set()
+
+        self._depth_to_num_forks = {}
+        self._depth_to_num_fork_children = {}
+
+        for line in trace_file:
+            line = line.strip()
+            if len(line) > 0:
+                self._add_event(json.loads(line))
+
+    @classmethod
+    def create_from_file(cls, file_path: str) -> 'SolverTraceAnalyzer':
+        with open(file_path, "r") as trace_file:
+            return cls(trace_file)
+
+    # The evaluators that took the most time, most expensive first.
+    def get_hot_evaluators(self, max_num_evaluators: Optional[int] = None) -> List['SolverTraceAnalyzer.EvaluatorSummary']:
+        summaries = sorted(self._source_index_to_evaluator_summary.values(), key=lambda summary: (-summary.total_ns, summary.source_index))
+        if max_num_evaluators is not None:
+            summaries = summaries[:max_num_evaluators]
+        return summaries
+
+    # The largest subtrees that never led to a solution, largest first.
+    def get_wasted_subtrees(self, max_num_subtrees: Optional[int] = None) -> List['SolverTraceAnalyzer.WastedSubtree']:
+        # Anything that is a solution, or an ancestor of one, was worth visiting.
+        productive_nodes = set()
+        for node_index in self._solution_nodes:
+            while (node_index is not None) and (node_index not in productive_nodes):
+                productive_nodes.add(node_index)
+                node_index = self._node_to_parent.get(node_index)
+
+        # Count the nodes under each unproductive node, and find the topmost
+        # of them.  Parents always have lower indices than their children,
+        # so visiting in descending order sees children before parents.
+        node_to_num_nodes = {}
+        wasted_subtrees = []
+        for node_index in sorted(self._node_to_depth.keys(), reverse=True):
+            if node_index in productive_nodes:
+                continue
+
+            num_nodes = node_to_num_nodes.get(node_index, 0) + 1
+            parent_index = self._node_to_parent.get(node_index)
+            if (parent_index is None) or (parent_index in productive_nodes):
+                wasted_subtrees.append(SolverTraceAnalyzer.WastedSubtree(node_index, self._node_to_depth[node_index], num_nodes))
+            else:
+                node_to_num_nodes[parent_index] = node_to_num_nodes.get(parent_index, 0) + num_nodes
+
+        wasted_subtrees.sort(key=lambda subtree: (-subtree.num_nodes, subtree.node_index))
+        if max_num_subtrees is not None:
+            wasted_subtrees = wasted_subtrees[:max_num_subtrees]
+        return wasted_subtrees
+
+    # Average number of children of the nodes that forked, by depth.
+    def get_fan_out_by_depth(self) -> Mapping[int, float]:
+        fan_out = {}
+        for depth, num_forks in sorted(self._depth_to_num_forks.items()):
+            fan_out[depth] = self._depth_to_num_fork_children[depth] / num_forks
+        return fan_out
+
+    def get_num_solutions(self) -> int:
+        return len(self._solution_nodes)
+
+    def _add_event(self, event: Mapping[str, object]):
+        event_type = event["e"]
+        if event_type == SolverTraceRecorder.EVENT_BEST:
+            source_index = event["s"]
+            summary = self._source_index_to_evaluator_summary.get(source_index)
+            if summary is None:
+                summary = SolverTraceAnalyzer.EvaluatorSummary(source_index)
+                self._source_index_to_evaluator_summary[source_index] = summary
+            summary.num_evaluations += 1
+            summary.total_ns += event["ns"]
+            summary.num_moves_offered += event["m"]
+        elif event_type == SolverTraceRecorder.EVENT_EXPAND:
+            self._node_to_depth[event["n"]] = event["d"]
+        elif event_type == SolverTraceRecorder.EVENT_FORK:
+            depth = event["d"]
+            children = event["c"]
+            for child_index in children:
+                self._node_to_parent[child_index] = event["n"]
+                self._node_to_depth[child_index] = depth + 1
+            self._depth_to_num_forks[depth] = self._depth_to_num_forks.get(depth, 0) + 1
+            self._depth_to_num_fork_children[depth] = self._depth_to_num_fork_children.get(depth, 0) + len(children)
+        elif event_type == SolverTraceRecorder.EVENT_SOLUTION:
+            self._solution_nodes.add(event["n"])
+        elif event_type == SolverTraceRecorder.EVENT_RESTART:
+            self._node_to_parent.clear()
+            self._node_to_depth.clear()
+            self._solution_nodes.clear()
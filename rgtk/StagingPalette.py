@@ -1,4 +1,5 @@
 from typing import Mapping
+from rgtk.BitmaskInterner import BitmaskInterner
 from rgtk.ColorEntry import ColorEntry
 from rgtk.BitSet import BitSet
 
@@ -6,12 +7,40 @@ from rgtk.BitSet import BitSet
 # which pixel values will end up in which slot when transformed into a final
 # palette.
 class StagingPalette:
+    # Static vars
+    # Palettes with at least this many slots are "large" (e.g., 256 color
+    # modes).  Their interchangeable entries are pooled when fitting colors,
+    # rather than each being tried individually.
+    LARGE_PALETTE_NUM_SLOTS = 64
+
     def __init__(self, num_slots: int):
         self.color_entries = []
         while num_slots > 0:
             self.color_entries.append(ColorEntry())
             num_slots = num_slots - 1
 
+    def is_large_palette(self) -> bool:
+        return len(self.color_entries) >= StagingPalette.LARGE_PALETTE_NUM_SLOTS
+
+    # Returns a hashable snapshot of the palette's contents, entry by entry.
+    def get_signature(self) -> tuple:
+        return tuple(color_entry.get_signature() for color_entry in self.color_entries)
+
+    # Returns a bitmask of the palette's colors (see ColorEntry.s_color_interner).
+    def get_color_mask(self) -> int:
+        color_mask = 0
+        for color_entry in self.color_entries:
+            color_mask |= color_entry.get_color_bit()
+        return color_mask
+
+    # A quick test of whether a set of colors could possibly fit:  every
+    # distinct color needs an entry of its own.  Passing this doesn't mean
+    # they *will* fit (intentions may conflict), but failing it means they
+    # won't.
+    def could_fit_color_mask(self, color_mask: int) -> bool:
+        num_colors_needed = BitmaskInterner.get_num_bits(self.get_color_mask() | color_mask)
+        return num_colors_needed <= len(self.color_entries)
+
     def create_final_palette_mapping(self) -> Mapping[int, int]:
         # This returns a mapping of color entry indices to
         # final palette indices.  We need to do this because
@@ -48,7 +77,7 @@ class StagingPalette:
                     unassigned_source_bitset.clear_bit(color_entry_index)
 
                     # The destination slot has been assigned.
-                    unassigned_dest_bitset.clear_bit(color_entry_index)
+                    unassigned_dest_bitset.clear_bit(slot)
 
         # Let's go back through any that are unassigned in the source list.
         unassigned_source_idx = unassigned_source_bitset.get_next_set_bit_index(0)
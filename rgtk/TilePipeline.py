@@ -0,0 +1,358 @@
+import time
+from typing import Callable, List, Mapping, Optional, Tuple
+from rgtk.BitSet import BitSet
+from rgtk.ColorEntry import ColorEntry
+from rgtk.ColorRemap import ColorRemap
+from rgtk.ColorRemapsIntoStagingPalettesEvaluator import ColorRemapsIntoStagingPalettesEvaluator
+from rgtk.constraint_solver import ConstraintSolver, Move
+from rgtk.IndexedColorArray import IndexedColorArray
+from rgtk.Interval import Interval
+from rgtk.IntervalsToBitSetsGreedyPlacer import IntervalsToBitSetsGreedyPlacer
+from rgtk.NameTableEntry import NameTableEntry
+from rgtk.Pattern import Pattern
+from rgtk.PixelArray import PixelArray
+from rgtk.SolutionCache import SolutionCache
+from rgtk.StagingPalette import StagingPalette
+
+# Converts images into staging palettes, unique patterns, VRAM locations and
+# nametables in one go.  This is what examples/NameTableGeneration.py does
+# by hand, as a set of stages:
+#   ColorRemap:      solve every asset's colors into the staging palettes.
+#   PatternIndices:  dice each image into patterns of staging palette indices.
+#   UniquePatterns:  strip duplicate patterns (including flipped ones), across
+#                    all assets.
+#   VRAM:            find a home for each asset's unique patterns.
+#   NameTables:      build a NameTableEntry for every pattern of every asset.
+#
+# Each stage remembers a signature of its inputs, and is skipped on the next
+# run() if they haven't changed.  A stage whose output comes out the same as
+# last time doesn't cause the stages after it to run again, either.  So
+# after editing one asset's pixels without changing its colors, only the
+# pattern stages (and whatever they actually change) are redone.
+#
+# Lookups that the script does with linear searches are instead kept as
+# indices as the stages go (e.g., each asset's staging palette index), and
+# each image is converted to staging indices once, into one buffer that
+# the patterns are sliced from.
+#
+# Patterns are deduplicated by hash in asset order, the same matching that
+# PatternsIntoPatternHashMapsEvaluator does, so the first of each set of
+# duplicates is the unique one.  VRAM is placed with an
+# IntervalsToBitSetsGreedyPlacer, which falls back to a full search.  The
+# color remap is solved with a ConstraintSolver, through a SolutionCache
+# if one is given.
+class TilePipeline:
+    class NoSolutionError(Exception):
+        def __init__(self, stage_name: str):
+            self.stage_name = stage_name
+
+    # Thrown when an image isn't a whole number of patterns across or down.
+    class InvalidAssetSizeError(Exception):
+        def __init__(self, asset_name: str, width: int, height: int, pattern_width: int, pattern_height: int):
+            self.asset_name = asset_name
+            self.width = width
+            self.height = height
+            self.pattern_width = pattern_width
+            self.pattern_height = pattern_height
+
+    # One image to convert, and the constraints on it.
+    class Asset:
+        def __init__(self, name: str, pixel_array: PixelArray
+            , color_remap: Optional[Mapping[object, ColorEntry]] = None
+            , remap_intentions_map: Optional[Mapping[str, object]] = None
+            , flips_allowed: Pattern.Flip = Pattern.Flip.NONE
+            , VRAM_begin: int = 0, VRAM_end: Optional[int] = None, VRAM_fixed: bool = False
+            , VRAM_alignment: int = 1, VRAM_bank_size: Optional[int] = None
+            , pattern_width: int = 8, pattern_height: int = 8):
+            self.name = name
+            self.pixel_array = pixel_array
+
+            # Passed to the ColorRemap (see ColorRemap).
+            self.color_remap = color_remap if color_remap is not None else {}
+            self.remap_intentions_map = remap_intentions_map if remap_intentions_map is not None else {}
+
+            self.flips_allowed = flips_allowed
+
+            # Where the unique patterns may go.  If VRAM_fixed, they must
+            # start at VRAM_begin.  VRAM_end of None is the end of VRAM.
+            self.VRAM_begin = VRAM_begin
+            self.VRAM_end = VRAM_end
+            self.VRAM_fixed = VRAM_fixed
+            self.VRAM_alignment = VRAM_alignment
+            self.VRAM_bank_size = VRAM_bank_size
+
+            self.pattern_width = pattern_width
+            self.pattern_height = pattern_height
+
+    # What the pipeline made of an Asset.
+    class AssetResult:
+        def __init__(self):
+            self.color_remap = None
+            self.staging_palette_index = None
+
+            self.width_in_patterns = 0
+            self.height_in_patterns = 0
+
+            # Each pattern of the image, left to right, top to bottom, as a
+            # tuple of staging palette indices.
+            self.pattern_indices = []
+
+            # The unique patterns that this asset adds, in VRAM order.
+            self.unique_patterns = []
+
+            # Where the first unique pattern goes (None if the asset has none
+            # of its own, i.e., all its patterns match another asset's).
+            self.VRAM_loc = None
+
+            # One NameTableEntry per pattern of the image.
+            self.nametable = []
+
+            # For each pattern of the image:  (index of the asset owning its
+            # unique pattern, index within that asset's unique patterns, flips).
+            self._pattern_to_unique = []
+
+    # Static vars
+    STAGE_COLOR_REMAP = "ColorRemap"
+    STAGE_PATTERN_INDICES = "PatternIndices"
+    STAGE_UNIQUE_PATTERNS = "UniquePatterns"
+    STAGE_VRAM = "VRAM"
+    STAGE_NAMETABLES = "NameTables"
+
+    STAGES = [STAGE_COLOR_REMAP, STAGE_PATTERN_INDICES, STAGE_UNIQUE_PATTERNS, STAGE_VRAM, STAGE_NAMETABLES]
+
+    DEFAULT_STAGING_PALETTE_SIZES = [16, 16]
+    DEFAULT_VRAM_SIZE = 448
+
+    def __init__(self, staging_palette_sizes: List[int] = DEFAULT_STAGING_PALETTE_SIZES, VRAM_size: int = DEFAULT_VRAM_SIZE, solution_cache: Optional[SolutionCache] = None):
+        self.staging_palette_sizes = list(staging_palette_sizes)
+        self.VRAM_size = VRAM_size
+        self.solution_cache = solution_cache
+
+        self.assets = []
+        self.results = []
+
+        # Outputs shared by all assets.
+        self.staging_palettes = []
+        self.VRAM_bitset = None
+
+        # Per stage:  the signature of its inputs and of its output the last
+        # time it ran, and how many times its output has changed.
+        self._stage_to_input_signature = {}
+        self._stage_to_output_signature = {}
+        self._stage_to_generation = {stage_name: 0 for stage_name in TilePipeline.STAGES}
+
+        # What the last run() did.
+        self.stage_to_elapsed_seconds = {}
+        self.skipped_stages = []
+
+    # Returns the index of the asset.  Assets may be changed (e.g., given
+    # new pixels) between runs.
+    def add_asset(self, asset: 'TilePipeline.Asset') -> int:
+        self.assets.append(asset)
+        self.results.append(TilePipeline.AssetResult())
+        return len(self.assets) - 1
+
+    def get_result(self, asset_index: int) -> 'TilePipeline.AssetResult':
+        return self.results[asset_index]
+
+    # Runs every stage whose inputs changed since the last run.
+    def run(self):
+        self.stage_to_elapsed_seconds = {}
+        self.skipped_stages = []
+
+        # Snapshot the pixels once; both of the first two stages depend on them.
+        asset_pixels = [tuple(asset.pixel_array.pixels) for asset in self.assets]
+
+        color_remaps = [self._create_color_remap(asset, pixels) for asset, pixels in zip(self.assets, asset_pixels)]
+        color_remap_signature = (
+              tuple(self.staging_palette_sizes)
+            , tuple((tuple(color_remap.source_pixel_value_to_index.keys()), color_remap.get_signature(), color_remap.get_color_entries_signature()) for color_remap in color_remaps)
+        )
+        self._run_stage(TilePipeline.STAGE_COLOR_REMAP, color_remap_signature, lambda: self._run_color_remap_stage(color_remaps))
+
+        pattern_indices_signature = (
+              self._stage_to_generation[TilePipeline.STAGE_COLOR_REMAP]
+            , tuple((pixels, asset.pixel_array.width, asset.pixel_array.height, asset.pattern_width, asset.pattern_height) for asset, pixels in zip(self.assets, asset_pixels))
+        )
+        self._run_stage(TilePipeline.STAGE_PATTERN_INDICES, pattern_indices_signature, lambda: self._run_pattern_indices_stage(asset_pixels))
+
+        unique_patterns_signature = (
+              self._stage_to_generation[TilePipeline.STAGE_PATTERN_INDICES]
+            , tuple(int(asset.flips_allowed) for asset in self.assets)
+        )
+        self._run_stage(TilePipeline.STAGE_UNIQUE_PATTERNS, unique_patterns_signature, self._run_unique_patterns_stage)
+
+        VRAM_signature = (
+              self._stage_to_generation[TilePipeline.STAGE_UNIQUE_PATTERNS]
+            , self.VRAM_size
+            , tuple((asset.VRAM_begin, asset.VRAM_end, asset.VRAM_fixed, asset.VRAM_alignment, asset.VRAM_bank_size) for asset in self.assets)
+        )
+        self._run_stage(TilePipeline.STAGE_VRAM, VRAM_signature, self._run_VRAM_stage)
+
+        nametables_signature = (
+              self._stage_to_generation[TilePipeline.STAGE_COLOR_REMAP]
+            , self._stage_to_generation[TilePipeline.STAGE_UNIQUE_PATTERNS]
+            , self._stage_to_generation[TilePipeline.STAGE_VRAM]
+        )
+        self._run_stage(TilePipeline.STAGE_NAMETABLES, nametables_signature, self._run_nametables_stage)
+
+    def _run_stage(self, stage_name: str, input_signature: object, stage_function: Callable[[], object]):
+        if (stage_name in self._stage_to_input_signature) and (self._stage_to_input_signature[stage_name] == input_signature):
+            self.skipped_stages.append(stage_name)
+            return
+
+        start_time = time.perf_counter()
+        output_signature = stage_function()
+        self.stage_to_elapsed_seconds[stage_name] = time.perf_counter() - start_time
+
+        self._stage_to_input_signature[stage_name] = input_signature
+
+        # Only a different output makes the following stages run again.
+        if (stage_name not in self._stage_to_output_signature) or (self._stage_to_output_signature[stage_name] != output_signature):
+            self._stage_to_output_signature[stage_name] = output_signature
+            self._stage_to_generation[stage_name] += 1
+
+    def _create_color_remap(self, asset: 'TilePipeline.Asset', pixels: Tuple[object, ...]) -> ColorRemap:
+        # Unique pixels in the order first seen, as
+        # PixelArray.generate_deterministic_unique_pixel_list() does.
+        unique_pixel_values_list = list(dict.fromkeys(pixels))
+        return ColorRemap(initial_intentions_map=asset.remap_intentions_map, unique_pixel_values_list=unique_pixel_values_list, color_remap=asset.color_remap)
+
+    def _run_color_remap_stage(self, color_remaps: List[ColorRemap]) -> tuple:
+        staging_palettes = [StagingPalette(num_slots) for num_slots in self.staging_palette_sizes]
+
+        solution = self._solve_color_remaps(color_remaps, staging_palettes)
+        if solution is None:
+            raise TilePipeline.NoSolutionError(TilePipeline.STAGE_COLOR_REMAP)
+
+        for move in solution:
+            color_remap = color_remaps[move.source_index]
+            color_remap.remap_to_staging_palette(move, staging_palettes)
+            ColorRemapsIntoStagingPalettesEvaluator.apply_changes(color_remap, staging_palettes[move.dest_index], move.change_list)
+
+            result = self.results[move.source_index]
+            result.color_remap = color_remap
+            result.staging_palette_index = move.dest_index
+
+        self.staging_palettes = staging_palettes
+
+        return tuple((result.staging_palette_index, tuple(result.color_remap.staging_palette_indices)) for result in self.results)
+
+    def _solve_color_remaps(self, color_remaps: List[ColorRemap], staging_palettes: List[StagingPalette]) -> Optional[List[Move]]:
+        if self.solution_cache is not None:
+            solutions = self.solution_cache.get_or_solve(color_remaps, staging_palettes, ColorRemapsIntoStagingPalettesEvaluator)
+        else:
+            solver = ConstraintSolver(color_remaps, staging_palettes, ColorRemapsIntoStagingPalettesEvaluator, None)
+            while solver.run(1024, 1) == ConstraintSolver.RUN_RESULT_MAX_STEPS_REACHED:
+                pass
+            solutions = solver.solutions
+
+        if len(solutions) == 0:
+            return None
+        return solutions[0]
+
+    def _run_pattern_indices_stage(self, asset_pixels: List[Tuple[object, ...]]) -> tuple:
+        for asset, pixels, result in zip(self.assets, asset_pixels, self.results):
+            width = asset.pixel_array.width
+            height = asset.pixel_array.height
+            pattern_width = asset.pattern_width
+            pattern_height = asset.pattern_height
+            if (width % pattern_width != 0) or (height % pattern_height != 0):
+                raise TilePipeline.InvalidAssetSizeError(asset.name, width, height, pattern_width, pattern_height)
+
+            # Convert the whole image in one pass, through a table of pixel
+            # value -> staging index.
+            color_remap = result.color_remap
+            pixel_to_staging_index = {pixel: color_remap.staging_palette_indices[unique_idx] for pixel, unique_idx in color_remap.source_pixel_value_to_index.items()}
+            staging_indices = [pixel_to_staging_index[pixel] for pixel in pixels]
+
+            # Then slice each pattern out of it, a row at a time.
+            pattern_indices = []
+            for start_y in range(0, height, pattern_height):
+                for start_x in range(0, width, pattern_width):
+                    indices = []
+                    for row_start in range((start_y * width) + start_x, ((start_y + pattern_height) * width) + start_x, width):
+                        indices.extend(staging_indices[row_start:row_start + pattern_width])
+                    pattern_indices.append(tuple(indices))
+
+            result.width_in_patterns = width // pattern_width
+            result.height_in_patterns = height // pattern_height
+            result.pattern_indices = pattern_indices
+
+        return tuple(tuple(result.pattern_indices) for result in self.results)
+
+    def _run_unique_patterns_stage(self) -> tuple:
+        # Hash of a unique pattern (unflipped) -> (asset index, unique index).
+        hash_to_unique = {}
+
+        for asset_idx, asset in enumerate(self.assets):
+            result = self.results[asset_idx]
+            intentions_map = {Pattern.INTENTION_FLIPS_ALLOWED: asset.flips_allowed}
+
+            unique_patterns = []
+            pattern_to_unique = []
+            for indices in result.pattern_indices:
+                pattern = Pattern(index_array=IndexedColorArray(asset.pattern_width, asset.pattern_height, list(indices)), initial_intentions_map=intentions_map)
+
+                # Unflipped matches first, as PatternsIntoPatternHashMapsEvaluator does.
+                match = None
+                for flip in Pattern.ALL_FLIPS:
+                    hash_val = pattern.get_hash_for_flip(flip)
+                    if (hash_val is not None) and (hash_val in hash_to_unique):
+                        match = hash_to_unique[hash_val] + (flip,)
+                        break
+
+                if match is None:
+                    # It's unique.
+                    match = (asset_idx, len(unique_patterns), Pattern.Flip.NONE)
+                    hash_to_unique[pattern.get_hash_for_flip(Pattern.Flip.NONE)] = match[:2]
+                    unique_patterns.append(pattern)
+
+                pattern_to_unique.append(match)
+
+            result.unique_patterns = unique_patterns
+            result._pattern_to_unique = pattern_to_unique
+
+        return tuple((len(result.unique_patterns), tuple(result._pattern_to_unique)) for result in self.results)
+
+    def _run_VRAM_stage(self) -> tuple:
+        # Only assets with unique patterns of their own need room.
+        intervals = []
+        interval_asset_indices = []
+        for asset_idx, asset in enumerate(self.assets):
+            num_patterns = len(self.results[asset_idx].unique_patterns)
+            if num_patterns == 0:
+                continue
+
+            if asset.VRAM_fixed:
+                interval = Interval(begin=asset.VRAM_begin, end=asset.VRAM_begin + num_patterns - 1, length=num_patterns, alignment=asset.VRAM_alignment, bank_size=asset.VRAM_bank_size)
+            else:
+                VRAM_end = asset.VRAM_end if asset.VRAM_end is not None else self.VRAM_size - 1
+                interval = Interval(begin=asset.VRAM_begin, end=VRAM_end, length=num_patterns, alignment=asset.VRAM_alignment, bank_size=asset.VRAM_bank_size)
+            intervals.append(interval)
+            interval_asset_indices.append(asset_idx)
+
+        VRAM_bitset = BitSet(self.VRAM_size)
+        placer = IntervalsToBitSetsGreedyPlacer(intervals, [VRAM_bitset])
+        solution = placer.solve_with_fallback()
+        if solution is None:
+            raise TilePipeline.NoSolutionError(TilePipeline.STAGE_VRAM)
+        placer.apply_solution(solution)
+
+        for result in self.results:
+            result.VRAM_loc = None
+        for move in solution:
+            self.results[interval_asset_indices[move.source_index]].VRAM_loc = move.change_list.chosen_interval.begin
+
+        self.VRAM_bitset = VRAM_bitset
+
+        return tuple(result.VRAM_loc for result in self.results)
+
+    def _run_nametables_stage(self) -> None:
+        VRAM_locs = [result.VRAM_loc for result in self.results]
+        for result in self.results:
+            palette_index = result.staging_palette_index
+            result.nametable = [NameTableEntry(VRAM_loc=VRAM_locs[owner_idx] + unique_idx, palette_index=palette_index, flips=flips) for owner_idx, unique_idx, flips in result._pattern_to_unique]
+
+        # Nothing follows this stage.
+        return None
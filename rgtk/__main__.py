@@ -0,0 +1,30 @@
+import argparse
+import sys
+from rgtk.BatchConverter import BatchConverter
+from rgtk.TilePipeline import TilePipeline
+
+# The "rgtk" command (or "python -m rgtk"):  converts the images in a
+# manifest (see BatchConverter).
+def main():
+    parser = argparse.ArgumentParser(prog="rgtk", description="Converts the images described by a JSON manifest into pattern, nametable and palette files.")
+    parser.add_argument("manifest", help="The JSON manifest of assets to convert.")
+    parser.add_argument("--output", help="Directory to write the files to.  Defaults to the manifest's output_directory.")
+    parser.add_argument("--jobs", "-j", type=int, help="Groups to convert at once.  Defaults to the number of CPUs.")
+    parser.add_argument("--cache", help="Directory to keep solutions in between builds.")
+    parser.add_argument("--timings", action="store_true", help="Print how long each stage took for each group.")
+    args = parser.parse_args()
+
+    try:
+        converter = BatchConverter.create_from_file(args.manifest)
+        group_outputs = converter.run(output_directory=args.output, num_processes=args.jobs, cache_directory=args.cache)
+    except (OSError, BatchConverter.ManifestError, BatchConverter.ConversionError) as error:
+        print(f"rgtk: {error}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.timings:
+        for group_output in group_outputs:
+            stage_timings = ", ".join(f"{stage_name} {group_output.stage_to_elapsed_seconds[stage_name] * 1000:.1f}ms" for stage_name in TilePipeline.STAGES if stage_name in group_output.stage_to_elapsed_seconds)
+            print(f"{group_output.group_name}: {stage_timings}", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
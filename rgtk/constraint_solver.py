@@ -1,10 +1,14 @@
+import asyncio
 import math
 import copy
-from typing import List, Tuple
+import threading
+import time
+from typing import Callable, List, Tuple, Optional
 
 from rgtk.BitSet import BitSet
 from rgtk.FSM import FSM, State
-from rgtk.SimpleTimer import SimpleTimer
+from rgtk.Profiler import Profiler
+from rgtk.SolverTrace import SolverTraceRecorder
 
 class Move:
     def __init__(self, source_index: int, dest_index: int, change_list: object):
@@ -36,27 +40,92 @@ class Evaluator:
     def is_destination_empty(destination: object) -> bool:
         pass
 
+    # Given a move from a previous solution, returns the equivalent move that
+    # this evaluator currently offers (or None if it is no longer valid).
+    # Used when warm starting a solver from a previous solution.
+    def get_matching_move(self, previous_move: Move) -> Optional[Move]:
+        return None
+
+    # Packs a move's change list into plain values (ints, strings, tuples and
+    # None) that refer to sources and destinations only by index, and back.
+    # See SolutionEncoding.
+    @classmethod
+    def encode_change_list(cls, change_list: object, source_index: int, dest_index: int, encoding: 'SolutionEncoding') -> object:
+        raise Exception("Not implemented in child class.")
+
+    @classmethod
+    def decode_change_list(cls, payload: object, source_index: int, dest_index: int, encoding: 'SolutionEncoding') -> object:
+        raise Exception("Not implemented in child class.")
+
+    # The constants (scores, options, etc.) that the solutions found with
+    # this evaluator depend on, as (name, value) pairs.  SolutionCache keys
+    # on these.  Defaults to every constant of the class; override to leave
+    # out ones that only tune speed or memory use (such as cache sizes), and
+    # to add those of any evaluators used for nested solves.
+    @classmethod
+    def get_result_constants(cls) -> List[Tuple[str, object]]:
+        return Evaluator._get_class_constants(cls)
+
+    # The constants (ALL_CAPS attributes of simple types) of a class and its
+    # bases, named by class so that different classes' can't be confused.
+    @staticmethod
+    def _get_class_constants(klass: type, excluded_names: Tuple[str, ...] = ()) -> List[Tuple[str, object]]:
+        constants = []
+        for name in dir(klass):
+            if name.startswith("_") or (name != name.upper()) or (name in excluded_names):
+                continue
+            value = getattr(klass, name)
+            if isinstance(value, (type(None), bool, int, float, str, tuple, list, dict, frozenset)):
+                constants.append((klass.__qualname__ + "." + name, value))
+        return constants
+
 class ConstraintSolver:
     # Static vars
-    s_timer_names = [
-          "ApplySolution"
-        , "SolutionSuccessful"
-        , "SubsetInit"
-        , "AssessMoves"
-        , "GetBestMoves"
-        , "ExecuteMove"
-    ]
-
-    def __init__(self, sources: List[object], destinations: List[object], evaluator_class: any, debugging: any):
-        # Create our timers.
-        self.timer_name_to_timer = {}
-        for name in ConstraintSolver.s_timer_names:
-            self.timer_name_to_timer[name] = SimpleTimer(name)
-
-        # Track our tree of solver nodes.
-        self._subset_tree = []
+    # Names of the phases timed when a Profiler is provided.
+    PROFILE_PHASE_APPLY_SOLUTION = "ApplySolution"
+    PROFILE_PHASE_SOLUTION_SUCCESSFUL = "SolutionSuccessful"
+    PROFILE_PHASE_SUBSET_INIT = "SubsetInit"
+    PROFILE_PHASE_ASSESS_MOVES = "AssessMoves"
+    PROFILE_PHASE_GET_BEST_MOVES = "GetBestMoves"
+    PROFILE_PHASE_EXECUTE_MOVE = "ExecuteMove"
+
+    # What stopped a call to run().
+    RUN_RESULT_MAX_STEPS_REACHED = 0
+    RUN_RESULT_MAX_SOLUTIONS_FOUND = 1
+    RUN_RESULT_EXHAUSTED = 2
+    RUN_RESULT_TIME_SLICE_EXPIRED = 3
+
+    # When step_for() is running, the deadline (in time.perf_counter()
+    # seconds) that long operations within a step, such as nested solves,
+    # should yield by.  Per thread, so that solvers on different threads
+    # don't cut each other short.
+    s_time_slice = threading.local()
+
+    def __init__(self, sources: List[object], destinations: List[object], evaluator_class: any, debugging: any, warm_start_solution: Optional[List[Move]] = None, profiler: Optional[Profiler] = None, trace: Optional[SolverTraceRecorder] = None):
+        # If we were given a profiler, we'll time each phase of solving with it.
+        # Otherwise, profiling is skipped entirely.
+        self._profiler = profiler
+
+        # Likewise, if we were given a trace recorder, we'll record the search
+        # tree as we go.
+        self._trace = trace
+
+        # Statistics about the search, kept up to date as we go.
+        self._stats = ConstraintSolver.SolverStats()
+
+        # Optionally, somebody can be called every so many updates to hear
+        # how the search is going.
+        self._progress_callback = None
+        self._num_updates_between_progress_callbacks = 0
+
+        # Track our tree of solver nodes, by node index.  Only *live* nodes are
+        # kept:  those that are queued, being solved, or are ancestors of either.
+        # Nodes whose subtrees have been fully explored are pruned so that memory
+        # is proportional to the frontier rather than to every node visited.
+        self._subset_tree = {}
+        self._next_subset_tree_node_index = 0
         # We'll start with node with no moves.
-        self._subset_tree.append(ConstraintSolver.SolverSubsetNode(parent=None, moves_list=[]))
+        self._add_subset_tree_node(ConstraintSolver.SolverSubsetNode(parent=None, moves_list=[]))
 
         # Where is this subset founded?
         self._current_subset_solver_tree_node_index = -1
@@ -72,6 +141,12 @@ class ConstraintSolver:
 
         self._debugging = debugging
 
+        # If we were handed a previous solution, we'll replay whichever of its
+        # moves are still valid before searching for the rest.  If that doesn't
+        # pan out, we'll fall back to a full search.
+        self._warm_start_solution = warm_start_solution
+        self._warm_start_moves_replayed = False
+
         # We'll let the first iteration of the solver pull from the WIP.
         self._current_subset_solver = None
         
@@ -88,13 +163,172 @@ class ConstraintSolver:
         return False
 
     def update(self):
+        stats = self._stats
+
+        # Only the first step is timed (see SolverStats.begin_time), so that
+        # stepping one update at a time costs no more than it did before
+        # stats existed.
+        if stats.begin_time is None:
+            stats.begin_time = time.perf_counter()
+
         self._fsm.update()
 
+        stats.num_updates += 1
+        stats.queue_length = len(self._subset_tree_visit_queue)
+        if stats.queue_length > stats.max_queue_length:
+            stats.max_queue_length = stats.queue_length
+
+        if (self._progress_callback is not None) and (stats.num_updates % self._num_updates_between_progress_callbacks == 0):
+            self._progress_callback(self)
+
+    # Takes up to max_steps steps (each the same as one call to update()) in
+    # a tight loop, stopping early if the search is exhausted or there are at
+    # least max_solutions solutions.  Returns one of the RUN_RESULT_* values.
+    #
+    # This skips the state machine's dispatch and exceptions, so it's much
+    # cheaper per step than calling update() in a loop.  The two can be
+    # mixed freely.
+    def run(self, max_steps: int, max_solutions: Optional[int] = None) -> int:
+        return self._run(max_steps, max_solutions, None)
+
+    # Like run(), but stops once ms milliseconds have passed, returning
+    # RUN_RESULT_TIME_SLICE_EXPIRED.  Call it again to pick up where it left
+    # off.
+    #
+    # Long operations within a step can yield partway through, too:  an
+    # evaluator running a nested solve can check is_time_slice_expired(),
+    # set the nested solver aside and raise TimeSliceExpired.  The step is
+    # then retried on the next call, and the evaluator resumes its nested
+    # solver rather than starting over.  Every call makes some progress,
+    # however small ms is.
+    def step_for(self, ms: float, max_solutions: Optional[int] = None) -> int:
+        deadline = time.perf_counter() + (ms / 1000.0)
+
+        # Don't outlast a time slice we're nested inside of.
+        outer_deadline = getattr(ConstraintSolver.s_time_slice, "deadline", None)
+        if (outer_deadline is not None) and (outer_deadline < deadline):
+            deadline = outer_deadline
+
+        return self._run(math.inf, max_solutions, deadline)
+
+    # Solves in slices of ms_per_slice milliseconds, letting other tasks
+    # run between them.  Stops on the same conditions as run(), and returns
+    # RUN_RESULT_MAX_SOLUTIONS_FOUND or RUN_RESULT_EXHAUSTED.
+    async def run_async(self, ms_per_slice: float = 10.0, max_solutions: Optional[int] = None) -> int:
+        while True:
+            result = self.step_for(ms_per_slice, max_solutions)
+            if result != ConstraintSolver.RUN_RESULT_TIME_SLICE_EXPIRED:
+                return result
+
+            await asyncio.sleep(0)
+
+    # Returns true if we're within step_for() and its time is up.
+    @staticmethod
+    def is_time_slice_expired() -> bool:
+        deadline = getattr(ConstraintSolver.s_time_slice, "deadline", None)
+        return (deadline is not None) and (time.perf_counter() >= deadline)
+
+    def _run(self, max_steps: int, max_solutions: Optional[int], deadline: Optional[float]) -> int:
+        stats = self._stats
+        progress_callback = self._progress_callback
+        if stats.begin_time is None:
+            stats.begin_time = time.perf_counter()
+
+        state = self._fsm.get_current_state()
+        num_steps = 0
+        result = ConstraintSolver.RUN_RESULT_MAX_STEPS_REACHED
+        while True:
+            if state == ConstraintSolver.ExhaustedState:
+                result = ConstraintSolver.RUN_RESULT_EXHAUSTED
+                break
+            if (max_solutions is not None) and (len(self.solutions) >= max_solutions):
+                result = ConstraintSolver.RUN_RESULT_MAX_SOLUTIONS_FOUND
+                break
+            if num_steps >= max_steps:
+                break
+            if (deadline is not None) and (num_steps > 0) and (time.perf_counter() >= deadline):
+                result = ConstraintSolver.RUN_RESULT_TIME_SLICE_EXPIRED
+                break
+
+            # These mirror the states' on_update() functions.
+            if state == ConstraintSolver.AssessMovesState:
+                if deadline is None:
+                    assessed = self._current_subset_solver._try_assess_moves()
+                else:
+                    # Assessing is where evaluators do their heavy lifting,
+                    # so it's the one place we let them yield.  The step
+                    # will be retried next time.
+                    try:
+                        assessed = self._assess_moves_with_deadline(deadline)
+                    except ConstraintSolver.TimeSliceExpired:
+                        result = ConstraintSolver.RUN_RESULT_TIME_SLICE_EXPIRED
+                        break
+
+                if assessed:
+                    state = ConstraintSolver.SelectMovesState
+                else:
+                    self._accept_current_subset_solver_as_successful()
+                    state = self._start_next_subset_solver()
+            else:
+                if self._current_subset_solver._try_choose_next_moves():
+                    state = ConstraintSolver.AssessMovesState
+                else:
+                    self._accept_current_subset_solver_as_failed()
+                    state = self._start_next_subset_solver()
+
+            num_steps += 1
+            stats.num_updates += 1
+            queue_length = len(self._subset_tree_visit_queue)
+            if queue_length > stats.max_queue_length:
+                stats.max_queue_length = queue_length
+
+            if (progress_callback is not None) and (stats.num_updates % self._num_updates_between_progress_callbacks == 0):
+                stats.queue_length = queue_length
+                self._progress_callback(self)
+
+        # Leave the state machine where we left off.  The states we land in
+        # don't do anything on entry, so this only records where we are.
+        if state != self._fsm.get_current_state():
+            self._fsm.transition_state(state)
+
+        stats.queue_length = len(self._subset_tree_visit_queue)
+
+        return result
+
+    def _assess_moves_with_deadline(self, deadline: float) -> bool:
+        time_slice = ConstraintSolver.s_time_slice
+        outer_deadline = getattr(time_slice, "deadline", None)
+        time_slice.deadline = deadline
+        try:
+            return self._current_subset_solver._try_assess_moves(deadline)
+        finally:
+            time_slice.deadline = outer_deadline
+
+    def get_stats(self) -> 'ConstraintSolver.SolverStats':
+        return self._stats
+
+    # Calls the callback with this solver every num_updates_between_calls
+    # calls to update().  Pass None to stop.
+    def set_progress_callback(self, callback: Optional[Callable[['ConstraintSolver'], None]], num_updates_between_calls: int = 1000):
+        if num_updates_between_calls < 1:
+            raise ValueError(f"Progress callback interval must be at least 1 update, got {num_updates_between_calls}.")
+
+        self._progress_callback = callback
+        self._num_updates_between_progress_callbacks = num_updates_between_calls
+
+    # Returns how many search tree nodes are currently being kept alive.
+    def get_num_live_subset_tree_nodes(self) -> int:
+        return len(self._subset_tree)
+
+    def get_profiler(self) -> Optional[Profiler]:
+        return self._profiler
+
     # Applies a solution provided by the constraint solver to the original destination.
     # Returns a set of how sources are mapped to destinations.
     def apply_solution(self, solution: List[Move]):
-        timer = self.timer_name_to_timer["ApplySolution"]
-        timer.begin()
+        profiler = self._profiler
+        if profiler is not None:
+            begin_ns = profiler.begin()
 
         for move in solution:
             source_index = move.source_index
@@ -107,7 +341,8 @@ class ConstraintSolver:
 
             self._evaluator_class.apply_changes(source, destination, change_list)
 
-        timer.end()
+        if profiler is not None:
+            profiler.end(ConstraintSolver.PROFILE_PHASE_APPLY_SOLUTION, begin_ns)
 
     def _create_subset_solver(self) -> 'ConstraintSolver.SubsetSolver':
         unmapped_sources_bitset = BitSet(len(self.sources))
@@ -123,6 +358,9 @@ class ConstraintSolver:
 
         # Get next source node from the BFS queue
         self._current_subset_solver_tree_node_index = self._subset_tree_visit_queue.pop(0)
+        self._stats.num_nodes_expanded += 1
+        if self._trace is not None:
+            self._trace.record_expand(self._current_subset_solver_tree_node_index, self._subset_tree[self._current_subset_solver_tree_node_index].depth)
 
         # Apply moves from our parents before us.
         stack = []
@@ -136,8 +374,31 @@ class ConstraintSolver:
             for move in node.moves_list:
                 subset_solver._execute_move(move)
 
+        # If this is the root and we have a warm start, replay what we can.
+        # The replayed moves become part of the root, so every node
+        # searched from here on will start from them.
+        if (self._warm_start_solution is not None) and (self._current_subset_solver_tree_node_index == 0):
+            replayed_moves = subset_solver.replay_moves(self._warm_start_solution)
+            for move in replayed_moves:
+                self._subset_tree[0].moves_list.append(move)
+
+            self._warm_start_moves_replayed = len(replayed_moves) > 0
+
         return subset_solver
 
+    def _restart_without_warm_start(self):
+        # The warm start led nowhere.  Start over with an empty root.
+        if self._trace is not None:
+            self._trace.record_restart()
+
+        self._warm_start_solution = None
+        self._warm_start_moves_replayed = False
+
+        self._subset_tree = {}
+        self._next_subset_tree_node_index = 0
+        self._add_subset_tree_node(ConstraintSolver.SolverSubsetNode(parent=None, moves_list=[]))
+        self._subset_tree_visit_queue = [0]
+
     def _append_moves(self, subset_solver: 'ConstraintSolver.SubsetSolver', child_move_lists: List[List[Move]]):
         # Append this to our current tree.
 
@@ -153,26 +414,32 @@ class ConstraintSolver:
         else:
             # There are multiple move sets.  Need to create child nodes.
             curr_node = self._subset_tree[self._current_subset_solver_tree_node_index]
+            self._stats.record_fork(curr_node.depth, len(child_move_lists))
 
+            continue_node = None
+            child_node_indices = []
             for move_list_idx, move_list in enumerate(child_move_lists):
-                child_node = ConstraintSolver.SolverSubsetNode(parent=curr_node, moves_list=move_list)
-                curr_node.children.append(child_node)
-
-                new_node_idx = len(self._subset_tree)
-                self._subset_tree.append(child_node)
+                child_node = curr_node.add_child(move_list)
+                new_node_idx = self._add_subset_tree_node(child_node)
+                child_node_indices.append(new_node_idx)
 
                 if move_list_idx == 0:
                     # This is our current subset solver, so we'll keep rolling
                     # with it so that we don't have to create a new one.
                     self._current_subset_solver_tree_node_index = new_node_idx
+                    continue_node = child_node
+                    self._stats.num_nodes_expanded += 1
                 else:
                     # Enqueue the other indices for BFS visiting later.
                     self._subset_tree_visit_queue.append(new_node_idx)
 
+            if self._trace is not None:
+                self._trace.record_fork(curr_node.index, curr_node.depth, child_node_indices)
+                self._trace.record_expand(continue_node.index, continue_node.depth)
+
             # Execute the leftmost child's actions so that 
             # we can continue using our current subset solver 
             # without having to create a new one.
-            continue_node = curr_node.children[0]
             for move in continue_node.moves_list:
                 subset_solver._execute_move(move)
 
@@ -193,59 +460,109 @@ class ConstraintSolver:
             for child_move in child_moves:
                 solution_moves.append(child_move)
 
-        # Remove the current subset solver.
+        # Remove the current subset solver.  Its node is finished, so release
+        # it (and any ancestors that no longer have live descendants).
+        self._release_subset_tree_node(self._current_subset_solver_tree_node_index)
         self._current_subset_solver = None
         self._current_subset_solver_tree_node_index = -1
 
         return solution_moves
 
+    def _add_subset_tree_node(self, node: 'ConstraintSolver.SolverSubsetNode') -> int:
+        node_index = self._next_subset_tree_node_index
+        self._next_subset_tree_node_index += 1
+
+        node.index = node_index
+        self._subset_tree[node_index] = node
+
+        stats = self._stats
+        stats.num_nodes_created += 1
+        if node.depth > stats.max_depth:
+            stats.max_depth = node.depth
+
+        return node_index
+
+    def _release_subset_tree_node(self, node_index: int):
+        # Walk up the tree, dropping each node that is no longer referenced by
+        # a live child.  Queued nodes are never released here, since they are
+        # leaves and only the current node (or its ancestors) get released.
+        node = self._subset_tree[node_index]
+        while (node is not None) and (node.num_live_children == 0):
+            del self._subset_tree[node.index]
+
+            parent = node.parent
+            if parent is not None:
+                parent.num_live_children -= 1
+
+                # Detach so that the released subtree can be collected even if
+                # somebody is still holding on to this node.
+                node.parent = None
+
+            node = parent
+
     def _accept_current_subset_solver_as_successful(self):
-        timer = self.timer_name_to_timer["SolutionSuccessful"]
-        timer.begin()
+        profiler = self._profiler
+        if profiler is not None:
+            begin_ns = profiler.begin()
+
+        if self._trace is not None:
+            self._trace.record_solution(self._current_subset_solver_tree_node_index)
 
         # Remove us and get the solutions.
         solution_moves = self._remove_current_subset_solver()
         self.solutions.append(solution_moves)
+        self._stats.num_solutions_found += 1
+
+        if profiler is not None:
+            profiler.end(ConstraintSolver.PROFILE_PHASE_SOLUTION_SUCCESSFUL, begin_ns)
+
+    # Starts solving the next node in the queue.  Returns the state to go to:
+    # AssessMovesState, or ExhaustedState if there's nothing left.
+    def _start_next_subset_solver(self) -> State:
+        if self._current_subset_solver is None:
+            # Has our queue been exhausted?
+            if len(self._subset_tree_visit_queue) == 0:
+                if self._warm_start_moves_replayed and len(self.solutions) == 0:
+                    # Warm start failed; fall back to a full search.
+                    self._restart_without_warm_start()
+                else:
+                    self._stats.end_time = time.perf_counter()
+                    return ConstraintSolver.ExhaustedState
 
-        timer.end()
+            # Otherwise, we'll create a new subset solver from the tree.
+            subset_solver = self._create_subset_solver()
+            self._current_subset_solver = subset_solver
+        return ConstraintSolver.AssessMovesState
 
     def _accept_current_subset_solver_as_failed(self):
+        if self._trace is not None:
+            self._trace.record_fail(self._current_subset_solver_tree_node_index)
+
         # Remove us.
         self._remove_current_subset_solver()
+        self._stats.num_nodes_failed += 1
 
     class AssessCompletionState(State):
         @staticmethod
         def on_enter(context):
-            if context._current_subset_solver is None:
-                # Has our queue been exhausted?
-                if len(context._subset_tree_visit_queue) == 0:
-                    return ConstraintSolver.ExhaustedState
-                else:
-                    # Otherwise, we'll create a new subset solver from the tree.
-                    subset_solver = context._create_subset_solver()
-                    context._current_subset_solver = subset_solver
-            return ConstraintSolver.AssessMovesState
+            return context._start_next_subset_solver()
 
     class AssessMovesState(State):
         @staticmethod
         def on_update(context):
-            try:
-                # Assess moves on current solver.
-                context._current_subset_solver.assess_moves()
-            except ConstraintSolver.AllItemsMappedSuccessfully:
-                return ConstraintSolver.SuccessfulSubsetCompletionState
-            else:
+            # Assess moves on current solver.
+            if context._current_subset_solver._try_assess_moves():
                 return ConstraintSolver.SelectMovesState
+            else:
+                return ConstraintSolver.SuccessfulSubsetCompletionState
 
     class SelectMovesState(State):
         @staticmethod
         def on_update(context):
-            try:
-                context._current_subset_solver.choose_next_moves()
-            except ConstraintSolver.SolverFailed_NoMovesAvailableError:
-                return ConstraintSolver.FailedSubsetCompletionState
-            else:
+            if context._current_subset_solver._try_choose_next_moves():
                 return ConstraintSolver.AssessMovesState
+            else:
+                return ConstraintSolver.FailedSubsetCompletionState
 
     class SuccessfulSubsetCompletionState(State):
         @staticmethod
@@ -272,20 +589,98 @@ class ConstraintSolver:
     class SolverFailed_NoMovesAvailableError(Exception):
         pass
 
+    # Raised by evaluators that yield partway through a step because the
+    # time slice given to step_for() ran out.
+    class TimeSliceExpired(Exception):
+        pass
+
+    # Counts of what the search has done so far.  Read them from get_stats()
+    # at any time, e.g., from a progress callback.
+    class SolverStats:
+        def __init__(self):
+            # Search tree nodes added, taken up to be solved, and found to be
+            # dead ends.
+            self.num_nodes_created = 0
+            self.num_nodes_expanded = 0
+            self.num_nodes_failed = 0
+
+            # Nodes waiting to be visited, now and at most.
+            self.queue_length = 0
+            self.max_queue_length = 0
+
+            # Deepest node created, where the root is depth 0.
+            self.max_depth = 0
+
+            self.num_moves_executed = 0
+            self.num_solutions_found = 0
+            self.num_updates = 0
+
+            # When the first step was taken and when the search was exhausted
+            # (time.perf_counter() seconds), or None if they haven't happened.
+            # This is wall-clock time, so it includes any time spent between
+            # steps.
+            self.begin_time = None
+            self.end_time = None
+
+            # For each depth, how many nodes forked and into how many children.
+            self.depth_to_num_forks = {}
+            self.depth_to_num_fork_children = {}
+
+        def record_fork(self, depth: int, num_children: int):
+            self.depth_to_num_forks[depth] = self.depth_to_num_forks.get(depth, 0) + 1
+            self.depth_to_num_fork_children[depth] = self.depth_to_num_fork_children.get(depth, 0) + num_children
+
+        # Seconds from the first step until the search was exhausted, or
+        # until now if it's still going.
+        def get_elapsed_seconds(self) -> float:
+            if self.begin_time is None:
+                return 0.0
+
+            end_time = self.end_time if self.end_time is not None else time.perf_counter()
+            return end_time - self.begin_time
+
+        def get_nodes_per_second(self) -> float:
+            elapsed_seconds = self.get_elapsed_seconds()
+            if elapsed_seconds == 0:
+                return 0.0
+            return self.num_nodes_expanded / elapsed_seconds
+
+        # Average number of children of the nodes that forked, by depth.
+        def get_branching_factor_by_depth(self) -> dict:
+            branching_factors = {}
+            for depth, num_forks in sorted(self.depth_to_num_forks.items()):
+                branching_factors[depth] = self.depth_to_num_fork_children[depth] / num_forks
+            return branching_factors
+
     class SolverSubsetNode:
-        def __init__(self, parent: 'ConstraintSolver.SolverSubsetTree', moves_list: List[Move]):
+        def __init__(self, parent: 'ConstraintSolver.SolverSubsetNode', moves_list: List[Move]):
             self.parent = parent
             self.moves_list = moves_list
-            self.children = []
 
-        def add_child(self, moves_list: List[Move]):
+            # How far we are from the root (which is depth 0).
+            if parent is None:
+                self.depth = 0
+            else:
+                self.depth = parent.depth + 1
+
+            # Index into the solver's tree; assigned when the node is added.
+            self.index = -1
+
+            # We don't hold references to our children (they hold references
+            # to us).  Instead we count them, so that we know when our subtree
+            # has been exhausted and we can be released.
+            self.num_live_children = 0
+
+        def add_child(self, moves_list: List[Move]) -> 'ConstraintSolver.SolverSubsetNode':
             child = ConstraintSolver.SolverSubsetNode(parent=self, moves_list=moves_list)
-            self.children.append(child)
+            self.num_live_children += 1
+            return child
 
     class SubsetSolver:
         def __init__(self, parent_solver: 'ConstraintSolver', sources: List[object], wip_solution_state: List[object], unmapped_sources_bitset: BitSet, evaluator_class, indent_level: int, debugging):
-            timer = parent_solver.timer_name_to_timer["SubsetInit"]
-            timer.begin()
+            profiler = parent_solver._profiler
+            if profiler is not None:
+                begin_ns = profiler.begin()
 
             # Store our parent solver, so that we can alert them when done.
             self._parent_solver = parent_solver
@@ -316,6 +711,10 @@ class ConstraintSolver:
             # Create a deep copy of our WIP solution state, as we *will* be altering that.
             self._wip_solution_state = copy.deepcopy(wip_solution_state)
 
+            # If assessing was cut short by a time slice, the (destination index,
+            # evaluator position) to pick up from.
+            self._assess_resume_point = None
+
             # Flag all of our destination nodes as dirty.
             self._dirty_destination_indices_bitset = BitSet(len(wip_solution_state))
             self._dirty_destination_indices_bitset.set_all()
@@ -339,25 +738,50 @@ class ConstraintSolver:
                         # Clear out the dirty flag so that *this* empty isn't considered fair game
                         self._dirty_destination_indices_bitset.clear_bit(dest_index)
 
-            timer.end()
+            if profiler is not None:
+                profiler.end(ConstraintSolver.PROFILE_PHASE_SUBSET_INIT, begin_ns)
 
+        # Raises AllItemsMappedSuccessfully if there's nothing left to map.
         def assess_moves(self):
+            if self._try_assess_moves() == False:
+                raise ConstraintSolver.AllItemsMappedSuccessfully()
+
+        # Raises SolverFailed_NoMovesAvailableError if a source has no moves.
+        def choose_next_moves(self):
+            if self._try_choose_next_moves() == False:
+                raise ConstraintSolver.SolverFailed_NoMovesAvailableError()
+
+        # Returns False, without assessing anything, if every source has
+        # been mapped.
+        #
+        # Given a deadline (see ConstraintSolver.step_for()), raises
+        # TimeSliceExpired if it passes before we're done.  Calling again
+        # resumes with the evaluator we were on.
+        def _try_assess_moves(self, deadline: Optional[float] = None) -> bool:
             # If no unmapped sources remain, flag success
-            if len(self._source_index_to_evaluator.values()) == 0:
+            if len(self._source_index_to_evaluator) == 0:
                 # We're done, successfully!
+                return False
 
-                raise ConstraintSolver.AllItemsMappedSuccessfully()
+            profiler = self._parent_solver._profiler
+            if profiler is not None:
+                begin_ns = profiler.begin()
 
-            timer = self._parent_solver.timer_name_to_timer["AssessMoves"]
-            timer.begin()
+            # Without a deadline, every evaluator gets updated, so a resume
+            # point left by an earlier step_for() no longer applies.
+            if deadline is None:
+                self._assess_resume_point = None
 
             # If we have dirty destinations, update each node to alert them.
             next_dirty_destination_index = self._dirty_destination_indices_bitset.get_next_set_bit_index(0)
             while next_dirty_destination_index is not None:
                 destination = self._wip_solution_state[next_dirty_destination_index]
 
-                for evaluator in self._source_index_to_evaluator.values():
-                    evaluator.update_moves_for_destination(next_dirty_destination_index, destination)
+                if deadline is None:
+                    for evaluator in self._source_index_to_evaluator.values():
+                        evaluator.update_moves_for_destination(next_dirty_destination_index, destination)
+                else:
+                    self._update_evaluators_for_destination_with_deadline(next_dirty_destination_index, destination, deadline)
 
                 # We're no longer dirty.
                 self._dirty_destination_indices_bitset.clear_bit(next_dirty_destination_index)
@@ -365,24 +789,58 @@ class ConstraintSolver:
                 # On to the next...
                 next_dirty_destination_index = self._dirty_destination_indices_bitset.get_next_set_bit_index(next_dirty_destination_index + 1)
 
-            timer.end()
+            if profiler is not None:
+                profiler.end(ConstraintSolver.PROFILE_PHASE_ASSESS_MOVES, begin_ns)
 
-        def choose_next_moves(self):
+            return True
+
+        def _update_evaluators_for_destination_with_deadline(self, destination_index: int, destination: object, deadline: float):
+            # Skip the evaluators we got through last time.  No moves are made
+            # while we're assessing, so they're still in the same order.
+            first_evaluator_position = 0
+            if (self._assess_resume_point is not None) and (self._assess_resume_point[0] == destination_index):
+                first_evaluator_position = self._assess_resume_point[1]
+            self._assess_resume_point = None
+
+            for evaluator_position, evaluator in enumerate(self._source_index_to_evaluator.values()):
+                if evaluator_position < first_evaluator_position:
+                    continue
+
+                # Always get through at least one, so that we make progress.
+                if (evaluator_position > first_evaluator_position) and (time.perf_counter() >= deadline):
+                    self._assess_resume_point = (destination_index, evaluator_position)
+                    raise ConstraintSolver.TimeSliceExpired()
+
+                try:
+                    evaluator.update_moves_for_destination(destination_index, destination)
+                except ConstraintSolver.TimeSliceExpired:
+                    # The evaluator yielded partway through.  Start with it next time.
+                    self._assess_resume_point = (destination_index, evaluator_position)
+                    raise
+
+        # Returns False, without choosing, if some source has no moves.
+        def _try_choose_next_moves(self) -> bool:
             # Find the edge(s) with the best scores.
             best_score = math.inf
             best_moves = []
 
+            profiler = self._parent_solver._profiler
+            trace = self._parent_solver._trace
             for evaluator in self._source_index_to_evaluator.values():
-                timer = self._parent_solver.timer_name_to_timer["GetBestMoves"]
-                timer.begin()
+                if (profiler is not None) or (trace is not None):
+                    begin_ns = time.perf_counter_ns()
 
                 score_moves_tuple = evaluator.get_list_of_best_moves()
 
-                timer.end()
+                if profiler is not None:
+                    profiler.end(ConstraintSolver.PROFILE_PHASE_GET_BEST_MOVES, begin_ns)
 
                 score = score_moves_tuple[0]
                 moves = score_moves_tuple[1]
 
+                if trace is not None:
+                    trace.record_best(self._parent_solver._current_subset_solver_tree_node_index, evaluator.source_index, score, len(moves), time.perf_counter_ns() - begin_ns)
+
                 if len(moves) == 0:
                     # No moves?  We've failed.
 
@@ -391,7 +849,7 @@ class ConstraintSolver:
                         indent_str = self.indent_level * '\t'
                         print(f"{indent_str}{self.__hash__()}: FAILED.  No moves available.")
 
-                    raise ConstraintSolver.SolverFailed_NoMovesAvailableError()
+                    return False
 
                 if score < best_score:
                     # Replace our previous best
@@ -404,7 +862,16 @@ class ConstraintSolver:
 
             if best_score == -math.inf:
                 # SPECIAL CASE:  These moves are free.  Take them all now.
-                self._parent_solver._append_moves(self, [best_moves])
+                # A source may have free moves into more than one destination,
+                # but it can only be mapped once, so take its first.
+                free_moves = []
+                mapped_source_indices = set()
+                for move in best_moves:
+                    if move.source_index not in mapped_source_indices:
+                        mapped_source_indices.add(move.source_index)
+                        free_moves.append(move)
+
+                self._parent_solver._append_moves(self, [free_moves])
             else:
                 # Otherwise, fork the state for other possibilities.
                 child_move_lists = []
@@ -417,9 +884,38 @@ class ConstraintSolver:
             # Increment our indent level
             self.indent_level = self.indent_level + 1
 
+            return True
+
+        # Executes each move from a previous solution that the corresponding
+        # evaluator still considers valid.  Returns the moves executed.
+        def replay_moves(self, previous_moves: List[Move]) -> List[Move]:
+            replayed_moves = []
+
+            for previous_move in previous_moves:
+                # Skip sources that no longer exist (or have already been mapped),
+                # as well as destinations that no longer exist.
+                evaluator = self._source_index_to_evaluator.get(previous_move.source_index)
+                if evaluator is None:
+                    continue
+                if (previous_move.dest_index < 0) or (previous_move.dest_index >= len(self._wip_solution_state)):
+                    continue
+
+                # Bring the evaluator up to date on this destination only.  We leave
+                # the dirty flags alone so that every evaluator is updated later.
+                destination = self._wip_solution_state[previous_move.dest_index]
+                evaluator.update_moves_for_destination(previous_move.dest_index, destination)
+
+                matching_move = evaluator.get_matching_move(previous_move)
+                if matching_move is not None:
+                    self._execute_move(matching_move)
+                    replayed_moves.append(matching_move)
+
+            return replayed_moves
+
         def _execute_move(self, move: Move):
-            timer = self._parent_solver.timer_name_to_timer["ExecuteMove"]
-            timer.begin()
+            profiler = self._parent_solver._profiler
+            if profiler is not None:
+                begin_ns = profiler.begin()
 
             # Emit debugging.
             if self.debugging is not None:
@@ -438,6 +934,7 @@ class ConstraintSolver:
 
             # Call the static function to apply.
             self._evaluator_class.apply_changes(source, destination, change_list)
+            self._parent_solver._stats.num_moves_executed += 1
 
             # Remove the source evaluator, as we are now mapped.
             del self._source_index_to_evaluator[move.source_index]
@@ -464,4 +961,5 @@ class ConstraintSolver:
                         # Mark it as dirty so that we can evaluate it as a possible move destination.
                         self._dirty_destination_indices_bitset.set_bit(next_empty)
 
-            timer.end()
\ No newline at end of file
+            if profiler is not None:
+                profiler.end(ConstraintSolver.PROFILE_PHASE_EXECUTE_MOVE, begin_ns)
\ No newline at end of file
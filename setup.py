@@ -1,3 +1,3 @@
 from setuptools import setup, find_packages
 
-setup(name='rgtk', version='1.0', packages=find_packages())
\ No newline at end of file
+setup(name='rgtk', version='1.0', packages=find_packages(), entry_points={'console_scripts': ['rgtk=rgtk.__main__:main']})
\ No newline at end of file